@@ -0,0 +1,101 @@
+"""Throughput of compressed vs uncompressed input.
+
+Generates synthetic CSVs (see `datagen.py`), writes gzip, bz2, xz and (when
+the `zstandard` package is installed) zstd copies, and times both readers
+over each. `inline` decompresses in the parsing thread, as `gzip.open` +
+`csv.DictReader` would, to show what the background decompression thread
+buys.
+
+    PYTHONPATH=src python benchmarks/bench_compressed.py --rows 1000000
+"""
+from __future__ import annotations
+
+import argparse
+import bz2
+import csv
+import gzip
+import io
+import lzma
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict, Iterable
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from datagen import generate  # noqa: E402
+
+from etl import compressed  # noqa: E402
+from etl.extract import (
+    iter_rows,
+    list_csv_files,
+    read_csv_folder,
+    read_projected_folder,
+)  # noqa: E402
+
+COMPRESSORS: Dict[str, Callable[[bytes], bytes]] = {
+    "gz": lambda b: gzip.compress(b, compresslevel=6),
+    "bz2": bz2.compress,
+    "xz": lzma.compress,
+}
+if compressed.zstandard is not None:
+    COMPRESSORS["zst"] = compressed.zstandard.ZstdCompressor().compress
+
+
+def read_inline(folder: Path) -> Iterable:
+    """Decompress in the parsing thread (the pre-thread baseline)."""
+    for f in list_csv_files(folder):
+        opener = compressed.OPENERS.get(f.suffix)
+        raw = opener(f) if opener and compressed.is_compressed(f) else open(f, "rb")
+        with io.TextIOWrapper(raw, encoding="utf8") as fh:
+            yield from iter_rows(csv.DictReader(fh), f.name, on_bad=lambda i: None)
+
+
+def timed(fn: Callable[[Path], Iterable], folder: Path) -> tuple[float, int]:
+    t0 = time.perf_counter()
+    n = sum(1 for _ in fn(folder))
+    return time.perf_counter() - t0, n
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--files", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    readers = {
+        "csv": read_csv_folder,
+        "mmap": read_projected_folder,
+        "inline": read_inline,
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        plain = Path(tmp) / "csv"
+        generate(plain, args.rows, args.files, bad_ratio=0.0, seed=args.seed)
+        raw_bytes = sum(f.stat().st_size for f in list_csv_files(plain))
+        folders = {"csv": plain}
+        for ext, compress in COMPRESSORS.items():
+            folder = folders[ext] = Path(tmp) / ext
+            folder.mkdir()
+            for f in list_csv_files(plain):
+                (folder / f"{f.name}.{ext}").write_bytes(compress(f.read_bytes()))
+
+        print(f"{args.rows:,} rows, {raw_bytes / 1e6:.1f} MB uncompressed")
+        print(
+            f"{'input':>6} {'size MB':>8} "
+            + " ".join(f"{name + ' rows/s':>14}" for name in readers)
+        )
+        for ext, folder in folders.items():
+            size = sum(f.stat().st_size for f in list_csv_files(folder))
+            rates = []
+            for fn in readers.values():
+                seconds, n = timed(fn, folder)
+                rates.append(f"{n / seconds:>14,.0f}")
+            print(f"{ext:>6} {size / 1e6:>8.1f} " + " ".join(rates))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""Benchmark exact amount accumulation against float and Decimal.
+
+Folds synthetic (date, amount) pairs, in `FOLD_CHUNK_ROWS` chunks like
+`fold_pairs`, into `Aggregator` (float), a `decimal.Decimal` aggregator
+(the obvious exact fix, kept here as the baseline) and
+`FixedPointAggregator` (scaled integers), prints rows/sec for each and how
+far the float totals drift from the exact ones. The Decimal baseline runs
+both per pair and batched like `FixedPointAggregator.add_many`.
+
+    PYTHONPATH=src python benchmarks/bench_exact.py --rows 1000000
+"""
+from __future__ import annotations
+
+import argparse
+import random
+import time
+from decimal import Decimal, InvalidOperation
+from typing import Any, Dict, List, Tuple
+
+from etl.transform import FOLD_CHUNK_ROWS, Aggregator, FixedPointAggregator
+
+
+class DecimalAggregator:
+    """Per-group `Decimal` sums, the straightforward exact implementation."""
+
+    def __init__(self) -> None:
+        self.totals: Dict[Any, Decimal] = {}
+        self.rows = 0
+
+    def add_value(self, key: Any, value: str) -> bool:
+        try:
+            val = Decimal(value)
+        except InvalidOperation:
+            return False
+        totals = self.totals
+        totals[key] = totals.get(key, Decimal(0)) + val
+        self.rows += 1
+        return True
+
+    def add_many(self, pairs: List[Tuple[Any, str]]) -> int:
+        totals = self.totals
+        get = totals.get
+        zero = Decimal(0)
+        for (key, _), val in zip(pairs, map(Decimal, [v for _, v in pairs])):
+            totals[key] = get(key, zero) + val
+        self.rows += len(pairs)
+        return 0
+
+
+def make_pairs(rows: int, days: int, seed: int = 0) -> List[Tuple[str, str]]:
+    """Amounts with cents, as `datagen.py` writes them, over `days` dates."""
+    rnd = random.Random(seed)
+    dates = [f"2024-{1 + d // 28 % 12:02d}-{1 + d % 28:02d}" for d in range(days)]
+    return [
+        (rnd.choice(dates), f"{rnd.randrange(1, 1_000_000_000) / 100:.2f}")
+        for _ in range(rows)
+    ]
+
+
+def bench(agg, pairs: List[Tuple[str, str]], batched: bool) -> float:
+    chunks = [
+        pairs[i : i + FOLD_CHUNK_ROWS] for i in range(0, len(pairs), FOLD_CHUNK_ROWS)
+    ]
+    started = time.perf_counter()
+    if batched:
+        for chunk in chunks:
+            agg.add_many(chunk)
+    else:
+        # the per-pair loop fold_pairs runs for float aggregators
+        add_value = agg.add_value
+        for chunk in chunks:
+            for key, value in chunk:
+                add_value(key, value)
+    return len(pairs) / (time.perf_counter() - started)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument(
+        "--days", type=int, default=336, help="distinct dates, i.e. groups"
+    )
+    args = parser.parse_args()
+
+    pairs = make_pairs(args.rows, args.days)
+    floats, decimals, fixed = Aggregator(), DecimalAggregator(), FixedPointAggregator()
+    rates = {
+        "float": bench(floats, pairs, batched=False),
+        "Decimal": bench(decimals, pairs, batched=False),
+        "Decimal batch": bench(DecimalAggregator(), pairs, batched=True),
+        "fixed": bench(fixed, pairs, batched=True),
+    }
+    exact = fixed.decimal_totals()
+    assert exact == decimals.totals, "fixed-point totals differ from Decimal"
+    drift = max(abs(Decimal(floats.totals[k]) - v) for k, v in exact.items())
+
+    print(f"{args.rows:,} rows, {len(exact)} groups")
+    for name, rate in rates.items():
+        print(
+            f"{name:>13}: {rate:>12,.0f} rows/s ({rate / rates['Decimal']:.1f}x"
+            " Decimal)"
+        )
+    print(f"max float drift per group: {drift:.2E}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""Benchmark date normalization on mixed-format input.
+
+Compares the original try-every-format loop against `DateNormalizer`
+(format lock + LRU cache) and prints rows/sec for each.
+
+    PYTHONPATH=src python benchmarks/bench_normalize_date.py --rows 500000
+"""
+from __future__ import annotations
+
+import argparse
+import random
+import time
+from datetime import date, datetime, timedelta
+from typing import Callable, Dict, List
+
+from etl.transform import DATE_FORMATS, DateNormalizer
+
+
+def reference_normalize_date(
+    row: Dict[str, str], date_field: str = "date"
+) -> Dict[str, str]:
+    """The pre-DateNormalizer implementation, kept as the baseline."""
+    raw = row.get(date_field)
+    if not raw:
+        raise ValueError("missing date")
+    for fmt in DATE_FORMATS:
+        try:
+            row[date_field] = datetime.strptime(raw, fmt).date().isoformat()
+            return row
+        except Exception:
+            continue
+    try:
+        row[date_field] = datetime.fromisoformat(raw).date().isoformat()
+        return row
+    except Exception as exc:
+        raise ValueError(f"unparseable date: {raw}") from exc
+
+
+def make_dates(rows: int, days: int, interleaved: bool, seed: int = 0) -> List[str]:
+    """Dates over `days` days, rendered in the four formats normalize_date accepts.
+
+    Interleaved input switches format every row; otherwise it comes in runs
+    of 10k rows per format, like a folder of single-format files.
+    """
+    rnd = random.Random(seed)
+    start = date(2024, 1, 1)
+    out = []
+    for i in range(rows):
+        d = start + timedelta(days=rnd.randrange(days))
+        k = i % 4 if interleaved else (i // 10_000) % 4
+        out.append(d.strftime(DATE_FORMATS[k]))
+    return out
+
+
+def bench(
+    normalize: Callable[[Dict[str, str]], Dict[str, str]], dates: List[str]
+) -> float:
+    started = time.perf_counter()
+    for raw in dates:
+        try:
+            normalize({"date": raw})
+        except ValueError:
+            pass
+    return len(dates) / (time.perf_counter() - started)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument(
+        "--days", type=int, default=730, help="distinct calendar days in the input"
+    )
+    args = parser.parse_args()
+
+    for interleaved in (False, True):
+        dates = make_dates(args.rows, args.days, interleaved)
+        label = "interleaved" if interleaved else "per-file runs"
+        ref = bench(reference_normalize_date, dates)
+        locked = bench(DateNormalizer(cache_size=0).normalize, dates)
+        cached = bench(DateNormalizer().normalize, dates)
+        print(
+            f"{label:>14}: reference {ref:>12,.0f} rows/s | lock only {locked:>12,.0f}"
+            " rows/s "
+            f"| lock+cache {cached:>12,.0f} rows/s ({cached / ref:.1f}x)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+"""Startup cost of short runs: module imports, measured with `python -X importtime`.
+
+Runs each scenario in a fresh interpreter `--repeat` times and keeps the
+fastest: `import etl.main`, `import etl.extract` (what a worker process
+needs) and a `--dry-run` over a one-file folder. For each it reports the
+wall time of the process and the import time of `etl` and everything it
+pulled in, and lists the modules costing the most.
+
+    PYTHONPATH=src python benchmarks/bench_startup.py --output startup.json
+    PYTHONPATH=src python benchmarks/bench_startup.py --compare startup.json
+
+Exits non-zero when a scenario imports one of HEAVY (they belong to code
+paths that connect to the database or start worker processes), when the
+import time exceeds `--max-import-ms`, or, with `--compare`, when it grew
+by more than `--max-regression` against the baseline file.
+"""
+from __future__ import annotations
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+HEAVY = (
+    "sqlalchemy",
+    "yaml",
+    "psycopg2",
+    "numpy",
+    "multiprocessing",
+    "concurrent.futures.process",
+)
+TOP_MODULES = 8
+
+
+def parse_importtime(stderr: str) -> List[Tuple[str, int, int, int]]:
+    """(module, depth, self us, cumulative us) per `-X importtime` line, in order."""
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        own, cumulative, name = line[len("import time:") :].split("|", 2)
+        if not own.strip().isdigit():
+            continue  # the header line
+        # one space after the bar, then two per level of nesting
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        modules.append((name.strip(), depth, int(own), int(cumulative)))
+    return modules
+
+
+def etl_import_us(modules: List[Tuple[str, int, int, int]]) -> int:
+    """Import time of `etl` and what it imported, directly or later on (lazily)."""
+    total = 0
+    seen_etl = False
+    for name, depth, _, cumulative in modules:
+        seen_etl = seen_etl or name.split(".")[0] == "etl"
+        if seen_etl and depth == 0:
+            total += cumulative
+    return total
+
+
+def heavy_modules(modules: List[Tuple[str, int, int, int]]) -> List[str]:
+    """The HEAVY packages among the modules imported."""
+    return sorted(
+        {h for m, *_ in modules for h in HEAVY if m == h or m.startswith(h + ".")}
+    )
+
+
+def measure(argv: List[str], repeat: int) -> Dict[str, Any]:
+    env = dict(os.environ)
+    src = str(Path(__file__).resolve().parents[1] / "src")
+    env["PYTHONPATH"] = os.pathsep.join(p for p in (src, env.get("PYTHONPATH")) if p)
+    best: Dict[str, Any] = {}
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = subprocess.run(
+            [sys.executable, "-X", "importtime", *argv],
+            env=env,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        wall = time.perf_counter() - t0
+        modules = parse_importtime(out.stderr)
+        import_us = etl_import_us(modules)
+        if not best or import_us < best["import_ms"] * 1000:
+            by_self = sorted(modules, key=lambda m: -m[2])[:TOP_MODULES]
+            best = {
+                "import_ms": round(import_us / 1000, 3),
+                "modules": len(modules),
+                "heavy": heavy_modules(modules),
+                "top": {m: round(own / 1000, 3) for m, _, own, _ in by_self},
+            }
+        best["wall_ms"] = round(min(best.get("wall_ms", wall * 1000), wall * 1000), 3)
+    return best
+
+
+def compare(
+    current: Dict[str, Any], baseline: Dict[str, Any], max_regression: float
+) -> bool:
+    """Print per-scenario import time ratios; return False if any scenario regressed."""
+    ok = True
+    for name, result in current["scenarios"].items():
+        base = baseline.get("scenarios", {}).get(name)
+        if not base or not base.get("import_ms"):
+            print(f"{name:>16}: no baseline")
+            continue
+        ratio = result["import_ms"] / base["import_ms"]
+        flag = ""
+        if ratio > 1 + max_regression:
+            flag = "  REGRESSION"
+            ok = False
+        print(
+            f"{name:>16}: {result['import_ms']:>9.1f} ms vs {base['import_ms']:>9.1f}"
+            f" ms ({ratio:.2f}x){flag}"
+        )
+    return ok
+
+
+def _git_commit() -> str | None:
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return out.stdout.strip()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--repeat", type=int, default=7)
+    parser.add_argument(
+        "--max-import-ms",
+        type=float,
+        default=None,
+        help="fail when a scenario imports for longer",
+    )
+    parser.add_argument("--output", default=None, help="write results JSON here")
+    parser.add_argument(
+        "--compare", default=None, help="baseline results JSON to compare against"
+    )
+    parser.add_argument("--max-regression", type=float, default=0.25)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        (Path(tmp) / "a.csv").write_text(
+            "date,amount\n2025-01-01,1.5\n", encoding="utf8"
+        )
+        scenarios = {
+            "import_main": ["-c", "import etl.main"],
+            "import_extract": ["-c", "import etl.extract"],
+            "dry_run": ["-m", "etl", "--input", tmp, "--dry-run"],
+        }
+        results = {name: measure(argv, args.repeat) for name, argv in scenarios.items()}
+
+    ok = True
+    for name, r in results.items():
+        print(
+            f"{name:>16}: {r['wall_ms']:>9.1f} ms wall, {r['import_ms']:>9.1f} ms"
+            " importing etl"
+            f" ({r['modules']} modules)"
+        )
+        print(
+            " " * 18
+            + "most expensive: "
+            + ", ".join(f"{m} {ms:.1f}" for m, ms in r["top"].items())
+        )
+        if r["heavy"]:
+            print(" " * 18 + "HEAVY IMPORTS: " + ", ".join(r["heavy"]))
+            ok = False
+        if args.max_import_ms is not None and r["import_ms"] > args.max_import_ms:
+            print(" " * 18 + f"OVER BUDGET: {args.max_import_ms:.1f} ms")
+            ok = False
+    output = {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "params": {"repeat": args.repeat},
+        },
+        "scenarios": results,
+    }
+    if args.compare:
+        # read before --output, which may name the same file
+        baseline = json.loads(Path(args.compare).read_text(encoding="utf8"))
+        ok = compare(output, baseline, args.max_regression) and ok
+    if args.output:
+        Path(args.output).write_text(
+            json.dumps(output, indent=2) + "\n", encoding="utf8"
+        )
+    if not ok:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""Synthetic CSV generator for benchmarks.
+
+Writes `date,amount,description` files with dates in the four formats
+`normalize_date` accepts and a configurable share of bad rows (missing
+date, missing amount, unparseable date, non-numeric amount).
+
+    python benchmarks/datagen.py /tmp/bench-data --rows 10000000 --files 100
+"""
+from __future__ import annotations
+
+import argparse
+import random
+from datetime import date, timedelta
+from pathlib import Path
+from typing import List
+
+DATE_FORMATS = ("%Y-%m-%d", "%d/%m/%Y", "%m/%d/%Y", "%Y/%m/%d")
+BAD_ROWS = (
+    ",{amount},missing date",
+    "{date},,missing amount",
+    "not-a-date,{amount},unparseable date",
+    "{date},n/a,non-numeric amount",
+)
+START = date(2020, 1, 1)
+WRITE_BATCH = 100_000
+
+
+def generate(
+    out_dir: str | Path,
+    rows: int,
+    files: int = 1,
+    bad_ratio: float = 0.01,
+    days: int = 365,
+    seed: int = 0,
+) -> List[Path]:
+    """Write `rows` rows spread evenly over `files` CSV files.
+
+    `days` bounds the number of distinct dates, i.e. aggregate groups.
+    Returns the written paths.
+    """
+    rnd = random.Random(seed)
+    out = Path(out_dir)
+    out.mkdir(parents=True, exist_ok=True)
+    # precompute every rendering of every date so generation stays cheap
+    rendered = [
+        [(START + timedelta(days=d)).strftime(fmt) for fmt in DATE_FORMATS]
+        for d in range(days)
+    ]
+    paths: List[Path] = []
+    per_file, extra = divmod(rows, files)
+    for n in range(files):
+        count = per_file + (1 if n < extra else 0)
+        path = out / f"part-{n:05d}.csv"
+        fmt = rnd.randrange(len(DATE_FORMATS))
+        with path.open("w", encoding="utf8") as fh:
+            fh.write("date,amount,description\n")
+            lines: List[str] = []
+            for i in range(count):
+                # files mostly stick to one format, with some strays
+                if rnd.random() < 0.05:
+                    fmt = rnd.randrange(len(DATE_FORMATS))
+                d = rendered[rnd.randrange(days)][fmt]
+                amount = f"{rnd.randrange(1, 1_000_000) / 100:.2f}"
+                if rnd.random() < bad_ratio:
+                    lines.append(rnd.choice(BAD_ROWS).format(date=d, amount=amount))
+                else:
+                    lines.append(f"{d},{amount},row {i}")
+                if len(lines) >= WRITE_BATCH:
+                    fh.write("\n".join(lines) + "\n")
+                    lines = []
+            if lines:
+                fh.write("\n".join(lines) + "\n")
+        paths.append(path)
+    return paths
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("out_dir")
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--files", type=int, default=1)
+    parser.add_argument("--bad-ratio", type=float, default=0.01)
+    parser.add_argument(
+        "--days", type=int, default=365, help="distinct dates (aggregate groups)"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    paths = generate(
+        args.out_dir, args.rows, args.files, args.bad_ratio, args.days, args.seed
+    )
+    print(f"wrote {len(paths)} files to {args.out_dir}")
+
+
+if __name__ == "__main__":
+    main()
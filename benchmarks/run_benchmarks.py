@@ -0,0 +1,251 @@
+"""Throughput benchmarks for every pipeline stage.
+
+Generates synthetic input (see `datagen.py`), then times `read_csv_folder`,
+`normalize_date`, `aggregate` and `insert_aggregates` separately, plus the
+end-to-end `etl.main.run` (also with `--pushdown`, aggregating in the
+database instead of Python). Results are written as JSON so runs can be
+compared across commits:
+
+    PYTHONPATH=src python benchmarks/run_benchmarks.py --rows 2000000 \\
+        --output bench.json
+    PYTHONPATH=src python benchmarks/run_benchmarks.py --rows 2000000 \\
+        --compare bench.json
+
+`--compare` exits non-zero when any stage's rows/sec drops by more than
+`--max-regression` against the baseline file. The load stage uses a SQLite
+file unless `--database-url` points at a local Postgres.
+"""
+from __future__ import annotations
+
+import argparse
+import datetime
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from itertools import islice
+from pathlib import Path
+from typing import Any, Callable, Dict
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from datagen import generate  # noqa: E402
+
+import etl.parallel  # noqa: E402,F401 - imported up front so its logger gets silenced too
+import etl.pushdown  # noqa: E402,F401
+from etl import columnar  # noqa: E402
+from etl.db import get_engine  # noqa: E402
+from etl.extract import read_csv_folder  # noqa: E402
+from etl.load import ensure_table, insert_aggregates  # noqa: E402
+from etl.main import run  # noqa: E402
+from etl.transform import Aggregator, DateNormalizer  # noqa: E402
+
+CHUNK_ROWS = 100_000
+
+
+def _silence_etl_logs() -> None:
+    """Send etl log output to /dev/null; formatting cost is still paid."""
+    devnull = open(os.devnull, "w")
+    for name, logger in logging.root.manager.loggerDict.items():
+        if name.startswith("etl") and isinstance(logger, logging.Logger):
+            for handler in logger.handlers:
+                if isinstance(handler, logging.StreamHandler):
+                    handler.setStream(devnull)
+
+
+def _stage(seconds: float, rows_in: int, rows_out: int) -> Dict[str, Any]:
+    return {
+        "seconds": round(seconds, 6),
+        "rows_in": rows_in,
+        "rows_out": rows_out,
+        "rows_per_sec": round(rows_in / seconds, 1) if seconds > 0 else None,
+    }
+
+
+def bench_stages(data: Path, database_url: str) -> Dict[str, Dict[str, Any]]:
+    """Time each stage on its own, passing chunks of rows between them."""
+    t_extract = t_normalize = t_aggregate = 0.0
+    n_extract = n_normalized = 0
+    normalize = DateNormalizer().normalize
+    agg = Aggregator(group_by="date", value_field="amount")
+    rows = iter(read_csv_folder(data))
+    while True:
+        t0 = time.perf_counter()
+        chunk = list(islice(rows, CHUNK_ROWS))
+        t1 = time.perf_counter()
+        t_extract += t1 - t0
+        if not chunk:
+            break
+        n_extract += len(chunk)
+        ok = []
+        for r in chunk:
+            try:
+                ok.append(normalize(r))
+            except ValueError:
+                pass
+        t2 = time.perf_counter()
+        t_normalize += t2 - t1
+        n_normalized += len(ok)
+        agg.update(ok)
+        t_aggregate += time.perf_counter() - t2
+
+    aggregates = [
+        {"date": datetime.date.fromisoformat(k), "total_amount": v}
+        for k, v in agg.totals.items()
+    ]
+    engine = get_engine(database_url)
+    ensure_table(engine)
+    t0 = time.perf_counter()
+    inserted = insert_aggregates(engine, aggregates)
+    t_load = time.perf_counter() - t0
+    engine.dispose()
+
+    return {
+        "extract": _stage(t_extract, n_extract, n_extract),
+        "normalize_date": _stage(t_normalize, n_extract, n_normalized),
+        "aggregate": _stage(t_aggregate, n_normalized, len(agg)),
+        "insert_aggregates": _stage(t_load, len(aggregates), inserted),
+    }
+
+
+def bench_end_to_end(data: Path, rows: int, **kwargs: Any) -> Dict[str, Any]:
+    t0 = time.perf_counter()
+    inserted = run(str(data), **kwargs)
+    return _stage(time.perf_counter() - t0, rows, inserted)
+
+
+def _git_commit() -> str | None:
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return out.stdout.strip()
+
+
+def compare(
+    current: Dict[str, Any], baseline: Dict[str, Any], max_regression: float
+) -> bool:
+    """Print per-stage rows/sec ratios; return False if any stage regressed."""
+    ok = True
+    for stage, result in current["stages"].items():
+        base = baseline.get("stages", {}).get(stage)
+        if not base or not base.get("rows_per_sec") or not result.get("rows_per_sec"):
+            print(f"{stage:>22}: no baseline")
+            continue
+        ratio = result["rows_per_sec"] / base["rows_per_sec"]
+        flag = ""
+        if ratio < 1 - max_regression:
+            flag = "  REGRESSION"
+            ok = False
+        print(
+            f"{stage:>22}: {result['rows_per_sec']:>14,.0f} rows/s vs"
+            f" {base['rows_per_sec']:>14,.0f} ({ratio:.2f}x){flag}"
+        )
+    return ok
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--files", type=int, default=1)
+    parser.add_argument("--bad-ratio", type=float, default=0.01)
+    parser.add_argument(
+        "--days", type=int, default=365, help="distinct dates (aggregate groups)"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--data",
+        default=None,
+        help="reuse an existing input folder instead of generating one",
+    )
+    parser.add_argument(
+        "--database-url", default=None, help="defaults to a SQLite file in a temp dir"
+    )
+    parser.add_argument(
+        "--workers", type=int, default=1, help="also time end-to-end with N workers"
+    )
+    parser.add_argument("--output", default=None, help="write results JSON here")
+    parser.add_argument(
+        "--compare", default=None, help="baseline results JSON to compare against"
+    )
+    parser.add_argument("--max-regression", type=float, default=0.15)
+    args = parser.parse_args()
+
+    _silence_etl_logs()
+    with tempfile.TemporaryDirectory() as tmp:
+        data = Path(args.data) if args.data else Path(tmp) / "data"
+        if not args.data:
+            t0 = time.perf_counter()
+            generate(data, args.rows, args.files, args.bad_ratio, args.days, args.seed)
+            print(
+                f"generated {args.rows:,} rows in {args.files} files"
+                f" ({time.perf_counter() - t0:.1f}s)"
+            )
+        database_url = args.database_url or f"sqlite:///{Path(tmp) / 'bench.db'}"
+
+        stages = bench_stages(data, database_url)
+        variants: Dict[str, Callable[[], Dict[str, Any]]] = {
+            "end_to_end": lambda: bench_end_to_end(
+                data, args.rows, database_url=database_url
+            ),
+        }
+        variants["end_to_end_mmap"] = lambda: bench_end_to_end(
+            data, args.rows, database_url=database_url, reader="mmap"
+        )
+        variants["end_to_end_pipeline"] = lambda: bench_end_to_end(
+            data, args.rows, database_url=database_url, pipeline=True
+        )
+        variants["end_to_end_pushdown"] = lambda: bench_end_to_end(
+            data, args.rows, database_url=database_url, pushdown=True
+        )
+        if columnar.available():
+            variants["end_to_end_columnar"] = lambda: bench_end_to_end(
+                data, args.rows, database_url=database_url, engine="columnar"
+            )
+        if args.workers > 1:
+            variants[f"end_to_end_workers_{args.workers}"] = lambda: bench_end_to_end(
+                data, args.rows, database_url=database_url, workers=args.workers
+            )
+        for name, fn in variants.items():
+            stages[name] = fn()
+
+    results = {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "params": {
+                "rows": args.rows,
+                "files": args.files,
+                "bad_ratio": args.bad_ratio,
+                "days": args.days,
+                "seed": args.seed,
+                "database": database_url.split(":", 1)[0],
+            },
+        },
+        "stages": stages,
+    }
+    for stage, r in stages.items():
+        rate = f"{r['rows_per_sec']:>14,.0f} rows/s" if r["rows_per_sec"] else "n/a"
+        print(f"{stage:>22}: {r['seconds']:>9.3f}s  {rate}")
+    if args.output:
+        Path(args.output).write_text(
+            json.dumps(results, indent=2) + "\n", encoding="utf8"
+        )
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text(encoding="utf8"))
+        if not compare(results, baseline, args.max_regression):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,9 @@
+-- Migration: one row per date in etl.results so loads can upsert
+-- Collapse duplicate copies left behind by earlier non-idempotent re-runs,
+-- keeping the most recently inserted row for each date.
+DELETE FROM etl.results r
+USING etl.results newer
+WHERE r.date = newer.date
+  AND r.id < newer.id;
+
+CREATE UNIQUE INDEX IF NOT EXISTS results_date_key ON etl.results (date);
@@ -0,0 +1,11 @@
+-- Migration: processed-file manifest for incremental runs
+-- One row per loaded input file; `totals` holds the JSON {date: total}
+-- the file contributed, so a changed file's old contribution can be undone.
+CREATE TABLE IF NOT EXISTS etl.etl_manifest (
+  path TEXT PRIMARY KEY,
+  size BIGINT NOT NULL,
+  mtime_ns BIGINT NOT NULL,
+  content_hash TEXT NOT NULL,
+  totals TEXT NOT NULL,
+  processed_at TIMESTAMPTZ DEFAULT now()
+);
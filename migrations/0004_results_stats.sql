@@ -0,0 +1,7 @@
+-- Migration: optional per-date statistics next to total_amount
+-- Filled by `--stats` runs; NULL when a load only provided totals.
+ALTER TABLE etl.results
+  ADD COLUMN IF NOT EXISTS row_count BIGINT,
+  ADD COLUMN IF NOT EXISTS min_amount NUMERIC,
+  ADD COLUMN IF NOT EXISTS max_amount NUMERIC,
+  ADD COLUMN IF NOT EXISTS mean_amount NUMERIC;
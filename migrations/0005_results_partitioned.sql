@@ -0,0 +1,63 @@
+-- Migration: range-partition etl.results by date, one partition per year
+-- Queries on a date range only read the partitions of those years. The ETL
+-- creates the partition of a new year before loading into it; rows outside
+-- every yearly partition land in results_default. A partitioned table's
+-- unique keys must include the partition key, so id is no longer the
+-- primary key: the unique index on date identifies a row. The B-tree on
+-- created_at serves "latest rows" queries (ORDER BY created_at DESC LIMIT n)
+-- as an index scan per partition instead of a sort of the whole table.
+-- Does nothing once etl.results is partitioned, so `make migrate` can rerun.
+DO $$
+DECLARE
+  y INT;
+  seq TEXT;
+BEGIN
+  IF (SELECT relkind FROM pg_class WHERE oid = to_regclass('etl.results')) = 'p' THEN
+    RETURN;
+  END IF;
+
+  ALTER TABLE etl.results RENAME TO results_unpartitioned;
+  ALTER INDEX etl.results_date_key RENAME TO results_unpartitioned_date_key;
+  -- load.TABLE_SQL creates this one too when the app ran before this migration
+  ALTER INDEX IF EXISTS etl.results_created_at_idx RENAME TO results_unpartitioned_created_at_idx;
+
+  CREATE TABLE etl.results (
+    id BIGINT NOT NULL,
+    date DATE NOT NULL,
+    total_amount NUMERIC,
+    created_at TIMESTAMP DEFAULT now(),
+    row_count BIGINT,
+    min_amount NUMERIC,
+    max_amount NUMERIC,
+    mean_amount NUMERIC
+  ) PARTITION BY RANGE (date);
+
+  -- keep numbering ids where the old table left off
+  seq := pg_get_serial_sequence('etl.results_unpartitioned', 'id');
+  EXECUTE format('ALTER SEQUENCE %s OWNED BY etl.results.id', seq);
+  EXECUTE format('ALTER TABLE etl.results ALTER COLUMN id SET DEFAULT nextval(%L)', seq);
+
+  -- a partition for every year with data, up to next year
+  FOR y IN
+    SELECT generate_series(lo, hi) FROM (
+      SELECT COALESCE(EXTRACT(YEAR FROM MIN(date))::int, EXTRACT(YEAR FROM now())::int) AS lo,
+             GREATEST(EXTRACT(YEAR FROM MAX(date))::int, EXTRACT(YEAR FROM now())::int + 1) AS hi
+      FROM etl.results_unpartitioned
+    ) bounds
+  LOOP
+    EXECUTE format(
+      'CREATE TABLE etl.%I PARTITION OF etl.results FOR VALUES FROM (%L) TO (%L)',
+      'results_y' || lpad(y::text, 4, '0'), make_date(y, 1, 1), make_date(y + 1, 1, 1)
+    );
+  END LOOP;
+  CREATE TABLE etl.results_default PARTITION OF etl.results DEFAULT;
+
+  CREATE UNIQUE INDEX results_date_key ON etl.results (date);
+  CREATE INDEX results_created_at_idx ON etl.results (created_at);
+
+  INSERT INTO etl.results (id, date, total_amount, created_at, row_count, min_amount, max_amount, mean_amount)
+  SELECT id, date, total_amount, created_at, row_count, min_amount, max_amount, mean_amount
+  FROM etl.results_unpartitioned;
+
+  DROP TABLE etl.results_unpartitioned;
+END $$;
@@ -0,0 +1,53 @@
+-- Migration: monthly and yearly rollups of etl.results
+-- Loads refresh the months and years they write in the same transaction
+-- (etl.rollup), so dashboards read a few rows instead of scanning results.
+-- row_count/min_amount/max_amount are NULL unless every date of the period
+-- has them. This backfills both tables from the rows already loaded. Loads
+-- run before this migration may have refreshed a year from only the months
+-- they wrote (the app creates these tables too), so existing rows are
+-- recomputed rather than kept.
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS etl.results_monthly (
+  month DATE PRIMARY KEY,
+  total_amount NUMERIC,
+  days INTEGER NOT NULL,
+  row_count BIGINT,
+  min_amount NUMERIC,
+  max_amount NUMERIC,
+  updated_at TIMESTAMPTZ DEFAULT now()
+);
+
+CREATE TABLE IF NOT EXISTS etl.results_yearly (
+  year INTEGER PRIMARY KEY,
+  total_amount NUMERIC,
+  days INTEGER NOT NULL,
+  row_count BIGINT,
+  min_amount NUMERIC,
+  max_amount NUMERIC,
+  updated_at TIMESTAMPTZ DEFAULT now()
+);
+
+INSERT INTO etl.results_monthly (month, total_amount, days, row_count, min_amount, max_amount)
+SELECT date_trunc('month', date)::date, SUM(total_amount), COUNT(*),
+       CASE WHEN COUNT(row_count) = COUNT(*) THEN SUM(row_count) END,
+       CASE WHEN COUNT(min_amount) = COUNT(*) THEN MIN(min_amount) END,
+       CASE WHEN COUNT(max_amount) = COUNT(*) THEN MAX(max_amount) END
+FROM etl.results
+GROUP BY 1
+ON CONFLICT (month) DO UPDATE SET
+  total_amount = EXCLUDED.total_amount, days = EXCLUDED.days, row_count = EXCLUDED.row_count,
+  min_amount = EXCLUDED.min_amount, max_amount = EXCLUDED.max_amount, updated_at = now();
+
+INSERT INTO etl.results_yearly (year, total_amount, days, row_count, min_amount, max_amount)
+SELECT EXTRACT(YEAR FROM month)::int, SUM(total_amount), SUM(days),
+       CASE WHEN COUNT(row_count) = COUNT(*) THEN SUM(row_count) END,
+       CASE WHEN COUNT(min_amount) = COUNT(*) THEN MIN(min_amount) END,
+       CASE WHEN COUNT(max_amount) = COUNT(*) THEN MAX(max_amount) END
+FROM etl.results_monthly
+GROUP BY 1
+ON CONFLICT (year) DO UPDATE SET
+  total_amount = EXCLUDED.total_amount, days = EXCLUDED.days, row_count = EXCLUDED.row_count,
+  min_amount = EXCLUDED.min_amount, max_amount = EXCLUDED.max_amount, updated_at = now();
+
+COMMIT;
@@ -1,6 +1,12 @@
 -- Sample queries to explore ETL results
--- Recent rows
+-- Recent rows (index scan on results_created_at_idx per partition)
 select * from etl.results order by created_at desc limit 50;
 
--- Totals by date
-select date, sum(total_amount) as total from etl.results group by date order by date;
+-- Totals by date for a range (only reads that year's partition)
+select date, total_amount from etl.results
+where date >= '2025-01-01' and date < '2026-01-01'
+order by date;
+
+-- Dashboards: monthly and yearly totals, kept up to date by every load
+select month, total_amount, days from etl.results_monthly order by month;
+select year, total_amount, days from etl.results_yearly order by year;
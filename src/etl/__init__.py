@@ -1,5 +1,18 @@
-"""ETL package entrypoints."""
+"""ETL package entrypoints.
 
-from .main import main
+`main` is resolved on first access, so importing a submodule (e.g.
+`etl.extract` in a worker process) does not import the CLI as well. Once
+`etl.main` has been imported as a module, the package attribute is that
+module; `from etl.main import main` always gives the function.
+"""
 
 __all__ = ["main"]
+
+
+def __getattr__(name: str):
+    if name == "main":
+        from .main import main
+
+        globals()["main"] = main
+        return main
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
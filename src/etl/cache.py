@@ -0,0 +1,367 @@
+"""Parse-once columnar cache of CSV inputs.
+
+Each input file is parsed, validated and date-normalized once; the rows that
+survive the extract and transform stages are stored as dictionary-encoded
+columns in `.npy` files under a directory named after the file's content
+hash. Every column keeps `codes` (int32 per row, -1 for a missing field),
+its distinct stripped strings (`uniques`) and their `float()` values, so
+later runs can aggregate by any `group_by`/`value_field` pair without
+touching the CSV again. Cached arrays are opened with memory mapping.
+
+A changed file hashes differently and simply misses the cache. A small
+stat index (size, mtime) avoids rehashing unchanged files. Entries are
+evicted least recently used first once the cache grows past `max_bytes`.
+
+Requires NumPy, like the columnar engine.
+"""
+from __future__ import annotations
+
+import json
+import os
+import shutil
+from array import array
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+from .columnar import _Totals, np
+from .extract import file_hash, list_csv_files, read_csv_file
+from .logger import get_logger
+from .metrics import RunMetrics
+from .quarantine import row_number
+from .shard import Shard
+from .transform import Aggregator, DateNormalizer
+
+logger = get_logger(__name__)
+
+# bump when the on-disk layout or the normalization rules change
+CACHE_VERSION = 2
+DEFAULT_MAX_BYTES = 2 * 1024 * 1024 * 1024
+INDEX_FILE = "index.json"
+
+
+def available() -> bool:
+    return np is not None
+
+
+class CachedFile:
+    """Memory-mapped columns of one cached input file."""
+
+    def __init__(self, directory: Path, meta: Dict[str, Any]) -> None:
+        self.directory = directory
+        self.meta = meta
+        self.rows: int = meta["rows"]
+        self.columns: List[str] = meta["columns"]
+
+    def rejects(self) -> List[List[Any]]:
+        """[row, stage, reason, value] of every row dropped while parsing, in order."""
+        if not self.meta["rejected"]:
+            return []
+        return json.loads((self.directory / "rejects.json").read_text(encoding="utf8"))
+
+    def column(
+        self, name: str
+    ) -> Tuple["np.ndarray", List[Any], "np.ndarray", "np.ndarray"]:
+        """Return (codes, uniques, float values, float ok) for a column.
+
+        The last entry of uniques/values/ok stands for a missing field, so
+        `codes` (where -1 means missing) can index them directly.
+        """
+        i = self.columns.index(name)
+
+        def load(suffix: str) -> "np.ndarray":
+            return np.load(self.directory / f"{i}.{suffix}.npy", mmap_mode="r")
+
+        uniques = load("uniques").tolist() + [None]
+        values = np.append(load("values"), 0.0)
+        ok = np.append(load("ok"), False)
+        return load("codes"), uniques, values, ok
+
+
+def _encode_floats(uniques: List[str]) -> Tuple[List[float], List[bool]]:
+    values, ok = [], []
+    for u in uniques:
+        try:
+            values.append(float(u))
+            ok.append(True)
+        except ValueError:
+            values.append(0.0)
+            ok.append(False)
+    return values, ok
+
+
+def _append_codes(
+    row: Dict[str, str],
+    rows: int,
+    codes: Dict[str, array],
+    encoders: Dict[str, Dict[str, int]],
+) -> None:
+    """Append the dictionary code of each of row's values (-1 when missing) to codes."""
+    for name in row:
+        if name is None or name in codes:
+            continue
+        # first appearance of a column: earlier rows did not have it
+        codes[name] = array("i", [-1]) * rows
+        encoders[name] = {}
+    for name, col in codes.items():
+        value = row.get(name)
+        if value is None:
+            col.append(-1)
+            continue
+        enc = encoders[name]
+        code = enc.get(value)
+        if code is None:
+            code = enc[value] = len(enc)
+        col.append(code)
+
+
+class ColumnCache:
+    """On-disk cache of parsed CSV files, keyed by content hash."""
+
+    def __init__(self, root: str | Path, max_bytes: int = DEFAULT_MAX_BYTES) -> None:
+        if np is None:
+            raise RuntimeError("the column cache requires NumPy")
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        index = self.root / INDEX_FILE
+        self._index: Dict[str, List[Any]] = (
+            json.loads(index.read_text(encoding="utf8")) if index.exists() else {}
+        )
+
+    def key(self, path: Path) -> str:
+        """Content hash of path, reusing the last one while size and mtime match."""
+        st = path.stat()
+        resolved = str(path.resolve())
+        prev = self._index.get(resolved)
+        if prev is not None and prev[0] == st.st_size and prev[1] == st.st_mtime_ns:
+            return prev[2]
+        digest = f"{file_hash(path)}-v{CACHE_VERSION}"
+        self._index[resolved] = [st.st_size, st.st_mtime_ns, digest]
+        return digest
+
+    def get(self, path: Path) -> CachedFile | None:
+        directory = self.root / self.key(path)
+        meta_path = directory / "meta.json"
+        if not meta_path.exists():
+            return None
+        os.utime(meta_path)  # mark as recently used for eviction
+        return CachedFile(directory, json.loads(meta_path.read_text(encoding="utf8")))
+
+    def put(self, path: Path, metrics: RunMetrics | None = None) -> CachedFile:
+        """Parse path like the row engine does and store its columns."""
+        # keep the rejected rows: hits replay them instead of parsing again
+        file_metrics = RunMetrics(quarantine=True)
+        normalize = DateNormalizer().normalize
+        encoders: Dict[str, Dict[str, int]] = {}
+        codes: Dict[str, array] = {}
+        skipped = array("q")
+        rows = seen = 0
+        for row in read_csv_file(path, metrics=file_metrics, on_bad=skipped.append):
+            seen += 1
+            try:
+                normalize(row)
+            except ValueError as exc:
+                reason = getattr(exc, "reason", "unparseable_date")
+                number = row_number(seen - 1, skipped)
+                file_metrics.reject(
+                    "transform",
+                    reason,
+                    source=path.name,
+                    row=number,
+                    value=row.get("date"),
+                )
+                continue
+            _append_codes(row, rows, codes, encoders)
+            rows += 1
+        file_metrics.count("extract", seen, seen)
+        file_metrics.count("transform", rows, rows)
+
+        final = self.root / self.key(path)
+        tmp = final.with_name(final.name + f".tmp{os.getpid()}")
+        shutil.rmtree(tmp, ignore_errors=True)
+        tmp.mkdir()
+        columns = list(codes)
+        for i, name in enumerate(columns):
+            uniques = list(encoders[name])
+            values, ok = _encode_floats(uniques)
+            np.save(tmp / f"{i}.codes.npy", np.frombuffer(codes[name], dtype=np.int32))
+            np.save(tmp / f"{i}.uniques.npy", np.array(uniques, dtype=str))
+            np.save(tmp / f"{i}.values.npy", np.array(values, dtype=np.float64))
+            np.save(tmp / f"{i}.ok.npy", np.array(ok, dtype=bool))
+        rejects = [
+            [row, stage, reason, value]
+            for batch in file_metrics.rejects.batches()
+            for _, row, stage, reason, value in batch
+        ]
+        if rejects:
+            (tmp / "rejects.json").write_text(json.dumps(rejects), encoding="utf8")
+        meta = {
+            "source": str(path),
+            "columns": columns,
+            "rows": rows,
+            "seen": seen,
+            "rejected": len(rejects),
+            "stages": {
+                name: {
+                    "rows_in": st.rows_in,
+                    "rows_out": st.rows_out,
+                    "rejected": st.rejected,
+                }
+                for name, st in file_metrics.stages.items()
+                if name in ("extract", "transform")
+            },
+        }
+        (tmp / "meta.json").write_text(json.dumps(meta), encoding="utf8")
+        if final.exists():
+            shutil.rmtree(tmp)
+        else:
+            os.replace(tmp, final)
+        if metrics is not None:
+            metrics.merge(file_metrics)
+        file_metrics.rejects.discard()
+        return CachedFile(final, meta)
+
+    def load(
+        self, path: Path, metrics: RunMetrics | None = None
+    ) -> Tuple[CachedFile, bool]:
+        """Return (cached columns, hit) for path, parsing it on a miss.
+
+        On a hit the extract and transform counts and the rows rejected when
+        the file was parsed are replayed into `metrics`.
+        """
+        cached = self.get(path)
+        if cached is None:
+            logger.info("Cache miss for %s; parsing", path.name)
+            return self.put(path, metrics=metrics), False
+        if metrics is not None:
+            for name, st in cached.meta["stages"].items():
+                metrics.count(
+                    name, st["rows_in"] - sum(st["rejected"].values()), st["rows_out"]
+                )
+            for row, stage, reason, value in cached.rejects():
+                metrics.reject(stage, reason, source=path.name, row=row, value=value)
+        return cached, True
+
+    def size_bytes(self) -> int:
+        return sum(f.stat().st_size for f in self.root.glob("*/*") if f.is_file())
+
+    def evict(self) -> int:
+        """Drop least recently used entries until the cache fits.
+
+        Returns the number of entries removed.
+        """
+        entries = []
+        total = 0
+        for d in self.root.iterdir():
+            meta = d / "meta.json"
+            if not d.is_dir() or not meta.exists():
+                continue
+            size = sum(f.stat().st_size for f in d.iterdir())
+            entries.append((meta.stat().st_mtime, size, d))
+            total += size
+        removed = 0
+        for _, size, d in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(d, ignore_errors=True)
+            total -= size
+            removed += 1
+        return removed
+
+    def save_index(self) -> None:
+        # drop stat entries that point at evicted data
+        live = {d.name for d in self.root.iterdir() if d.is_dir()}
+        self._index = {k: v for k, v in self._index.items() if v[2] in live}
+        tmp = self.root / (INDEX_FILE + ".tmp")
+        tmp.write_text(json.dumps(self._index), encoding="utf8")
+        os.replace(tmp, self.root / INDEX_FILE)
+
+
+def _fold_cached(
+    cached: CachedFile,
+    group_by: str,
+    value_field: str,
+    totals: _Totals,
+    metrics: RunMetrics,
+    source: str,
+) -> None:
+    n = cached.rows
+    if not n:
+        return
+    with metrics.timed("aggregate"):
+        if group_by in cached.columns:
+            gcodes, keys = cached.column(group_by)[:2]
+        else:
+            gcodes, keys = np.full(n, -1, dtype=np.int32), [None]
+        if value_field in cached.columns:
+            vcodes, vuniq, vvalues, vok = cached.column(value_field)
+            values, valid = vvalues[vcodes], vok[vcodes]
+        else:
+            # row.get(value_field, 0) in the row engine
+            vcodes, vuniq = None, None
+            values, valid = np.zeros(n, dtype=np.float64), np.ones(n, dtype=bool)
+    if not valid.all():
+        # cached rows are the parsed rows minus the ones rejected on the way
+        dropped = [r[0] for r in cached.rejects()]
+        for i in np.flatnonzero(~valid):
+            row = row_number(int(i), dropped)
+            metrics.reject(
+                "aggregate",
+                "non_numeric_value",
+                source=source,
+                row=row,
+                value=vuniq[vcodes[i]],
+            )
+    with metrics.timed("aggregate"):
+        # -1 (missing) maps onto the trailing None key
+        g = np.where(gcodes < 0, len(keys) - 1, gcodes)[valid]
+        if len(g):
+            present, first = np.unique(g, return_index=True)
+            lut = np.zeros(len(keys), dtype=np.int64)
+            for u in present[np.argsort(first, kind="stable")]:
+                lut[u] = totals.code(keys[u])
+            np.add.at(totals.values, lut[g], values[valid])
+        totals.rows += len(g)
+    metrics.count("aggregate", len(g), 0)
+
+
+def aggregate_cached(
+    folder: str | Path,
+    cache: ColumnCache,
+    group_by: str = "date",
+    value_field: str = "amount",
+    metrics: RunMetrics | None = None,
+    shard: Shard | None = None,
+) -> Tuple[Aggregator, int]:
+    """Aggregate `value_field` by `group_by` over folder's CSVs (of `shard`), cached.
+
+    Results, group order and float rounding match `transform.aggregate` over
+    normalized rows. Rows rejected when a file was parsed are replayed on
+    cache hits, so reject counts and quarantined rows match an uncached run.
+    Returns (aggregator, rows consumed).
+    """
+    if metrics is None:
+        metrics = RunMetrics()
+    files = list_csv_files(folder, shard)
+    if not files:
+        logger.info("No CSV files found in %s", folder)
+    totals = _Totals()
+    seen = 0
+    hits = 0
+    for f in files:
+        # a miss parses and normalizes the file, which is all booked as extract
+        with metrics.timed("extract"):
+            cached, hit = cache.load(f, metrics=metrics)
+        hits += hit
+        seen += cached.meta["seen"]
+        _fold_cached(cached, group_by, value_field, totals, metrics, f.name)
+    removed = cache.evict()
+    cache.save_index()
+    logger.info(
+        "Column cache: %d of %d files hit, %d entries evicted, %s used",
+        hits,
+        len(files),
+        removed,
+        f"{cache.size_bytes() / (1024 * 1024):.1f} MiB",
+    )
+    return totals.to_aggregator(group_by, value_field), seen
@@ -0,0 +1,194 @@
+"""Crash-safe checkpoints for long aggregation runs.
+
+Files are folded in one at a time (or by worker processes, in file order).
+Every `interval` seconds, and once all files are done, the run writes a
+checkpoint: the files completed so far with their size and mtime, the
+partial aggregator, rows consumed and the run metrics. It is pickled to a
+temp file, fsynced and renamed over the previous checkpoint, so a crash
+leaves either the old or the new one, never a torn file.
+
+With `resume`, a matching checkpoint's aggregator and metrics are restored
+and its files skipped, so a restarted run only pays for the files it had
+not finished. The checkpoint is removed once the results are loaded.
+"""
+from __future__ import annotations
+
+import os
+import pickle
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+from .extract import list_csv_files
+from .logger import get_logger
+from .metrics import RunMetrics
+from .parallel import aggregate_files, fold_file, new_aggregator
+from .shard import Shard
+from .transform import Aggregator
+
+logger = get_logger(__name__)
+
+# bump when the pickled layout changes
+CHECKPOINT_VERSION = 3
+DEFAULT_PATH = "etl.checkpoint"
+DEFAULT_INTERVAL = 60.0
+
+
+@dataclass
+class Checkpoint:
+    folder: str
+    # options that change the aggregate, e.g. reader, stats, exact
+    options: Dict[str, Any]
+    # resolved path -> (size, mtime_ns) of every file folded into `agg`
+    done: Dict[str, Tuple[int, int]] = field(default_factory=dict)
+    agg: Any = None
+    seen: int = 0
+    metrics: RunMetrics = field(default_factory=RunMetrics)
+    version: int = CHECKPOINT_VERSION
+
+
+def save_checkpoint(path: str | Path, ckpt: Checkpoint) -> None:
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as fh:
+        pickle.dump(ckpt, fh, pickle.HIGHEST_PROTOCOL)
+        fh.flush()
+        os.fsync(fh.fileno())
+    os.replace(tmp, path)
+
+
+def load_checkpoint(path: str | Path) -> Checkpoint | None:
+    """Return the checkpoint at path, or None if there is none."""
+    try:
+        with open(path, "rb") as fh:
+            ckpt = pickle.load(fh)
+    except FileNotFoundError:
+        return None
+    if not isinstance(ckpt, Checkpoint) or ckpt.version != CHECKPOINT_VERSION:
+        raise ValueError(
+            f"{path} is not a checkpoint this version can resume; delete it to start"
+            " over"
+        )
+    return ckpt
+
+
+def remove_checkpoint(path: str | Path) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _file_state(path: Path) -> Tuple[int, int]:
+    st = path.stat()
+    return st.st_size, st.st_mtime_ns
+
+
+def _restore(
+    ckpt: Checkpoint, folder: str, options: Dict[str, Any], files: List[Path]
+) -> None:
+    if ckpt.folder != folder or ckpt.options != options:
+        raise ValueError(
+            "the checkpoint was written for another input folder or other options;"
+            " delete it to start over"
+        )
+    current = {str(f.resolve()): f for f in files}
+    for key, state in ckpt.done.items():
+        f = current.get(key)
+        if f is None or _file_state(f) != state:
+            # its rows are already in the partial aggregate and cannot be taken out
+            raise ValueError(
+                f"{key} changed or disappeared since the checkpoint; delete it to start"
+                " over"
+            )
+
+
+def _start(
+    path: str | Path,
+    resume: bool,
+    folder: str,
+    options: Dict[str, Any],
+    files: List[Path],
+    metrics: RunMetrics,
+) -> Checkpoint:
+    """The checkpoint to resume from with `resume`, else a new one for folder."""
+    ckpt = load_checkpoint(path) if resume else None
+    if ckpt is not None:
+        _restore(ckpt, folder, options, files)
+        logger.info(
+            "Resuming from %s: %d of %d files already done",
+            path,
+            len(ckpt.done),
+            len(files),
+        )
+        metrics.merge(ckpt.metrics)
+        return ckpt
+    if not resume and Path(path).exists():
+        logger.warning(
+            "Overwriting the checkpoint at %s; pass --resume to continue from it", path
+        )
+    return Checkpoint(
+        folder, options, agg=new_aggregator(options["stats"], options["exact"])
+    )
+
+
+def aggregate_checkpointed(
+    folder: str | Path,
+    path: str | Path = DEFAULT_PATH,
+    resume: bool = False,
+    interval: float = DEFAULT_INTERVAL,
+    workers: int = 1,
+    reader: str = "csv",
+    stats: bool = False,
+    exact: bool = False,
+    metrics: RunMetrics | None = None,
+    shard: Shard | None = None,
+) -> Tuple[Aggregator, int]:
+    """Aggregate every CSV in folder (of `shard`), checkpointing progress to `path`.
+
+    Serial runs fold every file into one aggregator, as the plain row engine
+    does; with `workers` > 1 per-file partials are merged in file order.
+    Returns (aggregator, rows consumed), including the rows of a resumed
+    checkpoint. Stage metrics of the resumed part are merged into `metrics`.
+    """
+    if metrics is None:
+        metrics = RunMetrics()
+    folder = str(Path(folder).resolve())
+    options: Dict[str, Any] = {"reader": reader, "stats": stats, "exact": exact}
+    if shard is not None:
+        options["shard"] = shard
+    files = list_csv_files(folder, shard)
+    ckpt = _start(path, resume, folder, options, files, metrics)
+    todo = [f for f in files if str(f.resolve()) not in ckpt.done]
+    if not files:
+        logger.info("No CSV files found in %s", folder)
+
+    last = time.monotonic()
+
+    def done(f: Path, n: int, file_metrics: RunMetrics) -> None:
+        nonlocal last
+        ckpt.done[str(f.resolve())] = _file_state(f)
+        ckpt.seen += n
+        ckpt.metrics.merge(file_metrics)
+        metrics.merge(file_metrics)
+        if len(ckpt.done) == len(files) or time.monotonic() - last >= interval:
+            save_checkpoint(path, ckpt)
+            # rows of checkpointed files must not be lost with the buffer on a crash
+            metrics.rejects.flush()
+            last = time.monotonic()
+            logger.info("Checkpoint: %d of %d files done", len(ckpt.done), len(files))
+
+    quarantine = metrics.rejects.keep
+    if workers > 1:
+        partials = aggregate_files(
+            [str(f) for f in todo], workers, reader, stats, exact, quarantine
+        )
+        for f, (part, n, file_metrics) in zip(todo, partials):
+            ckpt.agg.merge(part)
+            done(f, n, file_metrics)
+    else:
+        for f in todo:
+            file_metrics = RunMetrics(quarantine=quarantine)
+            n = fold_file(f, ckpt.agg, reader, file_metrics)
+            done(f, n, file_metrics)
+    return ckpt.agg, ckpt.seen
@@ -0,0 +1,237 @@
+"""Optional NumPy columnar engine for the transform and aggregate stages.
+
+CSV files are read in chunks of rows projected down to the `date` and
+`amount` columns. Amounts become float64 arrays, raw dates are factorized so
+each distinct string is normalized once, and totals are accumulated with
+`np.add.at`. The output matches `transform.aggregate` exactly, including
+group order and float rounding, because `np.add.at` adds values into each
+group in row order.
+
+NumPy is optional; use `available()` before calling into this module.
+"""
+from __future__ import annotations
+
+import csv
+from array import array
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Sequence, Tuple
+
+from .compressed import open_text
+from .extract import list_csv_files
+from .logger import get_logger
+from .metrics import RunMetrics
+from .quarantine import row_number
+from .shard import Shard
+from .transform import Aggregator, DateNormalizer
+
+try:
+    import numpy as np
+except ImportError:  # optional dependency
+    np = None
+
+logger = get_logger(__name__)
+
+CHUNK_ROWS = 65_536
+
+
+def available() -> bool:
+    return np is not None
+
+
+class _Totals:
+    """Growable float64 totals indexed by group code, in first-seen order."""
+
+    def __init__(self) -> None:
+        self.index: Dict[Any, int] = {}
+        self.values = np.zeros(1024, dtype=np.float64)
+        self.rows = 0
+
+    def code(self, key: Any) -> int:
+        c = self.index.get(key)
+        if c is None:
+            c = self.index[key] = len(self.index)
+            if c >= len(self.values):
+                self.values = np.concatenate(
+                    [self.values, np.zeros(len(self.values), dtype=np.float64)]
+                )
+        return c
+
+    def to_aggregator(self, group_by: str, value_field: str) -> Aggregator:
+        agg = Aggregator(group_by=group_by, value_field=value_field)
+        agg.totals = dict(zip(self.index, self.values[: len(self.index)].tolist()))
+        agg.rows = self.rows
+        return agg
+
+
+def _parse_amounts(raw: List[str]) -> Tuple["np.ndarray", "np.ndarray"]:
+    """Return (float64 values, ok mask) using Python float() semantics."""
+    n = len(raw)
+    try:
+        return np.fromiter(map(float, raw), dtype=np.float64, count=n), np.ones(
+            n, dtype=bool
+        )
+    except ValueError:
+        pass
+    values = np.zeros(n, dtype=np.float64)
+    ok = np.zeros(n, dtype=bool)
+    for i, s in enumerate(raw):
+        try:
+            values[i] = float(s)
+            ok[i] = True
+        except ValueError:
+            pass
+    return values, ok
+
+
+def _flush(
+    dates: List[str],
+    amounts: List[str],
+    totals: _Totals,
+    normalizer: DateNormalizer,
+    metrics: RunMetrics,
+    source: str,
+    base: int,
+    skipped: Sequence[int],
+) -> None:
+    if not dates:
+        return
+    with metrics.timed("transform"):
+        uniq, inverse = np.unique(np.array(dates), return_inverse=True)
+        isos = [normalizer.parse(str(u)) for u in uniq]
+        date_ok = np.array([iso is not None for iso in isos], dtype=bool)[inverse]
+    with metrics.timed("aggregate"):
+        values, ok = _parse_amounts(amounts)
+
+    # reject like the row engine does: transform errors first, then bad amounts
+    if not date_ok.all() or not ok.all():
+        for i in np.flatnonzero(~date_ok | ~ok):
+            row = row_number(base + int(i), skipped)
+            if not date_ok[i]:
+                reason = "unparseable_date" if dates[i] else "missing_date"
+                metrics.reject(
+                    "transform", reason, source=source, row=row, value=dates[i]
+                )
+            else:
+                metrics.reject(
+                    "aggregate",
+                    "non_numeric_value",
+                    source=source,
+                    row=row,
+                    value=amounts[i],
+                )
+    passed = int(date_ok.sum())
+    metrics.count("transform", passed, passed)
+
+    valid = date_ok & ok
+    if not valid.any():
+        return
+    with metrics.timed("aggregate"):
+        inv = inverse[valid]
+        # assign group codes in order of first valid occurrence to keep
+        # the row engine's first-seen group order
+        present, first_valid = np.unique(inv, return_index=True)
+        lut = np.zeros(len(uniq), dtype=np.int64)
+        for u in present[np.argsort(first_valid, kind="stable")]:
+            lut[u] = totals.code(isos[u])
+        np.add.at(totals.values, lut[inv], values[valid])
+    n = int(valid.sum())
+    totals.rows += n
+    metrics.count("aggregate", n, 0)
+
+
+def _read_chunks(
+    path: Path, chunk_rows: int, metrics: RunMetrics, skipped: array
+) -> Iterator[Tuple[List[str], List[str]]]:
+    """Yield (raw dates, raw amounts) chunks of rows that passed extraction.
+
+    Row numbers of the rows that did not are appended to `skipped`.
+    """
+    with open_text(path) as fh:
+        reader = csv.reader(fh)
+        header = next(reader, None)
+        if header is None:
+            return
+        # later duplicate headers win, as with csv.DictReader
+        columns = {name: i for i, name in enumerate(header)}
+        di, ai = columns.get("date"), columns.get("amount")
+        dates: List[str] = []
+        amounts: List[str] = []
+        i = 0
+        for row in reader:
+            if not row:
+                # DictReader skips blank lines without numbering them
+                continue
+            i += 1
+            d = row[di] if di is not None and di < len(row) else None
+            a = row[ai] if ai is not None and ai < len(row) else None
+            if not d or not a:
+                metrics.reject(
+                    "extract",
+                    "missing_date_or_amount",
+                    source=path.name,
+                    row=i,
+                    value=",".join(row),
+                )
+                skipped.append(i)
+                continue
+            dates.append(d.strip())
+            amounts.append(a.strip())
+            if len(dates) >= chunk_rows:
+                yield dates, amounts
+                dates, amounts = [], []
+        if dates:
+            yield dates, amounts
+
+
+def _aggregate_file(
+    path: Path, totals: _Totals, chunk_rows: int, metrics: RunMetrics
+) -> int:
+    """Fold one file into totals. Returns rows that passed extraction."""
+    normalizer = DateNormalizer()
+    skipped = array("q")
+    chunks = _read_chunks(path, chunk_rows, metrics, skipped)
+    seen = 0
+    while True:
+        with metrics.timed("extract"):
+            chunk = next(chunks, None)
+        if chunk is None:
+            return seen
+        dates, amounts = chunk
+        metrics.count("extract", len(dates), len(dates))
+        _flush(dates, amounts, totals, normalizer, metrics, path.name, seen, skipped)
+        seen += len(dates)
+
+
+def aggregate_file_columnar(
+    path: str | Path, chunk_rows: int = CHUNK_ROWS, metrics: RunMetrics | None = None
+) -> Tuple[Aggregator, int]:
+    """Aggregate a single CSV file. Returns (partial, rows consumed)."""
+    if np is None:
+        raise RuntimeError("the columnar engine requires NumPy")
+    totals = _Totals()
+    seen = _aggregate_file(Path(path), totals, chunk_rows, metrics or RunMetrics())
+    return totals.to_aggregator("date", "amount"), seen
+
+
+def aggregate_folder_columnar(
+    folder: str | Path,
+    chunk_rows: int = CHUNK_ROWS,
+    metrics: RunMetrics | None = None,
+    shard: Shard | None = None,
+) -> Tuple[Aggregator, int]:
+    """Aggregate `amount` by normalized `date` over every CSV in folder (of `shard`).
+
+    Returns (aggregator, rows consumed) like the row engine.
+    """
+    if np is None:
+        raise RuntimeError("the columnar engine requires NumPy")
+    if metrics is None:
+        metrics = RunMetrics()
+    files = list_csv_files(folder, shard)
+    if not files:
+        logger.info("No CSV files found in %s", folder)
+    totals = _Totals()
+    seen = 0
+    for f in files:
+        seen += _aggregate_file(f, totals, chunk_rows, metrics)
+    return totals.to_aggregator("date", "amount"), seen
@@ -0,0 +1,141 @@
+"""Streaming decompression of compressed CSV input.
+
+`.csv.gz`, `.csv.bz2` and `.csv.xz` are handled with the standard library;
+`.csv.zst` needs the optional `zstandard` package. Files are decompressed
+by a background thread into a small bounded queue of chunks, so inflating
+the next chunk overlaps with tokenizing the current one (zlib, bz2, lzma
+and zstandard release the GIL while they work). Nothing is written to disk.
+"""
+from __future__ import annotations
+
+import bz2
+import gzip
+import io
+import lzma
+import queue
+import threading
+from pathlib import Path
+from typing import BinaryIO, Callable, Dict
+
+try:
+    import zstandard
+except ImportError:  # optional dependency
+    zstandard = None
+
+# decompressed bytes per chunk handed to the parser
+CHUNK_BYTES = 1024 * 1024
+# chunks decompressed ahead of the parser
+QUEUE_CHUNKS = 4
+
+# how long a blocked put waits before re-checking that the reader is open
+_PUT_POLL_SECONDS = 0.5
+_EOF = b""
+
+
+def _open_zstd(path: Path) -> BinaryIO:
+    if zstandard is None:
+        raise RuntimeError(f"reading {path.name} requires the zstandard package")
+    fh = open(path, "rb")
+    return zstandard.ZstdDecompressor().stream_reader(fh, closefd=True)
+
+
+OPENERS: Dict[str, Callable[[Path], BinaryIO]] = {
+    ".gz": lambda p: gzip.open(p, "rb"),
+    ".bz2": lambda p: bz2.open(p, "rb"),
+    ".xz": lambda p: lzma.open(p, "rb"),
+    ".zst": _open_zstd,
+}
+COMPRESSED_SUFFIXES = tuple(".csv" + ext for ext in OPENERS)
+
+
+def is_compressed(path: str | Path) -> bool:
+    return Path(path).name.endswith(COMPRESSED_SUFFIXES)
+
+
+class _Decompressor(threading.Thread):
+    def __init__(self, path: Path, q: "queue.Queue", chunk_bytes: int) -> None:
+        super().__init__(name=f"etl-decompress-{path.name}", daemon=True)
+        self.path = path
+        self.queue = q
+        self.chunk_bytes = chunk_bytes
+        self.closed = threading.Event()
+
+    def _put(self, item) -> bool:
+        while not self.closed.is_set():
+            try:
+                self.queue.put(item, timeout=_PUT_POLL_SECONDS)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def run(self) -> None:
+        try:
+            with OPENERS[self.path.suffix](self.path) as src:
+                while True:
+                    chunk = src.read(self.chunk_bytes)
+                    if not self._put(chunk) or not chunk:
+                        return
+        except BaseException as exc:  # re-raised in the reading thread
+            self._put(exc)
+
+
+class ThreadedReader(io.RawIOBase):
+    """Raw binary stream over a file decompressed by a background thread."""
+
+    def __init__(
+        self,
+        path: str | Path,
+        chunk_bytes: int | None = None,
+        depth: int = QUEUE_CHUNKS,
+    ) -> None:
+        self._queue: "queue.Queue" = queue.Queue(maxsize=depth)
+        self._worker = _Decompressor(
+            Path(path), self._queue, chunk_bytes or CHUNK_BYTES
+        )
+        self._buf = memoryview(b"")
+        self._eof = False
+        self._worker.start()
+
+    def readable(self) -> bool:
+        return True
+
+    def read_chunk(self) -> bytes:
+        """Return the next decompressed chunk as it was produced, b"" at EOF."""
+        if self._buf:
+            chunk, self._buf = bytes(self._buf), memoryview(b"")
+            return chunk
+        if self._eof:
+            return _EOF
+        item = self._queue.get()
+        if isinstance(item, BaseException):
+            self._eof = True
+            raise item
+        if not item:
+            self._eof = True
+        return item
+
+    def readinto(self, b) -> int:
+        if not self._buf:
+            chunk = self.read_chunk()
+            if not chunk:
+                return 0
+            self._buf = memoryview(chunk)
+        n = min(len(b), len(self._buf))
+        b[:n] = self._buf[:n]
+        self._buf = self._buf[n:]
+        return n
+
+    def close(self) -> None:
+        # unblock and stop the worker when the parser stops early
+        self._worker.closed.set()
+        super().close()
+
+
+def open_text(path: str | Path) -> io.TextIOBase:
+    """Open a CSV file, compressed or not, as UTF-8 text for the csv module."""
+    if not is_compressed(path):
+        return open(path, "r", encoding="utf8")
+    return io.TextIOWrapper(
+        io.BufferedReader(ThreadedReader(path), CHUNK_BYTES), encoding="utf8"
+    )
@@ -1,6 +1,7 @@
 """Configuration loader for the ETL.
 
-Reads DATABASE_URL from the environment or `config.yml`.
+Reads DATABASE_URL from the environment or `config.yml`. PyYAML is only
+imported when the environment does not set it and the file exists.
 """
 from __future__ import annotations
 
@@ -8,8 +9,6 @@ import os
 from dataclasses import dataclass
 from typing import Optional
 
-import yaml
-
 
 @dataclass
 class Config:
@@ -23,6 +22,8 @@ def load_config(path: str = "config.yml") -> Config:
         return Config(database_url=db_url)
 
     if os.path.exists(path):
+        import yaml
+
         with open(path, "r", encoding="utf8") as fh:
             raw = yaml.safe_load(fh) or {}
             db_url = raw.get("database", {}).get("url")
@@ -0,0 +1,555 @@
+"""Duplicate-row detection across input files in bounded memory.
+
+Upstream re-deliveries repeat whole rows, which would be counted twice. The
+dedup stage (between extract and transform, see `transform.fold_rows`)
+keeps a 64-bit fingerprint of every row seen in `FingerprintSet`, an
+open-addressing hash table over an `array('Q')`: 8 bytes per slot, kept at
+most half full, so 16-32 bytes per distinct row instead of the ~100 a
+Python `set` of row tuples or ints needs.
+
+Fingerprints are Python's hash of the row's values (SipHash per string,
+combined per tuple), salted per process, which is fine: the set lives and
+dies with one run. Rows are only compared by fingerprint, so two different
+rows are taken for duplicates with probability about n^2 / 2^65 over n
+rows (about 3% at a billion). Rows must list their columns in the same
+order to match.
+
+The table grows up to `max_bytes`. Past that, a run either fails, or with
+`bloom` keeps going approximately: the table is frozen at half the budget
+and new fingerprints go into a Bloom filter sized to the other half, which
+answers "seen before" with a small false-positive rate instead of exactly.
+Rows it flags are rejected as `probable_duplicate_row`, separately from
+the exact `duplicate_row`, so the approximation shows in the metrics.
+
+In memory the table holds tens of millions of distinct rows, not
+billions: the default 512 MiB holds 33.5M fingerprints exactly
+(`capacity`), and a billion rows need 16 GiB. Runs estimate their row
+count from the input's size (`estimate_rows`) before reading anything
+(`Deduper.plan`). Inputs that outgrow the table are deduplicated exactly
+from disk instead: a first pass (`Deduper.scan`) writes every row's
+fingerprint and sequence number, 16 bytes a row, to partitions chosen by
+fingerprint, each sized to fit the table; the partitions are checked one at
+a time for fingerprints seen earlier, and the sequence numbers of those
+duplicates are merged into one sorted stream that the second, aggregating
+pass drops rows by. This reads the input twice, which must not change in
+between. A partition that outgrows the table anyway (the estimate was low)
+is split again with a differently mixed hash.
+
+The Bloom filter is an overflow tier for inputs somewhat over budget that
+should be read once, not a way to scale: at 4 bits per row its
+false-positive rate passes 15%, and a billion rows overflowing into the
+default 256 MiB filter would drop half of the new rows as probable
+duplicates, so runs whose rate would pass MAX_BLOOM_FALSE_POSITIVES fail
+before reading. Compressed files are left out of the estimate, so a run
+over them can still fill the table; it then fails.
+"""
+from __future__ import annotations
+
+import heapq
+import math
+import os
+import shutil
+import tempfile
+import weakref
+from array import array
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Sequence, Tuple
+
+from .compressed import is_compressed
+from .extract import read_csv_file
+from .logger import get_logger
+from .metrics import RunMetrics, format_bytes
+
+logger = get_logger(__name__)
+
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+# the table doubles once it is this full
+MAX_LOAD = 0.5
+# bit positions set per fingerprint in the Bloom filter
+BLOOM_HASHES = 4
+# runs expected to push the Bloom filter's false-positive rate past this fail
+MAX_BLOOM_FALSE_POSITIVES = 0.01
+_MASK64 = (1 << 64) - 1
+_INITIAL_SLOTS = 1 << 12
+# bytes read from the start of a file to estimate the mean row length
+SAMPLE_BYTES = 1024 * 1024
+# (fingerprint, sequence number) pairs buffered per partition on disk
+SPILL_PAIRS = 8192
+# partitions are split again at most this many times (see `Deduper.scan`)
+MAX_DEPTH = 4
+
+NEW, DUPLICATE, PROBABLE = 0, 1, 2
+REASONS = {DUPLICATE: "duplicate_row", PROBABLE: "probable_duplicate_row"}
+
+
+def row_fingerprint(row: Dict[str, Any]) -> int:
+    """Non-zero 64-bit fingerprint of a row's values."""
+    try:
+        h = hash(tuple(row.values()))
+    except TypeError:
+        # DictReader puts surplus fields in a list
+        h = hash(tuple(v if isinstance(v, str) else repr(v) for v in row.values()))
+    return (h & _MASK64) or 1
+
+
+def capacity(max_bytes: int, bloom: bool = False) -> int:
+    """Distinct rows a `Deduper` with this budget holds exactly."""
+    budget = max_bytes // 2 if bloom else max_bytes
+    slots = 1 << ((budget // 8).bit_length() - 1)
+    return int(slots * MAX_LOAD)
+
+
+def required_bytes(rows: int) -> int:
+    """Smallest budget whose table holds `rows` distinct rows exactly."""
+    slots = 1 << max(math.ceil(rows / MAX_LOAD) - 1, 1).bit_length()
+    return 8 * slots
+
+
+def estimate_rows(files: Sequence[Path], sample_bytes: int = SAMPLE_BYTES) -> int:
+    """Rough row count of files: their size over the mean line length of a sample.
+
+    Compressed files are left out, since their size says little about their
+    rows, so with those the estimate is low.
+    """
+    plain = [f for f in files if not is_compressed(f)]
+    total = sum(f.stat().st_size for f in plain)
+    if not total:
+        return 0
+    with open(max(plain, key=lambda f: f.stat().st_size), "rb") as fh:
+        sample = fh.read(sample_bytes)
+    return total * max(sample.count(b"\n"), 1) // len(sample)
+
+
+class FingerprintSet:
+    """Open-addressing (linear probing) set of non-zero 64-bit ints in an array('Q')."""
+
+    def __init__(self, slots: int = _INITIAL_SLOTS) -> None:
+        self._alloc(slots)
+        self.size = 0
+
+    def _alloc(self, slots: int) -> None:
+        self.table = array("Q", bytes(8 * slots))
+        self.mask = slots - 1
+        self.limit = int(slots * MAX_LOAD)
+
+    @property
+    def nbytes(self) -> int:
+        return len(self.table) * 8
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __contains__(self, fp: int) -> bool:
+        table, mask = self.table, self.mask
+        i = fp & mask
+        while True:
+            slot = table[i]
+            if slot == fp:
+                return True
+            if not slot:
+                return False
+            i = (i + 1) & mask
+
+    def add(self, fp: int) -> bool:
+        """Add fp; False if it was already there. Callers grow a full table first."""
+        table, mask = self.table, self.mask
+        i = fp & mask
+        while True:
+            slot = table[i]
+            if slot == fp:
+                return False
+            if not slot:
+                table[i] = fp
+                self.size += 1
+                return True
+            i = (i + 1) & mask
+
+    @property
+    def full(self) -> bool:
+        return self.size >= self.limit
+
+    def grow(self) -> None:
+        old = self.table
+        self._alloc(len(old) * 2)
+        table, mask = self.table, self.mask
+        for fp in old:
+            if fp:
+                i = fp & mask
+                while table[i]:
+                    i = (i + 1) & mask
+                table[i] = fp
+
+
+class BloomFilter:
+    """Bloom filter over 64-bit fingerprints; positions by double hashing."""
+
+    def __init__(self, nbytes: int) -> None:
+        # a power of two of bits, so positions are a mask away
+        bits = 1 << max(3, (nbytes * 8).bit_length() - 1)
+        self.bits = bytearray(bits // 8)
+        self.mask = bits - 1
+        self.set_bits = 0
+        self.size = 0
+
+    @property
+    def nbytes(self) -> int:
+        return len(self.bits)
+
+    def add(self, fp: int) -> bool:
+        """Set fp's bits; False if they were all set already (probably seen)."""
+        bits, mask = self.bits, self.mask
+        h1, h2 = fp & 0xFFFFFFFF, (fp >> 32) | 1
+        new = False
+        for k in range(BLOOM_HASHES):
+            pos = (h1 + k * h2) & mask
+            byte, bit = pos >> 3, 1 << (pos & 7)
+            if not bits[byte] & bit:
+                bits[byte] |= bit
+                self.set_bits += 1
+                new = True
+        if new:
+            self.size += 1
+        return new
+
+    @property
+    def false_positive_rate(self) -> float:
+        """Chance that an unseen fingerprint currently looks seen."""
+        return (self.set_bits / (self.mask + 1)) ** BLOOM_HASHES
+
+
+def _partition(fp: int, depth: int, parts: int) -> int:
+    """Partition of fp; mixed per depth, and independent of the low bits the
+    table probes with."""
+    mixed = ((fp ^ (depth * 0x9E3779B97F4A7C15)) * 0xBF58476D1CE4E5B9) & _MASK64
+    return (mixed >> 32) % parts
+
+
+def _write_partitions(
+    pairs: Iterable[Tuple[int, int]], paths: List[str], depth: int
+) -> int:
+    """Write (fingerprint, sequence number) pairs to their partition files.
+
+    Returns the pairs written."""
+    files = [open(p, "wb") for p in paths]
+    buffers = [array("Q") for _ in paths]
+    n = 0
+    parts = len(paths)
+    try:
+        for fp, seq in pairs:
+            i = _partition(fp, depth, parts)
+            buf = buffers[i]
+            buf.append(fp)
+            buf.append(seq)
+            if len(buf) >= 2 * SPILL_PAIRS:
+                buf.tofile(files[i])
+                del buf[:]
+            n += 1
+        for fh, buf in zip(files, buffers):
+            buf.tofile(fh)
+    finally:
+        for fh in files:
+            fh.close()
+    return n
+
+
+def _read_pairs(path: str) -> Iterator[Tuple[int, int]]:
+    with open(path, "rb") as fh:
+        while True:
+            chunk = fh.read(16 * SPILL_PAIRS)
+            if not chunk:
+                return
+            pairs = array("Q")
+            pairs.frombytes(chunk)
+            yield from zip(pairs[::2], pairs[1::2])
+
+
+def _read_numbers(path: str) -> Iterator[int]:
+    with open(path, "rb") as fh:
+        while True:
+            chunk = fh.read(8 * SPILL_PAIRS)
+            if not chunk:
+                return
+            numbers = array("Q")
+            numbers.frombytes(chunk)
+            yield from numbers
+
+
+def _write_numbers(path: str, numbers: Iterable[int]) -> None:
+    buf = array("Q")
+    with open(path, "wb") as fh:
+        for n in numbers:
+            buf.append(n)
+            if len(buf) >= SPILL_PAIRS:
+                buf.tofile(fh)
+                del buf[:]
+        buf.tofile(fh)
+
+
+class Deduper:
+    """Remembers row fingerprints for one run within `max_bytes`."""
+
+    def __init__(
+        self,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        bloom: bool = False,
+        tmp_dir: str | None = None,
+    ) -> None:
+        self.max_bytes = max_bytes
+        self.bloom_enabled = bloom
+        # with a Bloom filter to fall back on, the table keeps half the budget
+        self.table_budget = max_bytes // 2 if bloom else max_bytes
+        if 8 * _INITIAL_SLOTS > self.table_budget:
+            raise ValueError(
+                f"a dedup budget of {format_bytes(max_bytes)} is too small"
+            )
+        self.fingerprints = FingerprintSet()
+        self.bloom: BloomFilter | None = None
+        self.rows = 0
+        self.duplicates = 0
+        self.probable = 0
+        self.tmp_dir = tmp_dir
+        # partitions on disk, once `plan` found the input too large for the table
+        self.partitions = 0
+        self.scanned = 0
+        self.resplits = 0
+        self._peak_bytes = 0
+        self._dir: str | None = None
+        self._cleanup = None
+        self._duplicates: Iterator[int] | None = None
+        self._next_duplicate = -1
+
+    @property
+    def on_disk(self) -> bool:
+        return self.partitions > 0
+
+    @property
+    def nbytes(self) -> int:
+        if self.on_disk:
+            return self._peak_bytes
+        return self.fingerprints.nbytes + (
+            self.bloom.nbytes if self.bloom is not None else 0
+        )
+
+    @property
+    def capacity(self) -> int:
+        return capacity(self.max_bytes, self.bloom_enabled)
+
+    def plan(self, rows: int) -> None:
+        """Check before reading that about `rows` rows fit in the budget.
+
+        When they do not fit exactly, rows are deduplicated from partitions on
+        disk (see `scan`), or with a Bloom filter if it is enabled; raises
+        ValueError when its false-positive rate at that many rows would pass
+        MAX_BLOOM_FALSE_POSITIVES, and below that logs the rate.
+        """
+        cap = self.capacity
+        if rows <= cap:
+            return
+        msg = (
+            f"dedup keeps at most {cap:,} distinct rows exactly in"
+            f" {format_bytes(self.max_bytes)},"
+            f" and the input holds about {rows:,} rows"
+        )
+        if not self.bloom_enabled:
+            # half full on average, so an estimate a little low still fits
+            self.partitions = max(2, math.ceil(2 * rows / cap))
+            logger.warning(
+                "%s; partitioning their fingerprints on disk into %d parts, which"
+                " reads the input twice",
+                msg,
+                self.partitions,
+            )
+            return
+        bits = BloomFilter(self.max_bytes - 8 * int(cap / MAX_LOAD)).mask + 1
+        rate = (1 - math.exp(-BLOOM_HASHES * (rows - cap) / bits)) ** BLOOM_HASHES
+        if rate > MAX_BLOOM_FALSE_POSITIVES:
+            need = format_bytes(required_bytes(rows))
+            raise ValueError(
+                f"{msg}; a Bloom filter for the rest would take {rate:.0%} of new rows"
+                " for duplicates."
+                f" Without the Bloom filter, dedup is exact: in {need}, or from"
+                " partitions on disk"
+            )
+        logger.warning(
+            "%s; the rest go to a Bloom filter, whose false-positive rate will reach"
+            " about %.2g%%",
+            msg,
+            100 * rate,
+        )
+
+    def scan(self, files: Sequence[Path]) -> None:
+        """First pass over files when `plan` chose the disk: find the duplicates.
+
+        Reads the rows `extract.read_csv_file` yields, the rows the dedup stage
+        will see, in the same order. Does nothing otherwise.
+        """
+        if not self.on_disk:
+            return
+        self._dir = tempfile.mkdtemp(prefix="etl-dedup-", dir=self.tmp_dir)
+        self._cleanup = weakref.finalize(self, shutil.rmtree, self._dir, True)
+        rows = (row for f in files for row in read_csv_file(f))
+        paths = [os.path.join(self._dir, f"p{i}") for i in range(self.partitions)]
+        self.scanned = _write_partitions(
+            ((row_fingerprint(r), seq) for seq, r in enumerate(rows)), paths, 0
+        )
+        found = [self._find_duplicates(p, 0) for p in paths]
+        self._duplicates = heapq.merge(*map(_read_numbers, found))
+        self._next_duplicate = next(self._duplicates, -1)
+        logger.info(
+            "Dedup scan: %d rows in %d partitions on disk (%d split again)",
+            self.scanned,
+            self.partitions,
+            self.resplits,
+        )
+
+    def _find_duplicates(self, path: str, depth: int) -> str:
+        """Write the sequence numbers of the partition's repeated fingerprints,
+        ascending, to a file of their own. Returns its path."""
+        seen = FingerprintSet()
+        out = f"{path}.dup"
+        oversized = False
+        dups = array("Q")
+        with open(out, "wb") as fh:
+            for fp, seq in _read_pairs(path):
+                if seen.full and fp not in seen:
+                    if seen.nbytes * 2 > self.table_budget and depth < MAX_DEPTH:
+                        oversized = True
+                        break
+                    seen.grow()
+                if not seen.add(fp):
+                    dups.append(seq)
+                    if len(dups) >= SPILL_PAIRS:
+                        dups.tofile(fh)
+                        del dups[:]
+            dups.tofile(fh)
+        self._peak_bytes = max(self._peak_bytes, seen.nbytes)
+        del seen
+        if oversized:
+            self.resplits += 1
+            parts = [f"{path}.{i}" for i in range(self.partitions)]
+            _write_partitions(_read_pairs(path), parts, depth + 1)
+            found = [self._find_duplicates(p, depth + 1) for p in parts]
+            _write_numbers(out, heapq.merge(*map(_read_numbers, found)))
+            for f in found:
+                os.remove(f)
+        os.remove(path)
+        return out
+
+    def check(self, fp: int) -> int:
+        """Record fp; NEW, DUPLICATE or (past the table's budget) PROBABLE."""
+        self.rows += 1
+        if self.on_disk:
+            if self._duplicates is None:
+                raise RuntimeError("scan() the input before deduplicating on disk")
+            if self.rows - 1 != self._next_duplicate:
+                return NEW
+            self._next_duplicate = next(self._duplicates, -1)
+            self.duplicates += 1
+            return DUPLICATE
+        if (
+            self.bloom is None
+            and self.fingerprints.full
+            and fp not in self.fingerprints
+        ):
+            self._make_room()
+        if self.bloom is None:
+            if self.fingerprints.add(fp):
+                return NEW
+        elif fp not in self.fingerprints:
+            if self.bloom.add(fp):
+                return NEW
+            self.probable += 1
+            return PROBABLE
+        self.duplicates += 1
+        return DUPLICATE
+
+    def _make_room(self) -> None:
+        if self.fingerprints.nbytes * 2 <= self.table_budget:
+            self.fingerprints.grow()
+            return
+        if not self.bloom_enabled:
+            raise RuntimeError(
+                f"{len(self.fingerprints)} row fingerprints fill the dedup budget of"
+                f" {format_bytes(self.max_bytes)}; raise it or allow approximate dedup"
+                " with a Bloom filter"
+            )
+        self.bloom = BloomFilter(self.max_bytes - self.fingerprints.nbytes)
+        logger.warning(
+            "Dedup table full at %d rows (%s); detecting further duplicates with a %s"
+            " Bloom filter",
+            len(self.fingerprints),
+            format_bytes(self.fingerprints.nbytes),
+            format_bytes(self.bloom.nbytes),
+        )
+
+    def filter(
+        self, rows: List[Dict[str, Any]]
+    ) -> Tuple[List[Dict[str, Any]], List[Tuple[int, int]]]:
+        """Split rows into (new rows, [(position, DUPLICATE or PROBABLE)])."""
+        kept = []
+        dropped = []
+        check = self.check
+        for i, row in enumerate(rows):
+            verdict = check(row_fingerprint(row))
+            if verdict == NEW:
+                kept.append(row)
+            else:
+                dropped.append((i, verdict))
+        return kept, dropped
+
+    def unique(self, rows: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+        """Yield the rows not seen before, e.g. to feed `transform.aggregate`."""
+        check = self.check
+        for row in rows:
+            if check(row_fingerprint(row)) == NEW:
+                yield row
+
+    def close(self) -> None:
+        """Remove the partitions on disk.
+
+        Raises RuntimeError when the rows checked are not the rows `scan`
+        read, i.e. the input changed in between and duplicates were dropped
+        by the wrong sequence numbers.
+        """
+        self._duplicates = None
+        if self._cleanup is not None:
+            self._cleanup()
+        if self.on_disk and self.rows != self.scanned:
+            raise RuntimeError(
+                f"the dedup scan read {self.scanned} rows but {self.rows} were"
+                " aggregated; the input changed during the run"
+            )
+
+    def report(self, metrics: RunMetrics | None = None) -> None:
+        """Log the duplicates found and the memory used; record it in `metrics`."""
+        if metrics is not None:
+            metrics.memory["dedup"] = max(metrics.memory.get("dedup", 0), self.nbytes)
+        if self.on_disk:
+            logger.info(
+                "Dedup: %d of %d rows were duplicates; fingerprints partitioned on"
+                " disk into %d parts, checked in at most %s of %s",
+                self.duplicates,
+                self.rows,
+                self.partitions,
+                format_bytes(self._peak_bytes),
+                format_bytes(self.max_bytes),
+            )
+            return
+        extra = ""
+        if self.bloom is not None:
+            extra = (
+                f", {self.bloom.size} more in a {format_bytes(self.bloom.nbytes)} Bloom"
+                " filter"
+                f" (false-positive rate now {self.bloom.false_positive_rate:.2%})"
+            )
+        logger.info(
+            "Dedup: %d of %d rows were duplicates (%d probable); %d fingerprints in %s"
+            " of %s%s",
+            self.duplicates + self.probable,
+            self.rows,
+            self.probable,
+            len(self.fingerprints),
+            format_bytes(self.fingerprints.nbytes),
+            format_bytes(self.max_bytes),
+            extra,
+        )
@@ -2,31 +2,223 @@
 from __future__ import annotations
 
 import csv
+import hashlib
+import mmap
+import os
 from pathlib import Path
-from typing import Dict, Iterable, List
+from typing import Callable, Dict, Iterable, Iterator, List, Tuple
 
+from .compressed import COMPRESSED_SUFFIXES, ThreadedReader, is_compressed, open_text
 from .logger import get_logger
+from .metrics import RunMetrics
+from .shard import Shard, select_shard
 
 logger = get_logger(__name__)
 
+# csv: DictReader rows with every column (reference implementation)
+# mmap: (date, amount) pairs tokenized straight from a memory-mapped file
+READERS = ("csv", "mmap")
+# bytes of the mapped file split into lines at a time by the mmap reader
+MMAP_BLOCK_BYTES = 1024 * 1024
+CSV_SUFFIXES = (".csv",) + COMPRESSED_SUFFIXES
+# bytes read at a time when hashing a file
+HASH_CHUNK_BYTES = 1024 * 1024
 
-def read_csv_folder(folder: str | Path) -> Iterable[Dict[str, str]]:
+
+def list_csv_files(folder: str | Path, shard: Shard | None = None) -> List[Path]:
+    """Return the CSV files in folder, compressed ones included, sorted so
+    runs are reproducible. With `shard`, only the files assigned to it."""
+    files = sorted(
+        p for p in Path(folder).glob("*.csv*") if p.name.endswith(CSV_SUFFIXES)
+    )
+    return select_shard(files, shard) if shard is not None else files
+
+
+def file_hash(path: str | Path) -> str:
+    """sha256 of the file contents."""
+    h = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(HASH_CHUNK_BYTES), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def iter_rows(
+    reader: Iterable[Dict[str, str]],
+    name: str,
+    on_bad: Callable[[int], None] | None = None,
+    metrics: RunMetrics | None = None,
+) -> Iterator[Dict[str, str]]:
+    """Validate and strip rows from a DictReader.
+
+    Bad rows are rejected in `metrics` with their row number, and reported
+    to `on_bad(row_number)` when given so the caller can number the rows
+    that follow (see `etl.quarantine.row_number`).
+    """
+    for i, row in enumerate(reader, start=1):
+        # basic validation: date and amount present
+        if not row.get("date") or not row.get("amount"):
+            if metrics is not None:
+                raw = ",".join(v for v in row.values() if isinstance(v, str))
+                metrics.reject(
+                    "extract", "missing_date_or_amount", source=name, row=i, value=raw
+                )
+            if on_bad is not None:
+                on_bad(i)
+            continue
+        yield {k: (v.strip() if isinstance(v, str) else v) for k, v in row.items()}
+
+
+def read_csv_file(
+    path: Path,
+    metrics: RunMetrics | None = None,
+    on_bad: Callable[[int], None] | None = None,
+) -> Iterator[Dict[str, str]]:
+    """Yield validated, whitespace-stripped rows from a single CSV file.
+
+    Compressed files are decompressed while streaming; see `etl.compressed`.
+    """
+    with open_text(path) as fh:
+        yield from iter_rows(
+            csv.DictReader(fh), path.name, on_bad=on_bad, metrics=metrics
+        )
+
+
+def read_csv_folder(
+    folder: str | Path, metrics: RunMetrics | None = None
+) -> Iterable[Dict[str, str]]:
     """Yield rows from CSV files in folder.
 
-    Malformed rows are logged and skipped.
+    Malformed rows are skipped and rejected in `metrics`; without `metrics`
+    they are logged as a summary once every file has been read.
     """
     folder = Path(folder)
-    files = list(folder.glob("*.csv"))
+    files = list_csv_files(folder)
+    if not files:
+        logger.info("No CSV files found in %s", folder)
+        return
+
+    own_metrics = metrics is None
+    if metrics is None:
+        metrics = RunMetrics()
+    for f in files:
+        yield from read_csv_file(f, metrics=metrics)
+    if own_metrics:
+        metrics.rejects.report()
+
+
+def _split_fields(line: bytes, need: int) -> List[bytes]:
+    if b'"' in line:
+        # quoted field: let the csv module deal with quotes and escaped commas
+        return [f.encode("utf8") for f in next(csv.reader([line.decode("utf8")]), [])]
+    return line.split(b",", need + 1)
+
+
+def _mapped_blocks(path: Path) -> Iterator[bytes]:
+    """Newline-aligned blocks of a memory-mapped plain file."""
+    with open(path, "rb") as fh:
+        size = os.fstat(fh.fileno()).st_size
+        if size == 0:
+            return
+        with mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            pos = 0
+            while pos < size:
+                cut = pos + MMAP_BLOCK_BYTES
+                if cut >= size:
+                    cut = size
+                else:
+                    nl = mm.find(b"\n", cut)
+                    cut = size if nl == -1 else nl + 1
+                yield mm[pos:cut]
+                pos = cut
+
+
+def _decompressed_blocks(path: Path) -> Iterator[bytes]:
+    """Newline-aligned blocks of a compressed file, inflated in a background thread."""
+    with ThreadedReader(path) as raw:
+        rest = b""
+        while True:
+            chunk = raw.read_chunk()
+            if not chunk:
+                break
+            cut = chunk.rfind(b"\n") + 1
+            if not cut:
+                rest += chunk
+                continue
+            yield rest + chunk[:cut]
+            rest = chunk[cut:]
+        if rest:
+            yield rest
+
+
+def read_projected_file(
+    path: Path,
+    metrics: RunMetrics | None = None,
+    on_bad: Callable[[int], None] | None = None,
+) -> Iterator[Tuple[str, str]]:
+    """Yield whitespace-stripped (date, amount) pairs from a single CSV file.
+
+    Plain files are memory-mapped (compressed ones are inflated by a
+    background thread) and only the `date` and `amount` columns are decoded;
+    no per-row dict is built. Rows are validated, numbered and rejected
+    exactly like `read_csv_file`. Like the byte-range splitter in `etl.parallel`,
+    records must not contain quoted newlines.
+    """
+    blocks = _decompressed_blocks(path) if is_compressed(path) else _mapped_blocks(path)
+    di = ai = None
+    need = 0
+    header_read = False
+    i = 0
+    for block in blocks:
+        lines = block.split(b"\n")
+        if not header_read:
+            header_read = True
+            header = next(csv.reader([lines[0].decode("utf8")]), [])
+            # later duplicate headers win, as with csv.DictReader
+            columns = {name: n for n, name in enumerate(header)}
+            di, ai = columns.get("date"), columns.get("amount")
+            need = max(di if di is not None else 0, ai if ai is not None else 0)
+            lines[0] = b""
+        for line in lines:
+            if line[-1:] == b"\r":
+                line = line[:-1]
+            if not line:
+                # DictReader skips blank lines without numbering them
+                continue
+            i += 1
+            fields = _split_fields(line, need)
+            d = fields[di] if di is not None and di < len(fields) else None
+            a = fields[ai] if ai is not None and ai < len(fields) else None
+            if not d or not a:
+                if metrics is not None:
+                    raw = line.decode("utf8", "replace")
+                    metrics.reject(
+                        "extract",
+                        "missing_date_or_amount",
+                        source=path.name,
+                        row=i,
+                        value=raw,
+                    )
+                if on_bad is not None:
+                    on_bad(i)
+                continue
+            yield d.decode("utf8").strip(), a.decode("utf8").strip()
+
+
+def read_projected_folder(
+    folder: str | Path, metrics: RunMetrics | None = None
+) -> Iterable[Tuple[str, str]]:
+    """Yield (date, amount) pairs from the CSVs in folder; see `read_projected_file`."""
+    folder = Path(folder)
+    files = list_csv_files(folder)
     if not files:
         logger.info("No CSV files found in %s", folder)
         return
 
+    own_metrics = metrics is None
+    if metrics is None:
+        metrics = RunMetrics()
     for f in files:
-        with f.open("r", encoding="utf8") as fh:
-            reader = csv.DictReader(fh)
-            for i, row in enumerate(reader, start=1):
-                # basic validation: date and amount present
-                if not row.get("date") or not row.get("amount"):
-                    logger.warning("Skipping bad row %s in %s: missing date or amount", i, f.name)
-                    continue
-                yield {k: (v.strip() if isinstance(v, str) else v) for k, v in row.items()}
+        yield from read_projected_file(f, metrics=metrics)
+    if own_metrics:
+        metrics.rejects.report()
@@ -1,62 +1,459 @@
-"""Load transformed data into Postgres using SQLAlchemy."""
-from __future__ import annotations
+"""Load transformed data into Postgres using SQLAlchemy.
 
-from typing import Iterable, Dict
+SQLAlchemy is imported by the functions that talk to the database, so
+importing this module (e.g. for LOAD_MODES) stays cheap for dry runs.
+"""
+from __future__ import annotations
 
-from sqlalchemy import text
+import csv
+import datetime
+import io
+import itertools
+from numbers import Number
+from typing import Any, Dict, Iterable, Iterator, List, Set, Tuple
 
-from .db import get_engine
+from .db import SCHEMA, get_engine
 from .logger import get_logger
+from .metrics import RunMetrics
+from .rollup import ROLLUP_TABLE_SQL, SQLITE_ROLLUP_TABLE_SQL, refresh_rollups
 
 logger = get_logger(__name__)
 
 
-TABLE_SQL = """
+# range-partitioned by date, one partition per year (see ensure_partitions);
+# a partitioned table's unique keys must include the date, so the unique
+# date index is the key. Tables created before partitioning stay as they are
+# until migrations/0005_results_partitioned.sql converts them.
+TABLE_SQL = (
+    """
 CREATE TABLE IF NOT EXISTS results (
-  id BIGSERIAL PRIMARY KEY,
+  id BIGSERIAL,
   date DATE NOT NULL,
   total_amount NUMERIC,
   created_at TIMESTAMPTZ DEFAULT NOW()
+) PARTITION BY RANGE (date);
+DO $$
+BEGIN
+  IF (SELECT relkind FROM pg_class WHERE oid = to_regclass('results')) = 'p' THEN
+    CREATE TABLE IF NOT EXISTS results_default PARTITION OF results DEFAULT;
+  END IF;
+END $$;
+CREATE INDEX IF NOT EXISTS results_created_at_idx ON results (created_at);
+ALTER TABLE results
+  ADD COLUMN IF NOT EXISTS row_count BIGINT,
+  ADD COLUMN IF NOT EXISTS min_amount NUMERIC,
+  ADD COLUMN IF NOT EXISTS max_amount NUMERIC,
+  ADD COLUMN IF NOT EXISTS mean_amount NUMERIC;
+"""
+    + ROLLUP_TABLE_SQL
+)
+
+# SQLite stand-in used by tests and local experiments
+SQLITE_TABLE_SQL = (
+    """
+CREATE TABLE IF NOT EXISTS results (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  date DATE NOT NULL,
+  total_amount NUMERIC,
+  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+  row_count BIGINT,
+  min_amount NUMERIC,
+  max_amount NUMERIC,
+  mean_amount NUMERIC
 );
 """
+    + SQLITE_ROLLUP_TABLE_SQL
+)
+
+# one row per date, which upserts and `add` need (see _ensure_date_key)
+DATE_KEY_SQL = "CREATE UNIQUE INDEX IF NOT EXISTS results_date_key ON results (date)"
+# keep the newest copy of each date, as migrations/0002_results_unique_date.sql
+MERGE_DUPLICATE_DATES_SQL = (
+    "DELETE FROM results r USING results newer"
+    " WHERE r.date = newer.date AND r.id < newer.id"
+)
+SQLITE_MERGE_DUPLICATE_DATES_SQL = (
+    "DELETE FROM results WHERE id NOT IN (SELECT MAX(id) FROM results GROUP BY date)"
+)
+
+# optional per-date statistics next to total_amount; NULL when a load did
+# not provide them, so they never describe different rows than the total
+STATS_COLUMNS = ("row_count", "min_amount", "max_amount", "mean_amount")
+
+# pg_advisory_xact_lock key serializing the creation of partitions of results
+PARTITION_LOCK_KEY = 0x45544C50  # "ETLP"
 
+# rows per COPY buffer / per multi-row INSERT statement
+COPY_BATCH_SIZE = 50_000
+INSERT_BATCH_SIZE = 500
+
+# insert: plain append (fails on dates already loaded)
+# upsert: replace the stored total for a date, idempotent across re-runs
+# add:    add to the stored total, for loading partial results
+LOAD_MODES = ("insert", "upsert", "add")
+
+
+def _dialect_name(bind) -> str | None:
+    return getattr(getattr(bind, "dialect", None), "name", None)
 
 
 def ensure_table(engine) -> None:
+    from sqlalchemy import text
+
+    sqlite = _dialect_name(engine) == "sqlite"
+    if sqlite:
+        # sqlite3 only runs one statement per execute
+        statements = [s for s in SQLITE_TABLE_SQL.split(";") if s.strip()]
+    else:
+        statements = [TABLE_SQL]
     with engine.begin() as conn:
-        conn.execute(text(TABLE_SQL))
+        if not sqlite:
+            conn.execute(text(f"CREATE SCHEMA IF NOT EXISTS {SCHEMA}"))
+        for stmt in statements:
+            conn.execute(text(stmt))
+        _ensure_date_key(conn, sqlite)
+        if sqlite:
+            # no ADD COLUMN IF NOT EXISTS in sqlite; upgrade tables created
+            # before the stats columns
+            existing = {r[1] for r in conn.execute(text("PRAGMA table_info(results)"))}
+            for col in STATS_COLUMNS:
+                if col not in existing:
+                    kind = "BIGINT" if col == "row_count" else "NUMERIC"
+                    conn.execute(text(f"ALTER TABLE results ADD COLUMN {col} {kind}"))
 
 
-import datetime
-from numbers import Number
+def _ensure_date_key(conn, sqlite: bool) -> None:
+    """Create the unique date index, first merging dates loaded more than once.
 
-def insert_aggregates(engine, rows):
-    inserted = 0
-    with engine.begin() as conn:
-        for r in rows:
-            d = r.get("date")
-            amt = r.get("total_amount")
-
-            # --- HARD SANITY CHECK ---
-            if not isinstance(d, (datetime.date, datetime.datetime)):
-                logger.warning("Skipping row - invalid date: %r", d)
-                continue
-            if not isinstance(amt, Number):
-                logger.warning("Skipping row - invalid amount: %r", amt)
-                continue
-            # -------------------------
+    Tables from before the index may hold a copy of a date per re-run, on
+    which building the index would fail; only the newest copy is kept.
+    """
+    from sqlalchemy import text
 
+    if sqlite:
+        exists = (
+            "SELECT 1 FROM sqlite_master"
+            " WHERE type = 'index' AND name = 'results_date_key'"
+        )
+    else:
+        exists = "SELECT to_regclass('results_date_key') IS NOT NULL"
+    if conn.execute(text(exists)).scalar():
+        return
+    merge = SQLITE_MERGE_DUPLICATE_DATES_SQL if sqlite else MERGE_DUPLICATE_DATES_SQL
+    merged = conn.execute(text(merge)).rowcount
+    if merged:
+        logger.warning("Removed %d older copies of dates loaded more than once", merged)
+    conn.execute(text(DATE_KEY_SQL))
+
+
+def ensure_partitions(conn, years: Iterable[int]) -> None:
+    """Create the yearly partitions of `results` that are missing (Postgres).
+
+    Does nothing when `results` is not partitioned. A year's rows must go
+    into its partition before any land in `results_default`: Postgres will
+    not carve a partition out of a default partition holding its rows.
+    Concurrent loads take turns through an advisory lock held until commit.
+    """
+    from sqlalchemy import text
+
+    parent = conn.execute(
+        text(
+            "SELECT c.relkind, n.nspname FROM pg_class c JOIN pg_namespace n ON n.oid ="
+            " c.relnamespace"
+            " WHERE c.oid = to_regclass('results')"
+        )
+    ).first()
+    if parent is None or parent[0] != "p":
+        return
+    partitions = text(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid"
+        " WHERE i.inhparent = to_regclass('results')"
+    )
+    wanted = {f"results_y{year:04d}": year for year in set(years)}
+    existing = {r[0] for r in conn.execute(partitions)}
+    if set(wanted) <= existing:
+        return
+    conn.execute(text(f"SELECT pg_advisory_xact_lock({PARTITION_LOCK_KEY})"))
+    # another load may have created them while we waited
+    existing = {r[0] for r in conn.execute(partitions)}
+    for name, year in sorted(wanted.items()):
+        if name not in existing:
             conn.execute(
-                text("INSERT INTO results (date, total_amount) VALUES (:date, :total_amount)"),
-                {"date": d, "total_amount": amt},
+                text(
+                    f'CREATE TABLE IF NOT EXISTS "{parent[1]}".{name}'
+                    " PARTITION OF results"
+                    f" FOR VALUES FROM ('{year:04d}-01-01') TO ('{year + 1:04d}-01-01')"
+                )
+            )
+            logger.info("Created partition %s of results", name)
+
+
+def _conflict_clause(mode: str, dialect: str | None) -> str:
+    """ON CONFLICT clause for mode.
+
+    Stats columns missing from the insert are NULL in EXCLUDED.
+    """
+    if mode == "insert":
+        return ""
+    if mode == "add":
+        least, greatest = (
+            ("MIN", "MAX") if dialect == "sqlite" else ("LEAST", "GREATEST")
+        )
+        # combined stats are only known when both sides carry them
+        known = "results.row_count IS NOT NULL AND EXCLUDED.row_count IS NOT NULL"
+        return (
+            " ON CONFLICT (date) DO UPDATE"
+            " SET total_amount = results.total_amount + EXCLUDED.total_amount,"
+            " row_count = results.row_count + EXCLUDED.row_count,"
+            f" min_amount = CASE WHEN {known} THEN {least}(results.min_amount,"
+            " EXCLUDED.min_amount) END,"
+            f" max_amount = CASE WHEN {known} THEN {greatest}(results.max_amount,"
+            " EXCLUDED.max_amount) END,"
+            # * 1.0 keeps sqlite from doing integer division on whole amounts
+            f" mean_amount = CASE WHEN {known} THEN (results.total_amount +"
+            " EXCLUDED.total_amount) * 1.0"
+            " / (results.row_count + EXCLUDED.row_count) END"
+        )
+    # only rewrite rows whose values actually changed
+    distinct = "IS NOT" if dialect == "sqlite" else "IS DISTINCT FROM"
+    columns = ("total_amount",) + STATS_COLUMNS
+    return (
+        " ON CONFLICT (date) DO UPDATE SET "
+        + ", ".join(f"{c} = EXCLUDED.{c}" for c in columns)
+        + " WHERE "
+        + " OR ".join(f"results.{c} {distinct} EXCLUDED.{c}" for c in columns)
+    )
+
+
+def _validated(
+    rows: Iterable[Dict[str, Any]], metrics: RunMetrics, extra: Tuple[str, ...] = ()
+) -> Iterator[Tuple[Any, ...]]:
+    """Yield (date, total_amount, *extra columns) tuples that pass the sanity checks."""
+    for r in rows:
+        d = r.get("date")
+        amt = r.get("total_amount")
+
+        # --- HARD SANITY CHECK ---
+        if not isinstance(d, (datetime.date, datetime.datetime)):
+            metrics.reject("load", "invalid_date", value=d)
+            continue
+        if not isinstance(amt, Number):
+            metrics.reject("load", "invalid_amount", value=amt)
+            continue
+        # -------------------------
+
+        yield (d, amt, *(r.get(c) for c in extra))
+
+
+def _batches(
+    pairs: Iterable[Tuple[Any, ...]], size: int
+) -> Iterator[List[Tuple[Any, ...]]]:
+    batch: List[Tuple[Any, ...]] = []
+    for p in pairs:
+        batch.append(p)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def supports_copy(conn) -> bool:
+    """COPY FROM STDIN is only reachable through a psycopg2 DBAPI connection."""
+    return getattr(getattr(conn, "dialect", None), "driver", None) == "psycopg2"
+
+
+def _copy_batch(
+    conn, batch: List[Tuple[Any, ...]], mode: str, columns: Tuple[str, ...]
+) -> None:
+    from sqlalchemy import text
+
+    buf = io.StringIO()
+    writer = csv.writer(buf, lineterminator="\n")
+    for d, *rest in batch:
+        writer.writerow((d.isoformat(), *rest))
+    buf.seek(0)
+    # COPY cannot resolve conflicts itself, so upserts go through a staging table
+    target = "results" if mode == "insert" else "results_load"
+    # raw psycopg2 cursor on the connection owned by the current transaction
+    cur = conn.connection.cursor()
+    try:
+        cur.copy_expert(
+            f"COPY {target} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buf
+        )
+    finally:
+        cur.close()
+    if mode != "insert":
+        conn.execute(
+            text(
+                "INSERT INTO results (date, total_amount, row_count, min_amount,"
+                " max_amount, mean_amount)"
+                " SELECT date, SUM(total_amount), SUM(row_count), MIN(min_amount),"
+                " MAX(max_amount),"
+                " SUM(total_amount) / NULLIF(SUM(row_count), 0)"
+                # date order, so concurrent loads lock their rows in the same order
+                " FROM results_load GROUP BY date ORDER BY date"
+                + _conflict_clause(mode, "postgresql")
             )
-            inserted += 1
-    logger.info("Inserted %d aggregated rows", inserted)
+        )
+        conn.execute(text("TRUNCATE results_load"))
+
+
+def _insert_batch(
+    conn, batch: List[Tuple[Any, ...]], mode: str, columns: Tuple[str, ...]
+) -> None:
+    from sqlalchemy import Date, Integer, Numeric, bindparam, text
+
+    types = {"date": Date, "row_count": Integer}
+    values = ", ".join(
+        "(" + ", ".join(f":{c}{i}" for c in columns) + ")" for i in range(len(batch))
+    )
+    params: Dict[str, Any] = {}
+    for i, row in enumerate(batch):
+        for c, v in zip(columns, row):
+            params[f"{c}{i}"] = v
+    # typed binds so drivers without native DATE/Decimal support (sqlite) cope
+    sql = (
+        f"INSERT INTO results ({', '.join(columns)}) VALUES {values}"
+        + _conflict_clause(mode, _dialect_name(conn))
+    )
+    stmt = text(sql).bindparams(
+        *(
+            bindparam(f"{c}{i}", type_=types.get(c, Numeric)())
+            for i in range(len(batch))
+            for c in columns
+        )
+    )
+    conn.execute(stmt, params)
+
+
+def write_aggregates(
+    conn,
+    rows: Iterable[Dict[str, Any]],
+    mode: str = "upsert",
+    batch_size: int | None = None,
+    metrics: RunMetrics | None = None,
+    *,
+    months: Set[datetime.date] | None = None,
+    years: Set[int] | None = None,
+) -> int:
+    """Write aggregate rows on an open connection/transaction.
+
+    Uses COPY FROM STDIN on psycopg2 and batched multi-row INSERT elsewhere.
+    `mode` is one of LOAD_MODES. When the first row carries `row_count`, the
+    STATS_COLUMNS are written as well; otherwise they are left NULL. The
+    monthly and yearly rollups of the dates written are refreshed on the
+    same transaction, unless `months` is given: then the first days of the
+    months written are added to it, for the caller to refresh once after
+    its last write. Partitions of the years in `years` are taken to exist,
+    and years whose partitions were created are added to it. Returns the
+    number of rows written.
+    """
+    if mode not in LOAD_MODES:
+        raise ValueError(f"unknown load mode: {mode}")
+    rows = iter(rows)
+    first = next(rows, None)
+    if first is None:
+        return 0
+    extra = STATS_COLUMNS if "row_count" in first else ()
+    columns = ("date", "total_amount") + extra
+    rows = itertools.chain([first], rows)
+    use_copy = supports_copy(conn)
+    write = _copy_batch if use_copy else _insert_batch
+    size = batch_size or (COPY_BATCH_SIZE if use_copy else INSERT_BATCH_SIZE)
+    if use_copy and mode != "insert":
+        from sqlalchemy import text
+
+        conn.execute(
+            text(
+                "CREATE TEMP TABLE IF NOT EXISTS results_load (date DATE, total_amount"
+                " NUMERIC,"
+                " row_count BIGINT, min_amount NUMERIC, max_amount NUMERIC, mean_amount"
+                " NUMERIC) ON COMMIT DROP"
+            )
+        )
+    own_metrics = metrics is None
+    if metrics is None:
+        metrics = RunMetrics()
+    dialect = _dialect_name(conn)
+    refresh = months is None
+    months = set() if months is None else months
+    years = set() if years is None else years
+    written = 0
+    with metrics.timed("load"):
+        for batch in _batches(_validated(rows, metrics, extra), size):
+            days = {
+                d.date() if isinstance(d, datetime.datetime) else d for d, *_ in batch
+            }
+            batch_years = {d.year for d in days}
+            if dialect == "postgresql" and not years.issuperset(batch_years):
+                ensure_partitions(conn, batch_years - years)
+                years.update(batch_years)
+            write(conn, batch, mode, columns)
+            written += len(batch)
+            months.update(d.replace(day=1) for d in days)
+        if refresh:
+            refresh_rollups(conn, months, dialect)
+    metrics.count("load", written, written)
+    if own_metrics:
+        # nobody else will report the rows rejected here
+        metrics.rejects.report()
+    return written
+
+
+def insert_aggregates(
+    engine,
+    rows,
+    mode: str = "upsert",
+    batch_size: int | None = None,
+    metrics: RunMetrics | None = None,
+    years: Set[int] | None = None,
+) -> int:
+    with engine.begin() as conn:
+        inserted = write_aggregates(
+            conn, rows, mode=mode, batch_size=batch_size, metrics=metrics, years=years
+        )
+    logger.info("Inserted %d aggregated rows (mode=%s)", inserted, mode)
     return inserted
 
 
+def prepare_partitions(engine, rows: Iterable[Dict[str, Any]]) -> Set[int]:
+    """Create the partitions `rows` need in a short transaction of their own.
+
+    Creating a partition locks all of `results`; done up front, a load never
+    does it while holding row locks that a concurrent load (e.g. another
+    shard) waits on. Returns the years prepared, to pass on to the load.
+    """
+    if _dialect_name(engine) != "postgresql":
+        return set()
+    years = {
+        r["date"].year
+        for r in rows
+        if isinstance(r.get("date"), (datetime.date, datetime.datetime))
+    }
+    if years:
+        with engine.begin() as conn:
+            ensure_partitions(conn, years)
+    return years
+
 
-def load_from_aggregates(database_url: str | None, aggregates) -> int:
+def load_from_aggregates(
+    database_url: str | None,
+    aggregates,
+    mode: str = "upsert",
+    batch_size: int | None = None,
+    metrics: RunMetrics | None = None,
+) -> int:
     engine = get_engine(database_url)
     ensure_table(engine)
-    return insert_aggregates(engine, aggregates)
+    years = (
+        prepare_partitions(engine, aggregates) if isinstance(aggregates, list) else None
+    )
+    return insert_aggregates(
+        engine,
+        aggregates,
+        mode=mode,
+        batch_size=batch_size,
+        metrics=metrics,
+        years=years,
+    )
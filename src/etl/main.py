@@ -2,52 +2,1172 @@
 from __future__ import annotations
 
 import argparse
+import datetime
+import functools
 import os
-from typing import List
+import time
+from typing import TYPE_CHECKING, List, Tuple
 
 from .config import load_config
-from .extract import read_csv_folder
-from .transform import normalize_date, aggregate
-from .load import load_from_aggregates
+from .extract import READERS, list_csv_files
+from .spill import SpillingAggregator
+from .load import LOAD_MODES
 from .logger import get_logger
+from .metrics import RunMetrics, peak_rss_bytes, format_bytes
+from .pipeline import COMMIT_MODES
+from .shard import Shard, check_shard
+
+if TYPE_CHECKING:
+    from .manifest import FileEntry
 
 logger = get_logger(__name__)
 
+ENGINES = ("row", "columnar")
+PROFILE_TOP = 25
+
+
+def resolve_database_url(database_url: str | None = None) -> str:
+    cfg = load_config()
+    return database_url or os.getenv("DATABASE_URL") or cfg.database_url
+
+
+def log_stage_summary(metrics: RunMetrics) -> None:
+    metrics.rejects.report()
+    for name, st in metrics.stages.items():
+        if not st.rows_in and not st.wall_seconds:
+            continue
+        logger.info(
+            "Stage %-9s in=%d out=%d rejected=%d wall=%.3fs cpu=%.3fs (%.0f rows/sec)",
+            name,
+            st.rows_in,
+            st.rows_out,
+            sum(st.rejected.values()),
+            st.wall_seconds,
+            st.cpu_seconds,
+            st.rows_per_sec or 0.0,
+        )
+
+
+def run_incremental(
+    input_folder: str,
+    database_url: str | None = None,
+    *,
+    workers: int = 1,
+    batch_size: int | None = None,
+    metrics: RunMetrics | None = None,
+    reader: str = "csv",
+    shard: Shard | None = None,
+) -> int:
+    """Load only files that are new or changed since the last run.
+
+    With `shard`, only the files assigned to it (see `etl.shard`). Returns
+    number of per-date rows written.
+    """
+    from .db import get_engine
+    from .load import ensure_table
+    from .manifest import ensure_manifest_table, load_incremental
+
+    logger.info("Starting incremental ETL on %s", input_folder)
+    engine = get_engine(resolve_database_url(database_url))
+    ensure_table(engine)
+    ensure_manifest_table(engine)
+    if metrics is None:
+        metrics = RunMetrics()
+    files, written = load_incremental(
+        engine,
+        input_folder,
+        workers=workers,
+        batch_size=batch_size,
+        metrics=metrics,
+        reader=reader,
+        shard=shard,
+    )
+    log_stage_summary(metrics)
+    logger.info("ETL finished, files=%d, written=%d", files, written)
+    return written
+
+
+def run_watch(
+    input_folder: str,
+    database_url: str | None = None,
+    *,
+    interval: float | None = None,
+    max_files: int | None = None,
+    settle: float | None = None,
+    max_attempts: int | None = None,
+    workers: int = 1,
+    batch_size: int | None = None,
+    metrics: RunMetrics | None = None,
+    reader: str = "csv",
+    shard: Shard | None = None,
+) -> int:
+    """Keep loading new files as they arrive until SIGTERM or SIGINT.
+
+    The engine is built once, so every micro-batch reuses its warm pool.
+    Returns number of per-date rows written.
+    """
+    import signal
+    import threading
+
+    from .db import get_engine
+    from .load import ensure_table
+    from .manifest import ensure_manifest_table
+    from .watch import DEFAULT_INTERVAL, DEFAULT_MAX_ATTEMPTS, DEFAULT_SETTLE, Watcher
+
+    engine = get_engine(resolve_database_url(database_url))
+    ensure_table(engine)
+    ensure_manifest_table(engine)
+    watcher = Watcher(
+        engine,
+        input_folder,
+        max_files=max_files,
+        settle=DEFAULT_SETTLE if settle is None else settle,
+        max_attempts=DEFAULT_MAX_ATTEMPTS if max_attempts is None else max_attempts,
+        workers=workers,
+        batch_size=batch_size,
+        reader=reader,
+        metrics=metrics,
+        shard=shard,
+    )
+    stop = threading.Event()
+
+    def request_stop(signum, frame) -> None:
+        logger.info(
+            "Received %s; finishing the current micro-batch",
+            signal.Signals(signum).name,
+        )
+        stop.set()
+
+    previous = {
+        sig: signal.signal(sig, request_stop) for sig in (signal.SIGTERM, signal.SIGINT)
+    }
+    try:
+        files, written = watcher.run(
+            stop, DEFAULT_INTERVAL if interval is None else interval
+        )
+    finally:
+        for sig, handler in previous.items():
+            signal.signal(sig, handler)
+        engine.dispose()
+    log_stage_summary(watcher.metrics)
+    logger.info("ETL finished, files=%d, written=%d", files, written)
+    return written
+
+
+def check_options(
+    *,
+    dry_run: bool = False,
+    load_mode: str = "upsert",
+    workers: int = 1,
+    engine: str = "row",
+    reader: str = "csv",
+    pipeline: bool = False,
+    cache_dir: str | None = None,
+    stats: bool = False,
+    exact: bool = False,
+    memory_budget: int | None = None,
+    checkpoint: str | None = None,
+    pushdown: bool = False,
+    shard: Shard | None = None,
+    dedup: bool = False,
+    dedup_max_bytes: int | None = None,
+    dedup_bloom: bool = False,
+    incremental: bool = False,
+    watch: bool = False,
+) -> None:
+    """Raise ValueError when options that do not go together are combined.
 
-def run(input_folder: str, dry_run: bool = False, database_url: str | None = None) -> int:
+    `run` and the CLI share these checks, so messages name the CLI options.
+    """
+    if shard is not None:
+        check_shard(shard)
+    row = engine == "row"
+    serial = workers <= 1
+    sharded = shard is not None
+    # (refused combination, message), checked in order
+    rules = [
+        (
+            incremental and dry_run,
+            "--incremental needs the database and cannot be combined with --dry-run",
+        ),
+        (
+            pipeline and (dry_run or incremental),
+            "--pipeline writes as it goes and cannot be combined with --dry-run"
+            " or --incremental",
+        ),
+        (
+            engine == "columnar" and not serial,
+            "--engine columnar runs in a single process and cannot be combined"
+            " with --workers",
+        ),
+        (
+            sharded and load_mode != "add" and not dry_run,
+            "shards add their partial totals to results; --load-mode must be add",
+        ),
+        (
+            sharded and (pipeline or memory_budget),
+            "sharded runs load their totals in date order and cannot be combined"
+            " with --pipeline or --memory-budget",
+        ),
+        (
+            cache_dir and (not serial or pipeline or incremental),
+            "--cache-dir cannot be combined with --workers, --pipeline"
+            " or --incremental",
+        ),
+        (
+            stats and (not row or pipeline or cache_dir or incremental),
+            "--stats needs the row engine and cannot be combined with --pipeline,"
+            " --cache-dir or --incremental",
+        ),
+        (
+            exact
+            and (
+                not row
+                or pipeline
+                or cache_dir
+                or stats
+                or memory_budget
+                or incremental
+            ),
+            "--exact needs the row engine and cannot be combined with --pipeline,"
+            " --cache-dir, --stats, --memory-budget or --incremental",
+        ),
+        (
+            memory_budget
+            and (
+                not row or not serial or pipeline or cache_dir or stats or incremental
+            ),
+            "--memory-budget applies to the serial row engine only",
+        ),
+        (
+            checkpoint
+            and (not row or pipeline or cache_dir or memory_budget or incremental),
+            "--checkpoint needs the row engine and cannot be combined with"
+            " --pipeline, --cache-dir, --memory-budget or --incremental",
+        ),
+        (
+            (dedup_max_bytes or dedup_bloom) and not dedup,
+            "--dedup-memory and --dedup-bloom go with --dedup",
+        ),
+        (
+            dedup
+            and (
+                not row
+                or reader != "csv"
+                or not serial
+                or pipeline
+                or cache_dir
+                or checkpoint
+                or pushdown
+                or incremental
+                or watch
+                or sharded
+            ),
+            "--dedup needs the serial row engine with the csv reader and cannot be"
+            " combined with --pipeline, --cache-dir, --checkpoint, --pushdown,"
+            " --incremental, --watch or shards",
+        ),
+        (
+            watch
+            and (
+                dry_run
+                or incremental
+                or pipeline
+                or not row
+                or cache_dir
+                or stats
+                or exact
+                or memory_budget
+                or checkpoint
+            ),
+            "--watch loads like --incremental and takes only --workers, --reader"
+            " and --batch-size",
+        ),
+        (
+            pushdown
+            and (
+                dry_run
+                or incremental
+                or watch
+                or pipeline
+                or not row
+                or not serial
+                or cache_dir
+                or stats
+                or exact
+                or memory_budget
+                or checkpoint
+            ),
+            "--pushdown aggregates in the database and takes only --reader,"
+            " --load-mode and --batch-size",
+        ),
+    ]
+    for refused, message in rules:
+        if refused:
+            raise ValueError(message)
+
+
+def run(
+    input_folder: str,
+    dry_run: bool = False,
+    database_url: str | None = None,
+    *,
+    load_mode: str = "upsert",
+    batch_size: int | None = None,
+    workers: int = 1,
+    engine: str = "row",
+    metrics: RunMetrics | None = None,
+    pipeline: bool = False,
+    commit: str = "single",
+    queue_depth: int | None = None,
+    reader: str = "csv",
+    cache_dir: str | None = None,
+    cache_max_bytes: int | None = None,
+    stats: bool = False,
+    memory_budget: int | None = None,
+    exact: bool = False,
+    checkpoint: str | None = None,
+    resume: bool = False,
+    checkpoint_interval: float | None = None,
+    pushdown: bool = False,
+    shard: Shard | None = None,
+    dedup: bool = False,
+    dedup_max_bytes: int | None = None,
+    dedup_bloom: bool = False,
+) -> int:
     """Run the ETL: extract, transform, aggregate, load.
 
-    Returns number of inserted rows (0 if dry-run).
+    Per-stage timings and row counts are recorded in `metrics` when given.
+    With `pipeline`, per-file partials are loaded while later files are still
+    being read (see `etl.pipeline`). With `cache_dir`, parsed files are read
+    from the column cache (see `etl.cache`). With `stats`, row_count, min,
+    max and mean per date are computed in the same pass and loaded next to
+    the totals. With `memory_budget` (bytes), groups beyond the budget are
+    spilled to temp files (see `etl.spill`). With `exact`, amounts are summed
+    as scaled integers and loaded as exact decimals. With `checkpoint` (a
+    path), progress is saved every `checkpoint_interval` seconds and, with
+    `resume`, a crashed run continues from it (see `etl.checkpoint`). With
+    `pushdown`, raw rows are staged and aggregated by the database (see
+    `etl.pushdown`). With `shard` (index, count), only the files assigned to
+    that shard are read and their totals added to `results` (see
+    `etl.shard`). With `dedup`, rows identical to one seen earlier in the
+    run are dropped before they are aggregated, keeping fingerprints within
+    `dedup_max_bytes` and, with `dedup_bloom`, going on approximately once
+    that is full (see `etl.dedup`). Options that do not go together raise
+    ValueError (see `check_options`). Returns number of inserted rows (0 if
+    dry-run).
     """
-    logger.info("Starting ETL on %s (dry_run=%s)", input_folder, dry_run)
-    rows = []
-    for r in read_csv_folder(input_folder):
-        try:
-            r2 = normalize_date(r)
-            rows.append(r2)
-        except Exception as exc:
-            logger.warning("Skipping row due to transform error: %s", exc)
+    if metrics is None:
+        metrics = RunMetrics()
+    engine, cache_dir = _available(engine, cache_dir)
+    check_options(
+        dry_run=dry_run,
+        load_mode=load_mode,
+        workers=workers,
+        engine=engine,
+        reader=reader,
+        pipeline=pipeline,
+        cache_dir=cache_dir,
+        stats=stats,
+        exact=exact,
+        memory_budget=memory_budget,
+        checkpoint=checkpoint,
+        pushdown=pushdown,
+        shard=shard,
+        dedup=dedup,
+        dedup_max_bytes=dedup_max_bytes,
+        dedup_bloom=dedup_bloom,
+    )
+    if shard is not None:
+        logger.info(
+            "Starting ETL on %s, shard %d of %d (dry_run=%s)",
+            input_folder,
+            shard[0],
+            shard[1],
+            dry_run,
+        )
+    else:
+        logger.info("Starting ETL on %s (dry_run=%s)", input_folder, dry_run)
+    entries = None if dry_run else _input_entries(input_folder, shard)
+    if pushdown:
+        return _run_pushdown(
+            input_folder,
+            database_url,
+            load_mode=load_mode,
+            batch_size=batch_size,
+            metrics=metrics,
+            reader=reader,
+            shard=shard,
+            entries=entries,
+        )
+    if pipeline:
+        return _run_pipelined(
+            input_folder,
+            database_url,
+            load_mode=load_mode,
+            batch_size=batch_size,
+            workers=workers,
+            engine=engine,
+            metrics=metrics,
+            commit=commit,
+            queue_depth=queue_depth,
+            reader=reader,
+            entries=entries,
+        )
 
-    aggregates = aggregate(rows, group_by="date", value_field="amount")
-    logger.info("Aggregated into %d groups", len(aggregates))
+    started = time.perf_counter()
+    agg, seen = _aggregate(
+        input_folder,
+        workers=workers,
+        engine=engine,
+        metrics=metrics,
+        reader=reader,
+        cache_dir=cache_dir,
+        cache_max_bytes=cache_max_bytes,
+        stats=stats,
+        memory_budget=memory_budget,
+        exact=exact,
+        checkpoint=checkpoint,
+        resume=resume,
+        checkpoint_interval=checkpoint_interval,
+        shard=shard,
+        dedup=dedup,
+        dedup_max_bytes=dedup_max_bytes,
+        dedup_bloom=dedup_bloom,
+    )
+    elapsed = time.perf_counter() - started
+    logger.info(
+        "Streamed %d rows in %.2fs (%.0f rows/sec, peak RSS %s)",
+        seen,
+        elapsed,
+        seen / elapsed if elapsed > 0 else 0.0,
+        format_bytes(peak_rss_bytes()),
+    )
 
-    if dry_run:
-        logger.info("Dry run - would insert: %s", aggregates)
-        return 0
+    if isinstance(agg, SpillingAggregator):
+        # stream the groups back in first-seen order instead of listing them
+        agg.finish()
+        aggregates = agg.iter_results()
+    else:
+        aggregates = agg.results()
+    metrics.stage("aggregate").rows_out = len(agg)
+    logger.info("Aggregated into %d groups", len(agg))
 
-    cfg = load_config()
-    database_url = database_url or os.getenv("DATABASE_URL") or cfg.database_url
-    inserted = load_from_aggregates(database_url, [{"date": a["date"], "total_amount": a[f"total_amount"]} for a in aggregates])
+    try:
+        if dry_run:
+            log_stage_summary(metrics)
+            if isinstance(agg, SpillingAggregator):
+                logger.info("Dry run - would insert %d groups", len(agg))
+            else:
+                logger.info("Dry run - would insert: %s", aggregates)
+            return 0
+        inserted = _load_aggregates(
+            aggregates,
+            database_url,
+            load_mode=load_mode,
+            batch_size=batch_size,
+            metrics=metrics,
+            shard=shard,
+            entries=entries,
+        )
+        if checkpoint:
+            # a crash between the commit above and this removal makes --resume
+            # load the same totals again, which only --load-mode add notices
+            from .checkpoint import remove_checkpoint
+
+            remove_checkpoint(checkpoint)
+    finally:
+        if isinstance(agg, SpillingAggregator):
+            agg.close()
+    log_stage_summary(metrics)
+    logger.info("ETL finished, inserted=%d", inserted)
+    return inserted
+
+
+def _available(engine: str, cache_dir: str | None) -> Tuple[str, str | None]:
+    """The engine and column cache to use: without NumPy, neither is columnar."""
+    if engine == "columnar":
+        from . import columnar
+
+        if not columnar.available():
+            logger.warning("NumPy is not installed; falling back to the row engine")
+            engine = "row"
+    if cache_dir is not None:
+        from . import cache
+
+        if not cache.available():
+            logger.warning("NumPy is not installed; running without the column cache")
+            cache_dir = None
+    return engine, cache_dir
+
+
+def _aggregate(
+    input_folder: str,
+    *,
+    workers: int,
+    engine: str,
+    metrics: RunMetrics,
+    reader: str,
+    cache_dir: str | None,
+    cache_max_bytes: int | None,
+    stats: bool,
+    memory_budget: int | None,
+    exact: bool,
+    checkpoint: str | None,
+    resume: bool,
+    checkpoint_interval: float | None,
+    shard: Shard | None,
+    dedup: bool,
+    dedup_max_bytes: int | None,
+    dedup_bloom: bool,
+):
+    """Aggregate the input with the engine the options ask for: (agg, rows read)."""
+    if checkpoint:
+        from .checkpoint import DEFAULT_INTERVAL, aggregate_checkpointed
+
+        if checkpoint_interval is None:
+            checkpoint_interval = DEFAULT_INTERVAL
+        return aggregate_checkpointed(
+            input_folder,
+            checkpoint,
+            resume=resume,
+            interval=checkpoint_interval,
+            workers=workers,
+            reader=reader,
+            stats=stats,
+            exact=exact,
+            metrics=metrics,
+            shard=shard,
+        )
+    if cache_dir is not None:
+        from . import cache
+
+        max_bytes = cache_max_bytes or cache.DEFAULT_MAX_BYTES
+        column_cache = cache.ColumnCache(cache_dir, max_bytes=max_bytes)
+        return cache.aggregate_cached(
+            input_folder, column_cache, metrics=metrics, shard=shard
+        )
+    if engine == "columnar":
+        from . import columnar
+
+        return columnar.aggregate_folder_columnar(
+            input_folder, metrics=metrics, shard=shard
+        )
+    if workers > 1:
+        from .parallel import aggregate_folder_parallel
+
+        return aggregate_folder_parallel(
+            input_folder,
+            workers,
+            metrics=metrics,
+            reader=reader,
+            stats=stats,
+            exact=exact,
+            shard=shard,
+        )
+    deduper = None
+    if dedup:
+        from .dedup import DEFAULT_MAX_BYTES, Deduper
+
+        deduper = Deduper(dedup_max_bytes or DEFAULT_MAX_BYTES, bloom=dedup_bloom)
+    return _aggregate_serial(
+        input_folder,
+        metrics=metrics,
+        reader=reader,
+        stats=stats,
+        memory_budget=memory_budget,
+        exact=exact,
+        shard=shard,
+        deduper=deduper,
+    )
+
+
+def _aggregate_serial(
+    input_folder: str,
+    *,
+    metrics: RunMetrics,
+    reader: str,
+    stats: bool,
+    memory_budget: int | None,
+    exact: bool,
+    shard: Shard | None,
+    deduper=None,
+):
+    from .parallel import fold_file, new_aggregator
+
+    # rows stream straight from the reader into the aggregator, so memory
+    # is bounded by the number of groups rather than the number of rows
+    if memory_budget:
+        agg = SpillingAggregator(
+            group_by="date", value_field="amount", memory_budget=memory_budget
+        )
+    else:
+        agg = new_aggregator(stats, exact)
+    files = list_csv_files(input_folder, shard)
+    if not files:
+        logger.info("No CSV files found in %s", input_folder)
+    if deduper is not None:
+        from .dedup import estimate_rows
+
+        deduper.plan(estimate_rows(files))
+        with metrics.timed("dedup"):
+            deduper.scan(files)
+    seen = 0
+    for f in files:
+        seen += fold_file(f, agg, reader, metrics, dedup=deduper)
+    if deduper is not None:
+        deduper.close()
+        deduper.report(metrics)
+    return agg, seen
+
+
+def _load_aggregates(
+    aggregates,
+    database_url: str | None,
+    *,
+    load_mode: str,
+    batch_size: int | None,
+    metrics: RunMetrics,
+    shard: Shard | None,
+    entries: List[FileEntry] | None,
+) -> int:
+    from .db import get_engine
+    from .load import ensure_table, prepare_partitions, write_aggregates
+    from .manifest import record_full_run
+
+    db = get_engine(resolve_database_url(database_url))
+    ensure_table(db)
+    # normalize_date yields ISO strings; the loader expects real dates
+    rows = (dict(a, date=datetime.date.fromisoformat(a["date"])) for a in aggregates)
+    years = None
+    if shard is not None:
+        # every shard locks the dates it adds to in the same order, so they
+        # cannot deadlock; partitions are created up front, so the load does
+        # not lock all of results while holding row locks
+        rows = sorted(rows, key=lambda r: r["date"])
+        years = prepare_partitions(db, rows)
+    with db.begin() as conn:
+        inserted = write_aggregates(
+            conn,
+            rows,
+            mode=load_mode,
+            batch_size=batch_size,
+            metrics=metrics,
+            years=years,
+        )
+        record_full_run(conn, entries)
+    logger.info("Inserted %d aggregated rows (mode=%s)", inserted, load_mode)
+    return inserted
+
+
+def _run_pipelined(
+    input_folder: str,
+    database_url: str | None,
+    *,
+    load_mode: str,
+    batch_size: int | None,
+    workers: int,
+    engine: str,
+    metrics: RunMetrics,
+    commit: str,
+    queue_depth: int | None,
+    reader: str,
+    entries: List[FileEntry] | None,
+) -> int:
+    from .db import get_engine
+    from .load import ensure_table
+    from .manifest import record_full_run
+    from .pipeline import QUEUE_DEPTH, iter_file_partials, load_pipelined
+
+    db = get_engine(resolve_database_url(database_url))
+    ensure_table(db)
+    started = time.perf_counter()
+    seen, groups, inserted = load_pipelined(
+        db,
+        iter_file_partials(
+            input_folder, workers=workers, engine=engine, metrics=metrics, reader=reader
+        ),
+        mode=load_mode,
+        batch_size=batch_size,
+        commit=commit,
+        queue_depth=queue_depth or QUEUE_DEPTH,
+        metrics=metrics,
+        before_commit=functools.partial(record_full_run, entries=entries),
+    )
+    elapsed = time.perf_counter() - started
+    metrics.stage("aggregate").rows_out = groups
+    logger.info(
+        "Pipelined %d rows into %d groups in %.2fs (%.0f rows/sec, peak RSS %s)",
+        seen,
+        groups,
+        elapsed,
+        seen / elapsed if elapsed > 0 else 0.0,
+        format_bytes(peak_rss_bytes()),
+    )
+    log_stage_summary(metrics)
+    logger.info("ETL finished, inserted=%d", inserted)
+    return inserted
+
+
+def _input_entries(input_folder: str, shard: Shard | None) -> List[FileEntry]:
+    """The files a full run is about to read, for `manifest.record_full_run`."""
+    from .manifest import stat_files
+
+    # recorded with the totals, so incremental runs can follow this one
+    return stat_files(list_csv_files(input_folder, shard))
+
+
+def _run_pushdown(
+    input_folder: str,
+    database_url: str | None,
+    *,
+    load_mode: str,
+    batch_size: int | None,
+    metrics: RunMetrics,
+    reader: str,
+    shard: Shard | None,
+    entries: List[FileEntry] | None,
+) -> int:
+    from .db import get_engine
+    from .load import ensure_table
+    from .manifest import record_full_run
+    from .pushdown import load_pushdown
+
+    db = get_engine(resolve_database_url(database_url))
+    ensure_table(db)
+    started = time.perf_counter()
+    staged, inserted = load_pushdown(
+        db,
+        input_folder,
+        mode=load_mode,
+        batch_size=batch_size,
+        metrics=metrics,
+        reader=reader,
+        shard=shard,
+        before_commit=functools.partial(record_full_run, entries=entries),
+    )
+    elapsed = time.perf_counter() - started
+    logger.info(
+        "Staged %d rows in %.2fs (%.0f rows/sec, peak RSS %s)",
+        staged,
+        elapsed,
+        staged / elapsed if elapsed > 0 else 0.0,
+        format_bytes(peak_rss_bytes()),
+    )
+    log_stage_summary(metrics)
     logger.info("ETL finished, inserted=%d", inserted)
     return inserted
 
 
 def main(argv: List[str] | None = None) -> None:
+    parser = _parser()
+    args = parser.parse_args(argv)
+    shard = _check_args(parser, args)
+    metrics = RunMetrics()
+    job = _job(args, metrics, shard)
+    if args.quarantine:
+        # a resumed run keeps the rows quarantined before the crash
+        metrics.quarantine(args.quarantine, append=args.resume)
+    try:
+        if args.profile:
+            _profiled(job, args.profile)
+        else:
+            job()
+    finally:
+        metrics.rejects.close()
+    if args.metrics_json:
+        metrics.write_json(args.metrics_json)
+    if args.metrics_prom:
+        metrics.write_prometheus(args.metrics_prom)
+
+
+def _parser() -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser(prog="etl")
     parser.add_argument("--input", "-i", default=os.getenv("INPUT_FOLDER", "/data"))
     parser.add_argument("--dry-run", action="store_true", dest="dry_run")
-    args = parser.parse_args(argv)
-    run(args.input, dry_run=args.dry_run)
+    parser.add_argument(
+        "--load-mode",
+        choices=LOAD_MODES,
+        default=None,
+        help="insert appends; upsert replaces totals per date (idempotent, the"
+        " default); add sums into stored totals (the default with --shard-count)",
+    )
+    parser.add_argument(
+        "--batch-size", type=int, default=None, help="rows per load round trip"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="worker processes that pre-aggregate files in parallel",
+    )
+    parser.add_argument(
+        "--engine",
+        choices=ENGINES,
+        default="row",
+        help="row: pure-Python reference; columnar: NumPy chunked engine (falls back to"
+        " row without NumPy)",
+    )
+    parser.add_argument(
+        "--reader",
+        choices=READERS,
+        default="csv",
+        help="csv: DictReader reference; mmap: memory-mapped reader that only decodes"
+        " date and amount",
+    )
+    parser.add_argument(
+        "--stats",
+        action="store_true",
+        help="also compute row_count, min, max and mean per date in the same pass and"
+        " load them into results",
+    )
+    parser.add_argument(
+        "--exact",
+        action="store_true",
+        help="sum amounts as scaled integers and load exact decimal totals instead of"
+        " floats",
+    )
+    parser.add_argument(
+        "--memory-budget",
+        type=int,
+        default=None,
+        metavar="MB",
+        help="cap in-memory groups at roughly MB MiB and spill the rest to temp files"
+        " (serial row engine)",
+    )
+    parser.add_argument(
+        "--dedup",
+        action="store_true",
+        help="drop rows identical to one already read in this run (64-bit fingerprints;"
+        " serial row engine, csv reader)",
+    )
+    parser.add_argument(
+        "--dedup-memory",
+        type=int,
+        default=None,
+        metavar="MB",
+        help="with --dedup: memory for row fingerprints (default 512, which holds 33.5M"
+        " distinct rows; 16-32 bytes per row); larger inputs are deduplicated from"
+        " partitions on disk, reading the input twice",
+    )
+    parser.add_argument(
+        "--dedup-bloom",
+        action="store_true",
+        help="with --dedup: once half the memory is full, detect further duplicates"
+        " approximately with a Bloom filter (an overflow tier: runs that would push"
+        " its false-positive rate past 1%% fail before reading)",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        default=None,
+        metavar="DIR",
+        help="keep parsed, normalized columns of every input file here and reuse them"
+        " while the file is unchanged",
+    )
+    parser.add_argument(
+        "--cache-size-mb",
+        type=int,
+        default=None,
+        help="with --cache-dir: evict least recently used files above this size",
+    )
+    parser.add_argument(
+        "--checkpoint",
+        nargs="?",
+        const="etl.checkpoint",
+        default=None,
+        metavar="PATH",
+        help="save progress (files done, partial totals) to PATH (default"
+        " etl.checkpoint) while the run goes",
+    )
+    parser.add_argument(
+        "--checkpoint-interval",
+        type=float,
+        default=None,
+        metavar="SECONDS",
+        help="with --checkpoint: seconds between checkpoints (default 60)",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="continue from the checkpoint of a crashed run instead of starting over"
+        " (implies --checkpoint)",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="skip files already recorded in the etl_manifest table and add only the"
+        " deltas",
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="keep running and load new or changed files as they arrive, like"
+        " --incremental, until SIGTERM",
+    )
+    parser.add_argument(
+        "--watch-interval",
+        type=float,
+        default=None,
+        metavar="SECONDS",
+        help="with --watch: seconds between polls of the input folder, i.e. the added"
+        " latency (default 5)",
+    )
+    parser.add_argument(
+        "--watch-max-files",
+        type=int,
+        default=None,
+        metavar="N",
+        help="with --watch: files loaded per transaction; a larger backlog is loaded in"
+        " several commits",
+    )
+    parser.add_argument(
+        "--watch-settle",
+        type=float,
+        default=None,
+        metavar="SECONDS",
+        help="with --watch: skip files modified less than this long ago, as they may"
+        " still be written (default 2)",
+    )
+    parser.add_argument(
+        "--watch-max-attempts",
+        type=int,
+        default=None,
+        metavar="N",
+        help="with --watch: skip a file that failed to load N times until it changes"
+        " (default 3)",
+    )
+    parser.add_argument(
+        "--pushdown",
+        action="store_true",
+        help="COPY validated raw rows into a temporary staging table and let the"
+        " database do the GROUP BY",
+    )
+    parser.add_argument(
+        "--pipeline",
+        action="store_true",
+        help="load per-file results from a background thread while later files are"
+        " still being read",
+    )
+    parser.add_argument(
+        "--commit",
+        choices=COMMIT_MODES,
+        default="single",
+        help="with --pipeline: single transaction for the whole run, or one commit per"
+        " file",
+    )
+    parser.add_argument(
+        "--queue-depth",
+        type=int,
+        default=None,
+        help="with --pipeline: file results buffered ahead of the loader",
+    )
+    parser.add_argument(
+        "--shard-count",
+        type=int,
+        default=os.getenv("SHARD_COUNT"),
+        metavar="N",
+        help="split the input files among N processes by a hash of their name and add"
+        " this one's totals",
+    )
+    parser.add_argument(
+        "--shard-index",
+        type=int,
+        default=os.getenv("SHARD_INDEX"),
+        metavar="I",
+        help="with --shard-count: which shard (0 to N-1) this process reads",
+    )
+    parser.add_argument(
+        "--quarantine",
+        default=None,
+        metavar="PATH",
+        help="write rejected rows (file, row, stage, reason, value) to PATH, as CSV for"
+        " a .csv suffix else JSON Lines",
+    )
+    parser.add_argument(
+        "--metrics-json",
+        default=None,
+        metavar="PATH",
+        help="write per-stage metrics as JSON",
+    )
+    parser.add_argument(
+        "--metrics-prom",
+        default=None,
+        metavar="PATH",
+        help="write per-stage metrics as a Prometheus textfile (node exporter textfile"
+        " collector)",
+    )
+    parser.add_argument(
+        "--profile",
+        nargs="?",
+        const="etl.pstats",
+        default=None,
+        metavar="PATH",
+        help="run under cProfile, dump stats to PATH (default etl.pstats) and log the"
+        " top functions",
+    )
+    return parser
+
+
+def _check_args(
+    parser: argparse.ArgumentParser, args: argparse.Namespace
+) -> Shard | None:
+    """Fill in defaults that depend on other options and refuse bad combinations.
+
+    Returns the shard this process reads, if any.
+    """
+    shard = None
+    if args.shard_count is not None or args.shard_index is not None:
+        if args.shard_count is None or args.shard_index is None:
+            parser.error("--shard-index and --shard-count go together")
+        shard = (args.shard_index, args.shard_count)
+    if args.load_mode is None:
+        args.load_mode = "add" if shard is not None else "upsert"
+    if args.resume and not args.checkpoint:
+        args.checkpoint = "etl.checkpoint"
+    if shard is not None and args.checkpoint == "etl.checkpoint":
+        # shards started from one directory must not share a checkpoint
+        args.checkpoint = f"etl.shard-{shard[0]}-of-{shard[1]}.checkpoint"
+    try:
+        check_options(
+            dry_run=args.dry_run,
+            load_mode=args.load_mode,
+            workers=args.workers,
+            engine=args.engine,
+            reader=args.reader,
+            pipeline=args.pipeline,
+            cache_dir=args.cache_dir,
+            stats=args.stats,
+            exact=args.exact,
+            memory_budget=_mib(args.memory_budget),
+            checkpoint=args.checkpoint,
+            pushdown=args.pushdown,
+            shard=shard,
+            dedup=args.dedup,
+            dedup_max_bytes=_mib(args.dedup_memory),
+            dedup_bloom=args.dedup_bloom,
+            incremental=args.incremental,
+            watch=args.watch,
+        )
+    except ValueError as exc:
+        parser.error(str(exc))
+    if args.dedup and args.dedup_bloom:
+        from .dedup import DEFAULT_MAX_BYTES, Deduper, estimate_rows
+
+        # inputs too large for the Bloom filter are refused now, rather than
+        # when its false-positive rate climbs hours into the run; without it,
+        # any input is deduplicated exactly, on disk if need be
+        deduper = Deduper(
+            _mib(args.dedup_memory) or DEFAULT_MAX_BYTES, bloom=args.dedup_bloom
+        )
+        try:
+            deduper.plan(estimate_rows(list_csv_files(args.input)))
+        except ValueError as exc:
+            parser.error(f"--dedup: {exc}")
+    if args.incremental or args.watch:
+        _check_manifest(parser, "--watch" if args.watch else "--incremental")
+    return shard
+
+
+def _check_manifest(parser: argparse.ArgumentParser, option: str) -> None:
+    """Refuse incremental loads over totals the manifest does not record."""
+    from .db import get_engine
+    from .load import ensure_table
+    from .manifest import ensure_manifest_table, load_manifest
+
+    db = get_engine(resolve_database_url())
+    try:
+        ensure_table(db)
+        ensure_manifest_table(db)
+        with db.connect() as conn:
+            load_manifest(conn)
+    except ValueError as exc:
+        parser.error(f"{option}: {exc}")
+    finally:
+        db.dispose()
+
+
+def _mib(mb: int | None) -> int | None:
+    return mb * 1024 * 1024 if mb else None
+
+
+def _job(args: argparse.Namespace, metrics: RunMetrics, shard: Shard | None):
+    """The run the arguments ask for, as a call taking no arguments."""
+    if args.watch:
+        return functools.partial(
+            run_watch,
+            args.input,
+            interval=args.watch_interval,
+            max_files=args.watch_max_files,
+            settle=args.watch_settle,
+            max_attempts=args.watch_max_attempts,
+            workers=args.workers,
+            batch_size=args.batch_size,
+            metrics=metrics,
+            reader=args.reader,
+            shard=shard,
+        )
+    if args.incremental:
+        return functools.partial(
+            run_incremental,
+            args.input,
+            workers=args.workers,
+            batch_size=args.batch_size,
+            metrics=metrics,
+            reader=args.reader,
+            shard=shard,
+        )
+    return functools.partial(
+        run,
+        args.input,
+        dry_run=args.dry_run,
+        load_mode=args.load_mode,
+        batch_size=args.batch_size,
+        workers=args.workers,
+        engine=args.engine,
+        metrics=metrics,
+        pipeline=args.pipeline,
+        commit=args.commit,
+        queue_depth=args.queue_depth,
+        reader=args.reader,
+        cache_dir=args.cache_dir,
+        cache_max_bytes=_mib(args.cache_size_mb),
+        stats=args.stats,
+        memory_budget=_mib(args.memory_budget),
+        exact=args.exact,
+        checkpoint=args.checkpoint,
+        resume=args.resume,
+        checkpoint_interval=args.checkpoint_interval,
+        pushdown=args.pushdown,
+        shard=shard,
+        dedup=args.dedup,
+        dedup_max_bytes=_mib(args.dedup_memory),
+        dedup_bloom=args.dedup_bloom,
+    )
+
+
+def _profiled(job, path: str) -> None:
+    """Run job under cProfile, dump the stats to path and log the hot spots.
+
+    Only this process is profiled; with --workers the worker processes are not.
+    """
+    import cProfile
+    import io
+    import pstats
+
+    profiler = cProfile.Profile()
+    try:
+        profiler.runcall(job)
+    finally:
+        profiler.dump_stats(path)
+        out = io.StringIO()
+        pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(
+            PROFILE_TOP
+        )
+        logger.info(
+            "Profile written to %s (inspect with python -m pstats)\n%s",
+            path,
+            out.getvalue(),
+        )
 
 
 if __name__ == "__main__":
@@ -0,0 +1,352 @@
+"""Processed-file manifest for incremental runs.
+
+Every loaded file is recorded in `etl_manifest` with its size, mtime, a
+content hash and the per-date totals it contributed. Later runs skip files
+whose size and mtime are unchanged (or whose content hash still matches), and
+only the difference between a changed file's new and old totals is added to
+`results`.
+
+Entries are keyed by the file's name, which is its path relative to the
+input folder and the key `etl.shard` hashes, so a shard moved to another
+host, or a host mounting the folder elsewhere, still finds them. Entries of
+older versions, keyed by absolute path, are read under their name and
+rewritten under it when the file is next recorded.
+
+Files that disappear from the input folder keep their contribution: the
+manifest tracks an append-only archive, not a mirror of the folder.
+
+Full runs record the files they read (size and mtime, taken before they
+are read) in the same transaction as their totals, so incremental runs can
+follow a full rescan. They do not keep per-file totals, so a file changed
+after a full run loaded it cannot be loaded as a delta: incremental runs
+skip it with a warning until the next full run. Incremental runs refuse to
+start when `results` holds rows but the manifest is empty (a full run from
+before full runs were recorded): adding every file again would count it
+twice.
+"""
+from __future__ import annotations
+
+import datetime
+import json
+import math
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterable, List, Set, Tuple
+
+from sqlalchemy import text
+
+from .extract import file_hash, list_csv_files
+from .load import _dialect_name, prepare_partitions, write_aggregates
+from .logger import get_logger
+from .metrics import RunMetrics
+from .parallel import aggregate_files
+from .shard import Shard
+
+logger = get_logger(__name__)
+
+
+MANIFEST_SQL = """
+CREATE TABLE IF NOT EXISTS etl_manifest (
+  path TEXT PRIMARY KEY,
+  size BIGINT NOT NULL,
+  mtime_ns BIGINT NOT NULL,
+  content_hash TEXT NOT NULL,
+  totals TEXT NOT NULL,
+  processed_at TIMESTAMPTZ DEFAULT NOW()
+);
+"""
+
+SQLITE_MANIFEST_SQL = """
+CREATE TABLE IF NOT EXISTS etl_manifest (
+  path TEXT PRIMARY KEY,
+  size BIGINT NOT NULL,
+  mtime_ns BIGINT NOT NULL,
+  content_hash TEXT NOT NULL,
+  totals TEXT NOT NULL,
+  processed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+"""
+
+# per-date totals of a changed file closer than this to the recorded ones are
+# unchanged; summing the same values in another order can move the last bits
+DELTA_REL_TOL = 1e-9
+DELTA_ABS_TOL = 1e-9
+
+
+@dataclass
+class FileEntry:
+    # the file's key (see `file_key`)
+    path: str
+    size: int
+    mtime_ns: int
+    content_hash: str
+    # {iso date: total} contributed by this file when it was last loaded;
+    # None when a full run loaded it, which does not keep per-file totals
+    totals: Dict[str, float] | None = field(default_factory=dict)
+    # where this run reads the file from; not stored
+    source: str | None = field(default=None, compare=False, repr=False)
+
+
+def file_key(path: str | Path) -> str:
+    """Manifest key of a file: its path relative to the input folder."""
+    return Path(path).name
+
+
+def ensure_manifest_table(engine) -> None:
+    sqlite = getattr(getattr(engine, "dialect", None), "name", None) == "sqlite"
+    with engine.begin() as conn:
+        conn.execute(text(SQLITE_MANIFEST_SQL if sqlite else MANIFEST_SQL))
+
+
+class Manifest:
+    """The set of already processed files, as stored in `etl_manifest`."""
+
+    def __init__(
+        self,
+        entries: Dict[str, FileEntry] | None = None,
+        legacy: Dict[str, str] | None = None,
+    ) -> None:
+        self.entries = entries or {}
+        # stored absolute path of entries written by older versions, per key
+        self.legacy = legacy or {}
+        # files changed since a full run loaded them, warned about once
+        self.stale: Set[str] = set()
+
+    @classmethod
+    def load(cls, conn) -> "Manifest":
+        rows = conn.execute(
+            text(
+                "SELECT path, size, mtime_ns, content_hash, totals FROM etl_manifest"
+                " ORDER BY processed_at"
+            )
+        ).all()
+        entries: Dict[str, FileEntry] = {}
+        legacy: Dict[str, str] = {}
+        for r in rows:
+            key = file_key(r[0])
+            if key != r[0]:
+                legacy[key] = r[0]
+            # the latest entry wins if an old and a new key name the same file
+            entries[key] = FileEntry(key, r[1], r[2], r[3], json.loads(r[4]))
+        return cls(entries, legacy)
+
+    def changed_files(
+        self, files: Iterable[Path], limit: int | None = None
+    ) -> Tuple[List[FileEntry], List[FileEntry]]:
+        """Split files into (new or changed, touched but identical).
+
+        Size and mtime are checked first; the content is only hashed when
+        they differ from the manifest, so unchanged files cost one stat().
+        Files changed since a full run loaded them are left out, since their
+        delta is unknown. With `limit`, stops once that many changed files
+        were found.
+        """
+        changed: List[FileEntry] = []
+        touched: List[FileEntry] = []
+        for f in files:
+            if limit is not None and len(changed) >= limit:
+                break
+            key = file_key(f)
+            st = Path(f).stat()
+            prev = self.entries.get(key)
+            if (
+                prev is not None
+                and prev.size == st.st_size
+                and prev.mtime_ns == st.st_mtime_ns
+            ):
+                continue
+            if prev is not None and prev.totals is None:
+                if key not in self.stale:
+                    self.stale.add(key)
+                    logger.warning(
+                        "%s changed since a full run loaded it; skipping it until"
+                        " the next full run reloads it",
+                        key,
+                    )
+                continue
+            digest = file_hash(f)
+            if prev is not None and prev.content_hash == digest:
+                touched.append(
+                    FileEntry(key, st.st_size, st.st_mtime_ns, digest, prev.totals)
+                )
+                continue
+            changed.append(
+                FileEntry(key, st.st_size, st.st_mtime_ns, digest, source=str(f))
+            )
+        return changed, touched
+
+    def delta(self, entry: FileEntry) -> Dict[str, float]:
+        """Per-date change in totals if `entry` replaces its previous version.
+
+        Dates the previous version already contributed with the same total,
+        up to float rounding, are left out, so they are not rewritten.
+        """
+        out = dict(entry.totals)
+        prev = self.entries.get(entry.path)
+        if prev is not None:
+            for k, v in prev.totals.items():
+                new = out.get(k, 0.0)
+                if math.isclose(new, v, rel_tol=DELTA_REL_TOL, abs_tol=DELTA_ABS_TOL):
+                    out.pop(k, None)
+                else:
+                    out[k] = new - v
+        return out
+
+    def save(self, conn, entries: Iterable[FileEntry]) -> int:
+        """Upsert entries on an open transaction. Returns rows written."""
+        saved = 0
+        for e in entries:
+            old = self.legacy.pop(e.path, None)
+            if old is not None:
+                conn.execute(
+                    text("DELETE FROM etl_manifest WHERE path = :path"), {"path": old}
+                )
+            conn.execute(
+                text(
+                    "INSERT INTO etl_manifest (path, size, mtime_ns, content_hash,"
+                    " totals)"
+                    " VALUES (:path, :size, :mtime_ns, :content_hash, :totals)"
+                    " ON CONFLICT (path) DO UPDATE SET size = EXCLUDED.size,"
+                    " mtime_ns = EXCLUDED.mtime_ns, content_hash ="
+                    " EXCLUDED.content_hash,"
+                    " totals = EXCLUDED.totals, processed_at = CURRENT_TIMESTAMP"
+                ),
+                {
+                    "path": e.path,
+                    "size": e.size,
+                    "mtime_ns": e.mtime_ns,
+                    "content_hash": e.content_hash,
+                    "totals": json.dumps(e.totals),
+                },
+            )
+            self.entries[e.path] = e
+            self.stale.discard(e.path)
+            saved += 1
+        return saved
+
+
+def load_manifest(conn) -> Manifest:
+    """The manifest, once `results` is known to hold no totals it misses.
+
+    Raises ValueError when the manifest is empty but `results` is not: a
+    full run from before full runs were recorded loaded those totals, and an
+    incremental run would add them again.
+    """
+    manifest = Manifest.load(conn)
+    if (
+        not manifest.entries
+        and conn.execute(text("SELECT 1 FROM results LIMIT 1")).first() is not None
+    ):
+        raise ValueError(
+            "results holds totals that etl_manifest does not record, so an"
+            " incremental run would add those files again; run a full run over"
+            " the input folder first (it records the files it loads), or start"
+            " from an empty results table"
+        )
+    return manifest
+
+
+def stat_files(files: Iterable[Path]) -> List[FileEntry]:
+    """Entries for files a full run is about to read, without per-file totals.
+
+    Taken before the files are read: a file that grows while it is read is
+    seen as changed by the next incremental run rather than as loaded.
+    """
+    entries = []
+    for f in files:
+        st = Path(f).stat()
+        entries.append(FileEntry(file_key(f), st.st_size, st.st_mtime_ns, "", None))
+    return entries
+
+
+def record_full_run(conn, entries: Iterable[FileEntry]) -> int:
+    """Record the files a full run loaded, on the load's open transaction.
+
+    Entries of unchanged files keep their per-file totals. Returns rows
+    written.
+    """
+    sqlite = _dialect_name(conn) == "sqlite"
+    conn.execute(text(SQLITE_MANIFEST_SQL if sqlite else MANIFEST_SQL))
+    manifest = Manifest.load(conn)
+    fresh = []
+    for e in entries:
+        prev = manifest.entries.get(e.path)
+        if prev is None or (prev.size, prev.mtime_ns) != (e.size, e.mtime_ns):
+            fresh.append(e)
+    saved = manifest.save(conn, fresh)
+    logger.info("Recorded %d files of the full run in etl_manifest", saved)
+    return saved
+
+
+def load_incremental(
+    engine,
+    folder: str | Path,
+    workers: int = 1,
+    batch_size: int | None = None,
+    metrics: RunMetrics | None = None,
+    reader: str = "csv",
+    shard: Shard | None = None,
+) -> Tuple[int, int]:
+    """Aggregate only new or changed files (of `shard`); add their deltas to `results`.
+
+    The totals and the manifest are written in one transaction, so a failed
+    run leaves both untouched. Raises ValueError when `results` holds totals
+    of a full run. Returns (files processed, rows written).
+    """
+    with engine.connect() as conn:
+        manifest = load_manifest(conn)
+    files = list_csv_files(folder, shard)
+    changed, touched = manifest.changed_files(files)
+    logger.info(
+        "Manifest: %d files, %d new or changed, %d touched but identical",
+        len(files),
+        len(changed),
+        len(touched),
+    )
+
+    written = load_changed(
+        engine, manifest, changed, touched, workers, batch_size, metrics, reader
+    )
+    return len(changed), written
+
+
+def load_changed(
+    engine,
+    manifest: Manifest,
+    changed: List[FileEntry],
+    touched: List[FileEntry],
+    workers: int = 1,
+    batch_size: int | None = None,
+    metrics: RunMetrics | None = None,
+    reader: str = "csv",
+) -> int:
+    """Aggregate `changed`, add their deltas and record them and `touched`.
+
+    The totals and the manifest are written in one transaction. Returns rows
+    written.
+    """
+    deltas: Dict[str, float] = {}
+    quarantine = metrics is not None and metrics.rejects.keep
+    partials = aggregate_files(
+        [e.source or e.path for e in changed], workers, reader, quarantine=quarantine
+    )
+    for entry, (partial, _, worker_metrics) in zip(changed, partials):
+        entry.totals = partial.totals
+        if metrics is not None:
+            metrics.merge(worker_metrics)
+        for k, v in manifest.delta(entry).items():
+            deltas[k] = deltas.get(k, 0.0) + v
+
+    # date order, so concurrent loads (e.g. shards) lock their rows in the same order
+    rows = [
+        {"date": datetime.date.fromisoformat(k), "total_amount": v}
+        for k, v in sorted(deltas.items())
+    ]
+    years = prepare_partitions(engine, rows)
+    with engine.begin() as conn:
+        written = write_aggregates(
+            conn, rows, mode="add", batch_size=batch_size, metrics=metrics, years=years
+        )
+        manifest.save(conn, changed + touched)
+    logger.info("Added %d per-date deltas from %d files", written, len(changed))
+    return written
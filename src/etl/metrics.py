@@ -0,0 +1,234 @@
+"""Lightweight runtime metrics for ETL runs (throughput, memory, rejects).
+
+`RunMetrics` collects per-stage wall time, CPU time, rows in/out, rejected
+rows by reason, peak RSS and the size of bounded in-memory structures (e.g.
+the dedup fingerprints), and can be written as a JSON summary or a
+Prometheus textfile for the node exporter's textfile collector. Rejected
+rows are also tracked per input file in a `RejectLog` (see
+`etl.quarantine`).
+"""
+from __future__ import annotations
+
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, Optional
+
+from .quarantine import QuarantineFile, RejectLog
+
+STAGES = ("extract", "transform", "aggregate", "load")
+
+
+def peak_rss_bytes() -> Optional[int]:
+    """Return the peak resident set size of this process in bytes.
+
+    Returns None on platforms without the `resource` module (e.g. Windows).
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in bytes on macOS and in kilobytes on Linux
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def format_bytes(n: Optional[int]) -> str:
+    if n is None:
+        return "n/a"
+    return f"{n / (1024 * 1024):.1f} MiB"
+
+
+@dataclass
+class StageMetrics:
+    wall_seconds: float = 0.0
+    cpu_seconds: float = 0.0
+    rows_in: int = 0
+    rows_out: int = 0
+    rejected: Dict[str, int] = field(default_factory=dict)
+    peak_rss_bytes: Optional[int] = None
+
+    @property
+    def rows_per_sec(self) -> Optional[float]:
+        return self.rows_in / self.wall_seconds if self.wall_seconds > 0 else None
+
+    def merge(self, other: "StageMetrics") -> None:
+        self.wall_seconds += other.wall_seconds
+        self.cpu_seconds += other.cpu_seconds
+        self.rows_in += other.rows_in
+        self.rows_out += other.rows_out
+        for reason, n in other.rejected.items():
+            self.rejected[reason] = self.rejected.get(reason, 0) + n
+        if other.peak_rss_bytes is not None:
+            self.peak_rss_bytes = max(self.peak_rss_bytes or 0, other.peak_rss_bytes)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "wall_seconds": round(self.wall_seconds, 6),
+            "cpu_seconds": round(self.cpu_seconds, 6),
+            "rows_in": self.rows_in,
+            "rows_out": self.rows_out,
+            "rows_rejected": dict(self.rejected),
+            "rows_per_sec": round(self.rows_per_sec, 1)
+            if self.rows_per_sec is not None
+            else None,
+            "peak_rss_bytes": self.peak_rss_bytes,
+        }
+
+
+class RunMetrics:
+    """Per-stage metrics for one run.
+
+    Stages that run in worker processes report their own RunMetrics, which
+    are merged into the parent's; their times are then summed over workers.
+    With `quarantine`, rejected rows are kept for a quarantine file.
+    """
+
+    def __init__(self, quarantine: bool = False) -> None:
+        self.stages: Dict[str, StageMetrics] = {name: StageMetrics() for name in STAGES}
+        self.rejects = RejectLog(keep=quarantine)
+        # bytes held by bounded in-memory structures, by name
+        self.memory: Dict[str, int] = {}
+
+    def stage(self, name: str) -> StageMetrics:
+        st = self.stages.get(name)
+        if st is None:
+            st = self.stages[name] = StageMetrics()
+        return st
+
+    @contextmanager
+    def timed(self, name: str) -> Iterator[StageMetrics]:
+        st = self.stage(name)
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield st
+        finally:
+            st.wall_seconds += time.perf_counter() - wall
+            st.cpu_seconds += time.process_time() - cpu
+            st.peak_rss_bytes = peak_rss_bytes()
+
+    def count(self, name: str, rows_in: int, rows_out: int) -> None:
+        st = self.stage(name)
+        st.rows_in += rows_in
+        st.rows_out += rows_out
+
+    def reject(
+        self,
+        name: str,
+        reason: str,
+        n: int = 1,
+        source: str | None = None,
+        row: int | None = None,
+        value: Any = None,
+    ) -> None:
+        """Record rejected input rows; they count towards the stage's rows_in.
+
+        `source` (file name), `row` and `value` locate a single rejected row
+        for the reject log and the quarantine file.
+        """
+        st = self.stage(name)
+        st.rows_in += n
+        st.rejected[reason] = st.rejected.get(reason, 0) + n
+        self.rejects.add(source, row, name, reason, value, n)
+
+    def quarantine(self, path: str, append: bool = False) -> None:
+        """Write rejected rows to path (CSV or JSON Lines) from now on."""
+        self.rejects.keep = True
+        self.rejects.sink = QuarantineFile(path, append=append)
+
+    def merge(self, other: "RunMetrics", row_offset: int = 0) -> "RunMetrics":
+        """Fold in another run's metrics; see `RejectLog.merge` for `row_offset`."""
+        for name, st in other.stages.items():
+            self.stage(name).merge(st)
+        self.rejects.merge(other.rejects, row_offset)
+        for name, n in other.memory.items():
+            self.memory[name] = max(self.memory.get(name, 0), n)
+        return self
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "peak_rss_bytes": peak_rss_bytes(),
+            "memory_bytes": dict(self.memory),
+            "stages": {name: st.to_dict() for name, st in self.stages.items()},
+        }
+
+    def write_json(self, path: str) -> None:
+        _atomic_write(path, json.dumps(self.to_dict(), indent=2) + "\n")
+
+    def write_prometheus(self, path: str) -> None:
+        """Write a textfile for the node exporter's textfile collector."""
+        gauges = (
+            (
+                "etl_stage_wall_seconds",
+                "Wall time spent in the stage during the last run.",
+                "wall_seconds",
+            ),
+            (
+                "etl_stage_cpu_seconds",
+                "CPU time spent in the stage during the last run.",
+                "cpu_seconds",
+            ),
+            (
+                "etl_stage_rows_in",
+                "Rows that entered the stage during the last run.",
+                "rows_in",
+            ),
+            (
+                "etl_stage_rows_out",
+                "Rows the stage produced during the last run.",
+                "rows_out",
+            ),
+            (
+                "etl_stage_rows_per_second",
+                "Stage throughput (rows_in / wall time).",
+                "rows_per_sec",
+            ),
+            (
+                "etl_stage_peak_rss_bytes",
+                "Process peak RSS at the end of the stage.",
+                "peak_rss_bytes",
+            ),
+        )
+        lines = []
+        for metric, help_text, attr in gauges:
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} gauge")
+            for name, st in self.stages.items():
+                value = getattr(st, attr)
+                if value is not None:
+                    lines.append(f'{metric}{{stage="{name}"}} {value}')
+        lines.append(
+            "# HELP etl_stage_rows_rejected Rows rejected by the stage during the last"
+            " run."
+        )
+        lines.append("# TYPE etl_stage_rows_rejected gauge")
+        for name, st in self.stages.items():
+            for reason, n in sorted(st.rejected.items()):
+                lines.append(
+                    f'etl_stage_rows_rejected{{stage="{name}",reason="{reason}"}} {n}'
+                )
+        if self.memory:
+            lines.append(
+                "# HELP etl_memory_bytes Bytes held by a bounded in-memory structure"
+                " during the last run."
+            )
+            lines.append("# TYPE etl_memory_bytes gauge")
+            for name, n in sorted(self.memory.items()):
+                lines.append(f'etl_memory_bytes{{structure="{name}"}} {n}')
+        lines.append(
+            "# HELP etl_last_run_timestamp_seconds Unix time the last run finished."
+        )
+        lines.append("# TYPE etl_last_run_timestamp_seconds gauge")
+        lines.append(f"etl_last_run_timestamp_seconds {time.time():.3f}")
+        _atomic_write(path, "\n".join(lines) + "\n")
+
+
+def _atomic_write(path: str, content: str) -> None:
+    # write-then-rename so collectors never read a half-written file
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf8") as fh:
+        fh.write(content)
+    os.replace(tmp, path)
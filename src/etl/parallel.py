@@ -0,0 +1,345 @@
+"""Multi-process map/reduce extraction.
+
+Workers read, normalize and pre-aggregate whole CSV files or
+newline-aligned byte ranges of a single large file; only the small
+`Aggregator` partials, one entry per group, cross the process boundary.
+Float sums depend on the order values are added in, so merged totals may
+differ from a serial run's in the last bits; byte ranges are summed with
+compensation, which keeps them within about one rounding of the exact sum
+of each range.
+
+Byte-range splitting assumes records do not contain quoted newlines, which
+holds for the feeds this pipeline ingests. `multiprocessing` is only
+imported once a pool is started, since serial runs use this module too.
+"""
+from __future__ import annotations
+
+import csv
+import io
+import os
+from array import array
+from functools import partial
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from .compressed import is_compressed
+from .dedup import Deduper
+from .extract import iter_rows, list_csv_files, read_csv_file, read_projected_file
+from .logger import get_logger
+from .metrics import RunMetrics
+from .shard import Shard
+from .transform import (
+    Aggregator,
+    FixedPointAggregator,
+    StatsAggregator,
+    fold_pairs,
+    fold_rows,
+)
+
+logger = get_logger(__name__)
+
+# files are only split when every range would get at least this many bytes
+MIN_RANGE_BYTES = 64 * 1024 * 1024
+
+# (path, byte range or None for the whole file, header fieldnames)
+Task = Tuple[str, Optional[Tuple[int, int]], Optional[List[str]]]
+
+
+def new_aggregator(
+    stats: bool = False, exact: bool = False
+) -> Aggregator | StatsAggregator | FixedPointAggregator:
+    """Per-date sums, plus count/min/max/mean with `stats`, or exact with `exact`."""
+    if stats:
+        return StatsAggregator(group_by="date", value_field="amount")
+    if exact:
+        return FixedPointAggregator(group_by="date", value_field="amount")
+    return Aggregator(group_by="date", value_field="amount")
+
+
+def fold_file(
+    path: Path,
+    agg: Aggregator,
+    reader: str = "csv",
+    metrics: RunMetrics | None = None,
+    dedup: Deduper | None = None,
+) -> int:
+    """Fold one CSV file into agg with `reader` (one of `extract.READERS`).
+
+    Rejected rows are recorded with the file's name and row numbers. With
+    `dedup` (csv reader only: it fingerprints whole rows), rows seen before
+    are dropped. Returns rows consumed.
+    """
+    skipped = array("q")
+    if reader == "mmap":
+        pairs = read_projected_file(path, metrics=metrics, on_bad=skipped.append)
+        return fold_pairs(
+            pairs, agg, metrics=metrics, source=path.name, skipped=skipped
+        )
+    rows = read_csv_file(path, metrics=metrics, on_bad=skipped.append)
+    return fold_rows(
+        rows, agg, metrics=metrics, source=path.name, skipped=skipped, dedup=dedup
+    )
+
+
+def aggregate_file(
+    path: str,
+    reader: str = "csv",
+    stats: bool = False,
+    exact: bool = False,
+    quarantine: bool = False,
+) -> Tuple[Aggregator, int, RunMetrics]:
+    """Worker: aggregate one CSV file. Returns (partial, rows consumed, metrics).
+
+    With `quarantine`, the metrics carry the rejected rows back, spilled to
+    a temp file beyond `quarantine.FLUSH_ROWS`.
+    """
+    agg = new_aggregator(stats, exact)
+    metrics = RunMetrics(quarantine=quarantine)
+    seen = fold_file(Path(path), agg, reader, metrics)
+    return agg, seen, metrics
+
+
+def aggregate_files(
+    paths: List[str],
+    workers: int = 1,
+    reader: str = "csv",
+    stats: bool = False,
+    exact: bool = False,
+    quarantine: bool = False,
+) -> Iterator[Tuple[Aggregator, int, RunMetrics]]:
+    """Yield (partial, rows consumed, metrics) for each file, in order.
+
+    Files are spread over `workers` processes when workers > 1.
+    """
+    if workers <= 1 or len(paths) <= 1:
+        for p in paths:
+            yield aggregate_file(p, reader, stats, exact, quarantine)
+        return
+    from concurrent.futures import ProcessPoolExecutor
+
+    with ProcessPoolExecutor(max_workers=min(workers, len(paths))) as pool:
+        task = partial(
+            aggregate_file,
+            reader=reader,
+            stats=stats,
+            exact=exact,
+            quarantine=quarantine,
+        )
+        yield from pool.map(task, paths)
+
+
+def split_byte_ranges(
+    path: str | Path, parts: int
+) -> Tuple[List[str], List[Tuple[int, int]]]:
+    """Split the data section of a CSV file into newline-aligned byte ranges.
+
+    Returns (header fieldnames, [(start, end), ...]) covering every byte after
+    the header line exactly once.
+    """
+    with open(path, "rb") as fh:
+        header = fh.readline()
+        data_start = fh.tell()
+        size = os.fstat(fh.fileno()).st_size
+        bounds = [data_start]
+        for k in range(1, parts):
+            target = data_start + (size - data_start) * k // parts
+            if target <= bounds[-1]:
+                continue
+            # step back one byte so a target sitting on a line start is kept
+            fh.seek(target - 1)
+            fh.readline()
+            pos = fh.tell()
+            if pos >= size:
+                break
+            if pos > bounds[-1]:
+                bounds.append(pos)
+        bounds.append(size)
+    fieldnames = next(csv.reader([header.decode("utf8")]), [])
+    return fieldnames, [(a, b) for a, b in zip(bounds, bounds[1:]) if b > a]
+
+
+class _ByteRange(io.RawIOBase):
+    """Raw reader that stops at `end` in an already positioned binary file."""
+
+    def __init__(self, fh, end: int) -> None:
+        self._fh = fh
+        self._remaining = end - fh.tell()
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        if self._remaining <= 0:
+            return 0
+        n = self._fh.readinto(memoryview(b)[: self._remaining])
+        self._remaining -= n
+        return n
+
+
+class CompensatedAggregator(Aggregator):
+    """Aggregator keeping a Neumaier compensation term per group.
+
+    Byte-range partials are summed this way so that the rounding error of a
+    range does not grow with its row count; `partial` hands the parent plain
+    per-group totals, so only one float per group crosses the process
+    boundary.
+    """
+
+    def __init__(self, group_by: str = "date", value_field: str = "amount") -> None:
+        super().__init__(group_by, value_field)
+        self.compensation: Dict[Any, float] = {}
+
+    def add_value(self, key: Any, value: Any) -> bool:
+        try:
+            val = float(value)
+        except Exception:
+            return False
+        totals = self.totals
+        total = totals.get(key, 0.0)
+        new = total + val
+        if abs(total) >= abs(val):
+            error = (total - new) + val
+        else:
+            error = (val - new) + total
+        totals[key] = new
+        comp = self.compensation
+        comp[key] = comp.get(key, 0.0) + error
+        self.rows += 1
+        return True
+
+    def partial(self) -> Aggregator:
+        """A plain Aggregator holding the compensated total of every group."""
+        out = Aggregator(self.group_by, self.value_field)
+        comp = self.compensation
+        out.totals = {k: v + comp[k] for k, v in self.totals.items()}
+        out.rows = self.rows
+        return out
+
+
+def aggregate_range(
+    path: str,
+    start: int,
+    end: int,
+    fieldnames: List[str],
+    stats: bool = False,
+    exact: bool = False,
+    quarantine: bool = False,
+) -> Tuple[Aggregator, int, RunMetrics, array]:
+    """Worker: aggregate one byte range of a CSV file.
+
+    The worker does not know how many records precede its range, so rejects
+    carry range-relative row numbers for the parent to shift. Returns
+    (partial, rows consumed, metrics, bad row numbers); plain totals are
+    summed with compensation (see `CompensatedAggregator`).
+    """
+    if stats or exact:
+        agg = new_aggregator(stats, exact)
+    else:
+        agg = CompensatedAggregator()
+    metrics = RunMetrics(quarantine=quarantine)
+    bad = array("q")
+    name = Path(path).name
+    with open(path, "rb") as fh:
+        fh.seek(start)
+        text = io.TextIOWrapper(io.BufferedReader(_ByteRange(fh, end)), encoding="utf8")
+        reader = csv.DictReader(text, fieldnames=fieldnames)
+        rows = iter_rows(reader, name, on_bad=bad.append, metrics=metrics)
+        seen = fold_rows(rows, agg, metrics=metrics, source=name, skipped=bad)
+    if isinstance(agg, CompensatedAggregator):
+        agg = agg.partial()
+    return agg, seen, metrics, bad
+
+
+def _run_task(
+    task: Task,
+    reader: str = "csv",
+    stats: bool = False,
+    exact: bool = False,
+    quarantine: bool = False,
+):
+    path, byte_range, fieldnames = task
+    if byte_range is None:
+        return aggregate_file(path, reader, stats, exact, quarantine)
+    return aggregate_range(
+        path, byte_range[0], byte_range[1], fieldnames or [], stats, exact, quarantine
+    )
+
+
+def plan_tasks(
+    files: List[Path], workers: int, min_range_bytes: int = MIN_RANGE_BYTES
+) -> List[Task]:
+    """One task per file, with files large enough split into byte ranges.
+
+    Compressed files cannot be entered mid-stream and are never split.
+    """
+    tasks: List[Task] = []
+    for f in files:
+        parts = (
+            0
+            if is_compressed(f)
+            else min(workers, f.stat().st_size // max(min_range_bytes, 1))
+        )
+        if parts < 2:
+            tasks.append((str(f), None, None))
+            continue
+        fieldnames, ranges = split_byte_ranges(f, parts)
+        tasks.extend((str(f), r, fieldnames) for r in ranges)
+    return tasks
+
+
+def aggregate_folder_parallel(
+    folder: str | Path,
+    workers: int,
+    min_range_bytes: int = MIN_RANGE_BYTES,
+    metrics: RunMetrics | None = None,
+    reader: str = "csv",
+    stats: bool = False,
+    exact: bool = False,
+    shard: Shard | None = None,
+) -> Tuple[Aggregator, int]:
+    """Aggregate every CSV in folder (of `shard`) across `workers` processes.
+
+    Partials are merged in file and range order, so groups come out in the
+    same order as a serial run and rejected row numbers match a serial run.
+    Totals of groups spanning several files or ranges may differ from a
+    serial run's in the last bits (see the module docstring). Worker metrics
+    are merged into `metrics`. `reader` applies to whole-file tasks; byte
+    ranges always use the csv reader. With `stats`, workers build
+    StatsAggregator partials; with `exact`, FixedPointAggregator partials
+    whose merged totals are exact. When `metrics` keeps rejected rows for a
+    quarantine file, workers spill theirs to temp files that are copied into
+    it as partials are merged. Returns (merged aggregator, rows consumed).
+    """
+    files: List[Path] = list_csv_files(folder, shard)
+    result = new_aggregator(stats, exact)
+    if not files:
+        logger.info("No CSV files found in %s", folder)
+        return result, 0
+
+    tasks = plan_tasks(files, workers, min_range_bytes)
+    seen = 0
+    # records before the current range, per file, to renumber bad rows
+    offset = 0
+    current: str | None = None
+    quarantine = metrics is not None and metrics.rejects.keep
+    run_task = partial(
+        _run_task, reader=reader, stats=stats, exact=exact, quarantine=quarantine
+    )
+    from concurrent.futures import ProcessPoolExecutor
+
+    with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as pool:
+        for task, out in zip(tasks, pool.map(run_task, tasks)):
+            path, byte_range, _ = task
+            part, n, worker_metrics = out[0], out[1], out[2]
+            row_offset = 0
+            if byte_range is not None:
+                if path != current:
+                    current, offset = path, 0
+                row_offset = offset
+                offset += n + len(out[3])
+            if metrics is not None:
+                metrics.merge(worker_metrics, row_offset)
+            result.merge(part)
+            seen += n
+    logger.info("Merged %d partial aggregates from %d workers", len(tasks), workers)
+    return result, seen
@@ -0,0 +1,223 @@
+"""Pipelined mode: overlap extraction with loading.
+
+Files are aggregated one at a time (or by worker processes) while a loader
+thread writes the finished per-file partials to the database. A bounded
+queue between the two applies backpressure, so at most `queue_depth`
+partials wait in memory when the database is the bottleneck.
+
+The first time a date is written during a run it uses the requested load
+mode; later partials for the same date are added to it. With `commit="single"`
+everything is written in one transaction and the end result matches a
+staged run (up to float rounding, like `--workers`). With `commit="batch"`
+every partial is committed on its own: rows become visible sooner, but a
+failed run leaves the partials written so far in place.
+
+Either way the monthly and yearly rollups of every month written are
+refreshed once, at the end of the run: in the single transaction, or in a
+transaction of their own after the last batch (also when the run failed,
+so committed partials are not left out of them). `before_commit` runs on
+that last transaction too, but only when every partial was written.
+"""
+from __future__ import annotations
+
+import datetime
+import queue
+import threading
+from contextlib import ExitStack
+from pathlib import Path
+from typing import Any, Callable, Iterable, Iterator, Set, Tuple
+
+from .extract import list_csv_files
+from .load import _dialect_name, write_aggregates
+from .logger import get_logger
+from .metrics import RunMetrics
+from .parallel import aggregate_files
+from .rollup import refresh_rollups
+from .transform import Aggregator
+
+logger = get_logger(__name__)
+
+COMMIT_MODES = ("single", "batch")
+QUEUE_DEPTH = 4
+
+# how long a blocked put waits before re-checking that the loader is alive
+_PUT_POLL_SECONDS = 0.5
+_DONE = object()
+
+
+def iter_file_partials(
+    folder: str | Path,
+    workers: int = 1,
+    engine: str = "row",
+    metrics: RunMetrics | None = None,
+    reader: str = "csv",
+) -> Iterator[Tuple[Aggregator, int]]:
+    """Yield (partial, rows consumed) for every CSV in folder, in file order."""
+    if metrics is None:
+        metrics = RunMetrics()
+    paths = [str(f) for f in list_csv_files(folder)]
+    if not paths:
+        logger.info("No CSV files found in %s", folder)
+    if engine == "columnar":
+        from .columnar import aggregate_file_columnar
+
+        for p in paths:
+            yield aggregate_file_columnar(p, metrics=metrics)
+        return
+    for partial, seen, worker_metrics in aggregate_files(
+        paths, workers, reader, quarantine=metrics.rejects.keep
+    ):
+        metrics.merge(worker_metrics)
+        yield partial, seen
+
+
+class _Loader(threading.Thread):
+    """Consumes partials from a queue and writes them to the database."""
+
+    def __init__(
+        self,
+        engine,
+        q: "queue.Queue",
+        mode: str,
+        batch_size: int | None,
+        commit: str,
+        metrics: RunMetrics,
+        before_commit: Callable[[Any], None] | None = None,
+    ) -> None:
+        super().__init__(name="etl-loader", daemon=True)
+        self.engine = engine
+        self.queue = q
+        self.mode = mode
+        self.batch_size = batch_size
+        self.commit = commit
+        self.metrics = metrics
+        self.before_commit = before_commit
+        self.dates: Set[datetime.date] = set()
+        # months written and partition years checked, across all partials
+        self.months: Set[datetime.date] = set()
+        self.years: Set[int] = set()
+        self.written = 0
+        self.error: BaseException | None = None
+        self.abort = threading.Event()
+
+    def run(self) -> None:
+        try:
+            with ExitStack() as stack:
+                conn = (
+                    stack.enter_context(self.engine.begin())
+                    if self.commit == "single"
+                    else None
+                )
+                while True:
+                    item = self.queue.get()
+                    if self.abort.is_set():
+                        # leave the transaction through an exception so it rolls back
+                        raise RuntimeError("pipelined load aborted by the producer")
+                    if item is _DONE:
+                        break
+                    if conn is not None:
+                        self._write(conn, item)
+                    else:
+                        with self.engine.begin() as batch_conn:
+                            self._write(batch_conn, item)
+                if conn is not None:
+                    self._finish(conn)
+        except BaseException as exc:  # handed to the producer thread
+            self.error = exc
+            # drain so a producer blocked on put() can notice and stop
+            while True:
+                try:
+                    self.queue.get_nowait()
+                except queue.Empty:
+                    break
+        if self.commit == "batch" and (self.months or self.before_commit):
+            self._finish_batches()
+
+    def _finish_batches(self) -> None:
+        """Refresh the rollups of the months batches wrote, even after a failure."""
+        # months of a batch that rolled back are recomputed too, which is harmless
+        try:
+            with self.engine.begin() as conn:
+                self._finish(conn)
+        except BaseException as exc:
+            if self.error is None:
+                self.error = exc
+            else:
+                logger.exception(
+                    "Could not refresh the rollups of the partials committed"
+                )
+
+    def _finish(self, conn) -> None:
+        refresh_rollups(conn, self.months, _dialect_name(conn))
+        if self.error is None and self.before_commit is not None:
+            self.before_commit(conn)
+
+    def _write(self, conn, partial: Aggregator) -> None:
+        first, again = [], []
+        for key, total in partial.totals.items():
+            d = datetime.date.fromisoformat(key)
+            row = {"date": d, "total_amount": total}
+            if d in self.dates:
+                again.append(row)
+            else:
+                first.append(row)
+        opts = {
+            "batch_size": self.batch_size,
+            "metrics": self.metrics,
+            "months": self.months,
+            "years": self.years,
+        }
+        self.written += write_aggregates(conn, first, mode=self.mode, **opts)
+        self.written += write_aggregates(conn, again, mode="add", **opts)
+        self.dates.update(r["date"] for r in first)
+
+
+def load_pipelined(
+    engine,
+    partials: Iterable[Tuple[Aggregator, int]],
+    mode: str = "upsert",
+    batch_size: int | None = None,
+    commit: str = "single",
+    queue_depth: int = QUEUE_DEPTH,
+    metrics: RunMetrics | None = None,
+    before_commit: Callable[[Any], None] | None = None,
+) -> Tuple[int, int, int]:
+    """Write partials from a loader thread while they are still being produced.
+
+    `before_commit(conn)` is called on the last transaction of a successful
+    load, e.g. to record its files. Returns (rows consumed, distinct dates,
+    rows written).
+    """
+    if commit not in COMMIT_MODES:
+        raise ValueError(f"unknown commit mode: {commit}")
+    if metrics is None:
+        metrics = RunMetrics()
+    q: "queue.Queue" = queue.Queue(maxsize=max(queue_depth, 1))
+    loader = _Loader(engine, q, mode, batch_size, commit, metrics, before_commit)
+    loader.start()
+
+    def put(item) -> None:
+        while loader.is_alive():
+            try:
+                q.put(item, timeout=_PUT_POLL_SECONDS)
+                return
+            except queue.Full:
+                continue
+
+    seen = 0
+    try:
+        for partial, n in partials:
+            seen += n
+            put(partial)
+            if loader.error is not None:
+                break
+    except BaseException:
+        loader.abort.set()
+        put(_DONE)
+        loader.join()
+        raise
+    put(_DONE)
+    loader.join()
+    if loader.error is not None:
+        raise loader.error
+    return seen, len(loader.dates), loader.written
@@ -0,0 +1,228 @@
+"""SQL push-down mode: stage raw rows and aggregate inside the database.
+
+Rows are validated and date-normalized as usual, but instead of being
+summed in Python they are written to a `results_raw` staging table (COPY
+on psycopg2, batched INSERT elsewhere). A single `INSERT INTO results SELECT
+date, SUM(amount) ... GROUP BY date` then aggregates server side, in the
+same transaction that created the staging table, which also refreshes the
+monthly and yearly rollups of the dates staged.
+
+The staging table is a temporary table of the run's own session, dropped
+at commit (or rollback) on Postgres, so concurrent push-down runs, e.g.
+shards, stage in parallel without seeing or locking each other's rows, and
+nothing staged goes through the WAL. Amounts are staged as exact decimal
+text, so totals are what NUMERIC arithmetic gives, not float sums.
+"""
+from __future__ import annotations
+
+import csv
+import datetime
+import io
+from array import array
+from itertools import islice
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Sequence, Set, Tuple
+
+from sqlalchemy import Date, bindparam, text
+
+from .extract import list_csv_files, read_csv_file, read_projected_file
+from .load import (
+    COPY_BATCH_SIZE,
+    INSERT_BATCH_SIZE,
+    LOAD_MODES,
+    _batches,
+    _conflict_clause,
+    _dialect_name,
+    ensure_partitions,
+    supports_copy,
+)
+from .logger import get_logger
+from .metrics import RunMetrics
+from .quarantine import row_number
+from .rollup import refresh_rollups
+from .shard import Shard
+from .transform import FOLD_CHUNK_ROWS, DateNormalizer, parse_scaled
+
+logger = get_logger(__name__)
+
+RAW_TABLE_SQL = (
+    "CREATE TEMP TABLE results_raw (date DATE NOT NULL, amount NUMERIC NOT NULL)"
+    " ON COMMIT DROP"
+)
+# sqlite has no ON COMMIT DROP, and does not roll back CREATE under the driver's
+# implicit transactions, so a failed run's table is dropped by the next one
+SQLITE_RAW_TABLE_SQL = (
+    "CREATE TEMP TABLE results_raw (date DATE NOT NULL, amount NUMERIC NOT NULL)"
+)
+SQLITE_DROP_RAW_TABLE_SQL = "DROP TABLE IF EXISTS temp.results_raw"
+
+
+def stage_rows(
+    pairs: Iterable[Tuple[str, str]],
+    metrics: RunMetrics,
+    source: str | None = None,
+    skipped: Sequence[int] = (),
+) -> Iterator[Tuple[str, str]]:
+    """Yield (ISO date, amount text) for (raw date, raw amount) pairs that pass.
+
+    Rejects match `fold_pairs`; amounts are checked with `parse_scaled` and
+    written back in exponent form so NUMERIC parses them exactly.
+    """
+    parse = DateNormalizer().parse
+    it = iter(pairs)
+    seen = 0
+    while True:
+        with metrics.timed("extract"):
+            chunk = list(islice(it, FOLD_CHUNK_ROWS))
+        if not chunk:
+            return
+        base = seen
+        seen += len(chunk)
+        metrics.count("extract", len(chunk), len(chunk))
+
+        with metrics.timed("transform"):
+            staged = []
+            for i, (raw, value) in enumerate(chunk):
+                iso = parse(raw) if raw else None
+                if iso is None:
+                    reason = "unparseable_date" if raw else "missing_date"
+                    metrics.reject(
+                        "transform",
+                        reason,
+                        source=source,
+                        row=row_number(base + i, skipped),
+                        value=raw,
+                    )
+                    continue
+                parsed = parse_scaled(value)
+                if parsed is None:
+                    row = row_number(base + i, skipped)
+                    metrics.reject(
+                        "aggregate",
+                        "non_numeric_value",
+                        source=source,
+                        row=row,
+                        value=value,
+                    )
+                    continue
+                units, scale = parsed
+                staged.append((iso, f"{units}e-{scale}" if scale else str(units)))
+        metrics.count("transform", len(staged), len(staged))
+        yield from staged
+
+
+def _staged_folder(
+    folder: str | Path, reader: str, metrics: RunMetrics, shard: Shard | None = None
+) -> Iterator[Tuple[str, str]]:
+    files = list_csv_files(folder, shard)
+    if not files:
+        logger.info("No CSV files found in %s", folder)
+    for f in files:
+        skipped = array("q")
+        if reader == "mmap":
+            pairs: Iterable[Tuple[str, str]] = read_projected_file(
+                f, metrics=metrics, on_bad=skipped.append
+            )
+        else:
+            rows = read_csv_file(f, metrics=metrics, on_bad=skipped.append)
+            pairs = ((r.get("date"), r.get("amount", 0)) for r in rows)
+        yield from stage_rows(pairs, metrics, f.name, skipped)
+
+
+def _copy_raw(conn, batch: List[Tuple[str, str]]) -> None:
+    buf = io.StringIO()
+    csv.writer(buf, lineterminator="\n").writerows(batch)
+    buf.seek(0)
+    cur = conn.connection.cursor()
+    try:
+        cur.copy_expert(
+            "COPY results_raw (date, amount) FROM STDIN WITH (FORMAT csv)", buf
+        )
+    finally:
+        cur.close()
+
+
+def _insert_raw(conn, batch: List[Tuple[str, str]]) -> None:
+    values = ", ".join(f"(:d{i}, CAST(:a{i} AS NUMERIC))" for i in range(len(batch)))
+    params: Dict[str, Any] = {}
+    for i, (d, a) in enumerate(batch):
+        params[f"d{i}"] = datetime.date.fromisoformat(d)
+        params[f"a{i}"] = a
+    # typed date binds, as in load: CAST(... AS DATE) means NUMERIC affinity on sqlite
+    stmt = text(f"INSERT INTO results_raw (date, amount) VALUES {values}").bindparams(
+        *(bindparam(f"d{i}", type_=Date()) for i in range(len(batch)))
+    )
+    conn.execute(stmt, params)
+
+
+def load_pushdown(
+    engine,
+    folder: str | Path,
+    mode: str = "upsert",
+    batch_size: int | None = None,
+    metrics: RunMetrics | None = None,
+    reader: str = "csv",
+    shard: Shard | None = None,
+    before_commit: Callable[[Any], None] | None = None,
+) -> Tuple[int, int]:
+    """Stage every row of folder (of `shard`); aggregate it into `results` in the db.
+
+    `before_commit(conn)` is called on the load's transaction before it
+    commits. Returns (rows staged, per-date rows written).
+    """
+    if mode not in LOAD_MODES:
+        raise ValueError(f"unknown load mode: {mode}")
+    if metrics is None:
+        metrics = RunMetrics()
+    dialect = _dialect_name(engine)
+    with engine.begin() as conn:
+        if dialect == "sqlite":
+            conn.execute(text(SQLITE_DROP_RAW_TABLE_SQL))
+            conn.execute(text(SQLITE_RAW_TABLE_SQL))
+        else:
+            conn.execute(text(RAW_TABLE_SQL))
+        use_copy = supports_copy(conn)
+        write = _copy_raw if use_copy else _insert_raw
+        size = batch_size or (COPY_BATCH_SIZE if use_copy else INSERT_BATCH_SIZE)
+        staged = 0
+        # "YYYY-MM" of the rows staged, for the partitions and rollups they need
+        months: Set[str] = set()
+        for batch in _batches(_staged_folder(folder, reader, metrics, shard), size):
+            with metrics.timed("load"):
+                write(conn, batch)
+            months.update(d[:7] for d, _ in batch)
+            staged += len(batch)
+        metrics.count("load", staged, staged)
+
+        with metrics.timed("aggregate"):
+            firsts = {datetime.date.fromisoformat(m + "-01") for m in months}
+            if dialect == "postgresql" and firsts:
+                ensure_partitions(conn, {d.year for d in firsts})
+            # the rows produced, like write_aggregates counts them: the upsert's
+            # rowcount leaves out dates whose totals were already stored
+            written = conn.execute(
+                text("SELECT COUNT(DISTINCT date) FROM results_raw")
+            ).scalar_one()
+            conn.execute(
+                text(
+                    "INSERT INTO results (date, total_amount)"
+                    # WHERE true keeps sqlite from reading ON CONFLICT as a
+                    # join constraint
+                    " SELECT date, SUM(amount) FROM results_raw WHERE true"
+                    " GROUP BY date ORDER BY date"
+                    + _conflict_clause(mode, dialect)
+                )
+            )
+            refresh_rollups(conn, firsts, dialect)
+            if dialect == "sqlite":
+                conn.execute(text(SQLITE_DROP_RAW_TABLE_SQL))
+        metrics.count("aggregate", staged, written)
+        if before_commit is not None:
+            before_commit(conn)
+    logger.info(
+        "Pushed down %d rows; database aggregated them into %d per-date rows (mode=%s)",
+        staged,
+        written,
+        mode,
+    )
+    return staged, written
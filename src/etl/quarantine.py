@@ -0,0 +1,223 @@
+"""Rejected-row diagnostics and the quarantine file.
+
+Every stage reports the rows it rejects to its `RunMetrics`, which keeps a
+`RejectLog`: counts per (file, stage, reason) and the first few rejected
+rows of each as examples. Nothing is logged per row; `RejectLog.report`
+logs one line per file and reason when a run (or a watch micro-batch) ends.
+
+With a quarantine file, the rejected rows themselves (file, row number,
+stage, reason and offending value) are also kept and appended to it in
+batches of FLUSH_ROWS. The format follows the file suffix: `.csv` writes
+CSV with a header, anything else JSON Lines. Worker processes have no
+quarantine file: they pickle their rows, FLUSH_ROWS at a time, to a temp
+file of their own and hand its path back with their metrics; the parent
+copies it into the quarantine file in batches and removes it. A worker
+holds at most FLUSH_ROWS rejected rows in memory, however many it rejects.
+
+Row numbers count data rows from 1 after the header, the way `etl.extract`
+numbers them, and do not depend on how files were split among workers.
+"""
+from __future__ import annotations
+
+import csv
+import json
+import os
+import pickle
+import tempfile
+from bisect import bisect_right
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from .logger import get_logger
+
+logger = get_logger(__name__)
+
+# example rows kept (and logged) per file, stage and reason
+SAMPLES = 3
+# rejected rows buffered before they are written to the quarantine file
+FLUSH_ROWS = 10_000
+FIELDS = ("file", "row", "stage", "reason", "value")
+
+# (file, stage, reason)
+Key = Tuple[str, str, str]
+# (file, row, stage, reason, value)
+Record = Tuple[str, Optional[int], str, str, Optional[str]]
+
+
+def row_number(index: int, skipped: Sequence[int]) -> int:
+    """Row number of the `index`-th (0-based) row a reader yielded.
+
+    `skipped` holds the ascending row numbers the reader dropped before it,
+    e.g. the `on_bad` numbers of `etl.extract`; readers only fill it as far
+    as they have read, which is all this needs.
+    """
+    row = index + 1
+    while True:
+        moved = index + 1 + bisect_right(skipped, row)
+        if moved == row:
+            return row
+        row = moved
+
+
+class QuarantineFile:
+    """Appends rejected rows to a CSV or JSON Lines file."""
+
+    def __init__(self, path: str | Path, append: bool = False) -> None:
+        self.path = Path(path)
+        self._csv = self.path.suffix.lower() == ".csv"
+        self._fh = open(self.path, "a" if append else "w", encoding="utf8", newline="")
+        if self._csv:
+            self._writer = csv.writer(self._fh)
+            if self._fh.tell() == 0:
+                self._writer.writerow(FIELDS)
+
+    def write(self, records: List[Record]) -> None:
+        if self._csv:
+            self._writer.writerows(records)
+        else:
+            self._fh.write(
+                "".join(json.dumps(dict(zip(FIELDS, r))) + "\n" for r in records)
+            )
+
+    def close(self) -> None:
+        self._fh.close()
+
+
+class RejectLog:
+    """Rejected rows of a run: counts and examples per (file, stage, reason).
+
+    With `keep`, every rejected row is also kept for the quarantine file and
+    written to `sink` every FLUSH_ROWS rows; without a sink (in a worker),
+    to a temp file that `merge` copies into the parent's log.
+    """
+
+    def __init__(self, keep: bool = False) -> None:
+        self.keep = keep
+        self.counts: Dict[Key, int] = {}
+        self.samples: Dict[Key, List[Tuple[Optional[int], Optional[str]]]] = {}
+        self.rows: List[Record] = []
+        self.sink: QuarantineFile | None = None
+        # temp file of rows flushed without a sink; they precede `rows`
+        self.spill: str | None = None
+
+    def add(
+        self,
+        source: str | None,
+        row: int | None,
+        stage: str,
+        reason: str,
+        value: Any = None,
+        n: int = 1,
+    ) -> None:
+        key = (source or "", stage, reason)
+        seen = self.counts.get(key, 0)
+        self.counts[key] = seen + n
+        # counts replayed in bulk carry no row to show or quarantine
+        if n != 1:
+            return
+        if value is not None and not isinstance(value, str):
+            value = repr(value)
+        if seen < SAMPLES:
+            self.samples.setdefault(key, []).append((row, value))
+        if self.keep:
+            self.rows.append((source or "", row, stage, reason, value))
+            if len(self.rows) >= FLUSH_ROWS:
+                self.flush()
+
+    def merge(self, other: "RejectLog", row_offset: int = 0) -> "RejectLog":
+        """Fold in another log; `row_offset` shifts its row numbers (byte ranges)."""
+        for key, n in other.counts.items():
+            self.counts[key] = self.counts.get(key, 0) + n
+        for key, examples in other.samples.items():
+            mine = self.samples.setdefault(key, [])
+            for row, value in examples[: SAMPLES - len(mine)]:
+                mine.append((row + row_offset if row is not None else None, value))
+        if self.keep:
+            for batch in other.batches():
+                if row_offset:
+                    batch = [
+                        (f, row + row_offset if row is not None else None, s, r, v)
+                        for f, row, s, r, v in batch
+                    ]
+                self.rows.extend(batch)
+                if len(self.rows) >= FLUSH_ROWS:
+                    self.flush()
+        other.discard()
+        return self
+
+    def batches(self) -> Iterator[List[Record]]:
+        """Kept rows in order, the spilled ones FLUSH_ROWS at a time."""
+        if self.spill is not None:
+            with open(self.spill, "rb") as fh:
+                while True:
+                    try:
+                        yield pickle.load(fh)
+                    except EOFError:
+                        break
+        if self.rows:
+            yield self.rows
+
+    def flush(self) -> None:
+        """Write buffered rows to the quarantine file, or to the spill file."""
+        if not self.rows:
+            return
+        if self.sink is not None:
+            self.sink.write(self.rows)
+        else:
+            if self.spill is None:
+                fd, self.spill = tempfile.mkstemp(prefix="etl-rejects-")
+                os.close(fd)
+            with open(self.spill, "ab") as fh:
+                pickle.dump(self.rows, fh, pickle.HIGHEST_PROTOCOL)
+        self.rows = []
+
+    def discard(self) -> None:
+        """Drop kept rows and remove the spill file."""
+        self.rows = []
+        if self.spill is not None:
+            try:
+                os.remove(self.spill)
+            except FileNotFoundError:
+                pass
+            self.spill = None
+
+    def close(self) -> None:
+        """Write what is buffered and close the quarantine file."""
+        if self.sink is not None:
+            self.flush()
+            self.sink.close()
+            logger.info("Rejected rows quarantined in %s", self.sink.path)
+            self.sink = None
+
+    def report(self) -> int:
+        """Log one line per file, stage and reason, then start counting over.
+
+        Buffered rows are flushed to the quarantine file, if there is one.
+        Returns rows reported.
+        """
+        if self.sink is not None:
+            self.flush()
+        total = 0
+        for (source, stage, reason), n in self.counts.items():
+            examples = ", ".join(
+                f"row {row}: {value!r}" if row is not None else repr(value)
+                for row, value in self.samples.get((source, stage, reason), [])
+            )
+            logger.warning(
+                "Rejected %d rows%s at %s (%s)%s",
+                n,
+                f" of {source}" if source else "",
+                stage,
+                reason,
+                f", e.g. {examples}" if examples else "",
+            )
+            total += n
+        self.counts = {}
+        self.samples = {}
+        return total
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # an open quarantine file stays with the process that opened it
+        state = dict(self.__dict__)
+        state["sink"] = None
+        return state
@@ -0,0 +1,128 @@
+"""Monthly and yearly rollups of `results` for dashboards.
+
+`results_monthly` and `results_yearly` hold one row per month / year: the
+total, the number of dates and, when every date of the period carries them,
+the row count and min/max amount (NULL otherwise, like the per-date stats).
+Loads refresh them in the same transaction as the rows they write, so
+dashboards read a handful of rows instead of scanning years of `results`.
+
+A refresh recomputes the months written from `results` (one index range
+scan per run of consecutive months), then their years from
+`results_monthly`. Loads writing in several steps (pipelined files,
+batches) collect the months and refresh once at the end. Recomputing
+instead of adding deltas keeps the rollups right whatever the load mode:
+upserts replace totals, `add` sums into them.
+On Postgres the refresh first takes an advisory lock held until commit, so
+concurrent loads (e.g. shards) refresh one after the other and each sees
+the rows the previous ones committed.
+"""
+from __future__ import annotations
+
+import datetime
+from typing import Iterable, List, Tuple
+
+# pg_advisory_xact_lock key serializing rollup refreshes
+ROLLUP_LOCK_KEY = 0x45544C52  # "ETLR"
+
+ROLLUP_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS results_monthly (
+  month DATE PRIMARY KEY,
+  total_amount NUMERIC,
+  days INTEGER NOT NULL,
+  row_count BIGINT,
+  min_amount NUMERIC,
+  max_amount NUMERIC,
+  updated_at TIMESTAMPTZ DEFAULT NOW()
+);
+CREATE TABLE IF NOT EXISTS results_yearly (
+  year INTEGER PRIMARY KEY,
+  total_amount NUMERIC,
+  days INTEGER NOT NULL,
+  row_count BIGINT,
+  min_amount NUMERIC,
+  max_amount NUMERIC,
+  updated_at TIMESTAMPTZ DEFAULT NOW()
+);
+"""
+
+SQLITE_ROLLUP_TABLE_SQL = ROLLUP_TABLE_SQL.replace(
+    "TIMESTAMPTZ DEFAULT NOW()", "TIMESTAMP DEFAULT CURRENT_TIMESTAMP"
+)
+
+
+def _complete(agg: str, column: str) -> str:
+    # a period's stat is only known when every row under it carries one
+    return f"CASE WHEN COUNT({column}) = COUNT(*) THEN {agg}({column}) END"
+
+
+def _refresh_sql(
+    table: str, key: str, period: str, source: str, column: str, days: str
+) -> str:
+    columns = (
+        "total_amount",
+        "days",
+        "row_count",
+        "min_amount",
+        "max_amount",
+        "updated_at",
+    )
+    return (
+        f"INSERT INTO {table} ({key}, {', '.join(columns)})"
+        f" SELECT {period}, SUM(total_amount), {days}, {_complete('SUM', 'row_count')},"
+        f" {_complete('MIN', 'min_amount')}, {_complete('MAX', 'max_amount')},"
+        " CURRENT_TIMESTAMP"
+        f" FROM {source} WHERE {column} >= :lo AND {column} < :hi GROUP BY 1"
+        f" ON CONFLICT ({key}) DO UPDATE SET "
+        + ", ".join(f"{c} = EXCLUDED.{c}" for c in columns)
+    )
+
+
+def _next_month(d: datetime.date) -> datetime.date:
+    return datetime.date(d.year + d.month // 12, d.month % 12 + 1, 1)
+
+
+def _spans(
+    starts: Iterable[datetime.date], step
+) -> List[Tuple[datetime.date, datetime.date]]:
+    """[lo, hi) ranges covering the periods starting at `starts`, merging neighbours."""
+    spans: List[Tuple[datetime.date, datetime.date]] = []
+    for start in sorted(set(starts)):
+        if spans and spans[-1][1] == start:
+            spans[-1] = (spans[-1][0], step(start))
+        else:
+            spans.append((start, step(start)))
+    return spans
+
+
+def refresh_rollups(conn, months: Iterable[datetime.date], dialect: str | None) -> None:
+    """Recompute the rollups of `months` (any date in each) and of their years."""
+    from sqlalchemy import Date, bindparam, text
+
+    firsts = {d.replace(day=1) for d in months}
+    if not firsts:
+        return
+    if dialect == "sqlite":
+        month = "strftime('%Y-%m-01', date)"
+        year = "CAST(strftime('%Y', month) AS INTEGER)"
+    else:
+        month = "CAST(date_trunc('month', date) AS DATE)"
+        year = "CAST(EXTRACT(YEAR FROM month) AS INTEGER)"
+    monthly = _refresh_sql(
+        "results_monthly", "month", month, "results", "date", "COUNT(*)"
+    )
+    yearly = _refresh_sql(
+        "results_yearly", "year", year, "results_monthly", "month", "SUM(days)"
+    )
+    years = {datetime.date(d.year, 1, 1) for d in firsts}
+    statements = [(monthly, lo, hi) for lo, hi in _spans(firsts, _next_month)]
+    statements += [
+        (yearly, lo, hi)
+        for lo, hi in _spans(years, lambda y: y.replace(year=y.year + 1))
+    ]
+    if dialect == "postgresql":
+        conn.execute(text(f"SELECT pg_advisory_xact_lock({ROLLUP_LOCK_KEY})"))
+    for sql, lo, hi in statements:
+        stmt = text(sql).bindparams(
+            bindparam("lo", type_=Date()), bindparam("hi", type_=Date())
+        )
+        conn.execute(stmt, {"lo": lo, "hi": hi})
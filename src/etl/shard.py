@@ -0,0 +1,42 @@
+"""Deterministic assignment of input files to shards.
+
+Several ETL processes (containers, hosts) can split one shared input folder
+without talking to each other: each is started with its shard index and the
+shard count and only reads the files whose name hashes to its index. The
+hash is BLAKE2b of the file name alone, so the assignment is the same on
+every host wherever the folder is mounted, and it does not move when other
+files are added or removed.
+
+Shards add their partial totals to `results` (load mode `add`), so N shards
+together store what a single run would. Rows are written in date order, so
+concurrent shards lock dates in the same order and cannot deadlock.
+"""
+from __future__ import annotations
+
+import hashlib
+from pathlib import Path
+from typing import Iterable, List, Tuple
+
+# (shard index, shard count)
+Shard = Tuple[int, int]
+
+
+def shard_of(name: str, count: int) -> int:
+    """Shard (0 to count - 1) a file name is assigned to."""
+    digest = hashlib.blake2b(name.encode("utf8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big") % count
+
+
+def select_shard(files: Iterable[Path], shard: Shard) -> List[Path]:
+    """The files of `shard`, in their original order."""
+    index, count = shard
+    return [f for f in files if shard_of(f.name, count) == index]
+
+
+def check_shard(shard: Shard) -> None:
+    index, count = shard
+    if count < 1 or not 0 <= index < count:
+        raise ValueError(
+            f"shard index must be between 0 and the shard count - 1, got {index} of"
+            f" {count}"
+        )
@@ -0,0 +1,262 @@
+"""Hash aggregation that spills to disk under a memory budget.
+
+`SpillingAggregator` behaves like `transform.Aggregator` until the number of
+in-memory groups reaches what the budget allows. From then on, groups
+already in memory keep being summed in place, while rows for new keys are
+appended, with their row sequence number, to hash-partitioned temp files.
+
+At the end every partition is summed on its own (one partition's groups at
+a time in memory) and written back sorted by first appearance; the resident
+groups and the partition runs are then merged by first appearance. A
+partition holding more groups than the budget allows is split again with a
+differently seeded hash, recursively, and its sub-runs merged into one run,
+so however many groups the input has, no more than the budget's worth are
+summed in memory at once. Each group is summed from raw values in row
+order, exactly like the in-memory path, so totals and group order are
+identical, not just close. The price is disk: spill files hold one record
+per spilled row, and each partition's file is removed once it is summed.
+"""
+from __future__ import annotations
+
+import heapq
+import os
+import pickle
+import shutil
+import tempfile
+import weakref
+from array import array
+from typing import Any, Dict, Iterator, List, Tuple
+
+from .logger import get_logger
+from .transform import _update
+
+logger = get_logger(__name__)
+
+# rough cost of one in-memory group: dict slot, key string, float, sequence number
+BYTES_PER_GROUP = 160
+PARTITIONS = 64
+# spilled records buffered per partition before they are pickled to disk
+SPILL_BATCH = 4096
+# oversized partitions are split again at most this many times; deeper ones
+# are summed whole (only possible if the budget holds a handful of groups)
+MAX_DEPTH = 4
+
+
+def _dump_stream(path: str, records: Iterator[Any], batch: int = SPILL_BATCH) -> None:
+    with open(path, "wb") as fh:
+        buf: List[Any] = []
+        for r in records:
+            buf.append(r)
+            if len(buf) >= batch:
+                pickle.dump(buf, fh, pickle.HIGHEST_PROTOCOL)
+                buf = []
+        if buf:
+            pickle.dump(buf, fh, pickle.HIGHEST_PROTOCOL)
+
+
+def _load_stream(path: str) -> Iterator[Any]:
+    with open(path, "rb") as fh:
+        while True:
+            try:
+                batch = pickle.load(fh)
+            except EOFError:
+                return
+            yield from batch
+
+
+class SpillingAggregator:
+    """Sum `value_field` by `group_by` within roughly `memory_budget` bytes."""
+
+    def __init__(
+        self,
+        group_by: str = "date",
+        value_field: str = "amount",
+        memory_budget: int = 256 * 1024 * 1024,
+        tmp_dir: str | None = None,
+        partitions: int = PARTITIONS,
+    ) -> None:
+        self.group_by = group_by
+        self.value_field = value_field
+        self.max_groups = max(memory_budget // BYTES_PER_GROUP, 1)
+        self.tmp_dir = tmp_dir
+        self.partitions = partitions
+        self.totals: Dict[Any, float] = {}
+        # first row sequence number of each resident group, in dict order
+        self._first = array("q")
+        self.rows = 0
+        self.spilled_rows = 0
+        self._dir: str | None = None
+        self._buffers: List[List[Tuple[int, Any, float]]] = []
+        self._files: List[Any] = []
+        self._runs: List[str] = []
+        self._groups: int | None = None
+        # partitions split again because they held more than max_groups groups
+        self.resplits = 0
+        self._cleanup = None
+
+    def add(self, row: Dict[str, Any]) -> bool:
+        """Fold a single row in. Returns False if the value was not numeric."""
+        return self.add_value(row.get(self.group_by), row.get(self.value_field, 0))
+
+    def add_value(self, key: Any, value: Any) -> bool:
+        try:
+            val = float(value)
+        except Exception:
+            return False
+        totals = self.totals
+        if key in totals:
+            totals[key] += val
+        elif len(totals) < self.max_groups:
+            totals[key] = 0.0 + val
+            self._first.append(self.rows)
+        else:
+            self._spill(key, val)
+        self.rows += 1
+        return True
+
+    def update(self, rows) -> "SpillingAggregator":
+        _update(self, rows)
+        return self
+
+    def _spill(self, key: Any, val: float) -> None:
+        if self._dir is None:
+            self._dir = tempfile.mkdtemp(prefix="etl-spill-", dir=self.tmp_dir)
+            self._cleanup = weakref.finalize(self, shutil.rmtree, self._dir, True)
+            self._buffers = [[] for _ in range(self.partitions)]
+            self._files = [
+                open(os.path.join(self._dir, f"p{i}"), "wb")
+                for i in range(self.partitions)
+            ]
+            logger.info(
+                "Memory budget reached at %d groups; spilling new keys to %s",
+                len(self.totals),
+                self._dir,
+            )
+        p = hash(key) % self.partitions
+        buf = self._buffers[p]
+        buf.append((self.rows, key, val))
+        if len(buf) >= SPILL_BATCH:
+            pickle.dump(buf, self._files[p], pickle.HIGHEST_PROTOCOL)
+            self._buffers[p] = []
+        self.spilled_rows += 1
+
+    def finish(self) -> None:
+        """Sum every spilled partition into a run sorted by first appearance."""
+        if self._groups is not None:
+            return
+        self._groups = len(self.totals)
+        if self._dir is None:
+            return
+        for p, fh in enumerate(self._files):
+            if self._buffers[p]:
+                pickle.dump(self._buffers[p], fh, pickle.HIGHEST_PROTOCOL)
+            fh.close()
+        self._buffers = []
+        self._files = []
+        for p in range(self.partitions):
+            run, groups = self._sum_partition(os.path.join(self._dir, f"p{p}"))
+            if run is not None:
+                self._runs.append(run)
+                self._groups += groups
+        logger.info(
+            "Spilled %d rows into %d partitions (%d split again); %d groups in total",
+            self.spilled_rows,
+            len(self._runs),
+            self.resplits,
+            self._groups,
+        )
+
+    def _sum_partition(self, path: str, depth: int = 0) -> Tuple[str | None, int]:
+        """Sum a spilled partition into a run sorted by first appearance.
+
+        Returns (run path, or None when the partition is empty, groups).
+        """
+        groups: Dict[Any, List[Any]] = {}
+        oversized = False
+        records = _load_stream(path)
+        try:
+            for seq, key, val in records:
+                g = groups.get(key)
+                if g is not None:
+                    g[1] += val
+                elif len(groups) < self.max_groups or depth >= MAX_DEPTH:
+                    groups[key] = [seq, 0.0 + val]
+                else:
+                    oversized = True
+                    break
+        finally:
+            records.close()
+        if oversized:
+            del groups
+            return self._split_partition(path, depth + 1)
+        os.remove(path)
+        if not groups:
+            return None, 0
+        run = f"{path}.run"
+        # partitions are read in row order, so dict order is first appearance
+        _dump_stream(run, ((seq, key, total) for key, (seq, total) in groups.items()))
+        return run, len(groups)
+
+    def _split_partition(self, path: str, depth: int) -> Tuple[str | None, int]:
+        """Split an oversized partition by a hash seeded with `depth`, sum
+        each part and merge their runs into one."""
+        self.resplits += 1
+        parts = [f"{path}.{i}" for i in range(self.partitions)]
+        files = [open(part, "wb") for part in parts]
+        buffers: List[List[Tuple[int, Any, float]]] = [[] for _ in parts]
+        for record in _load_stream(path):
+            i = hash((depth, record[1])) % self.partitions
+            buffers[i].append(record)
+            if len(buffers[i]) >= SPILL_BATCH:
+                pickle.dump(buffers[i], files[i], pickle.HIGHEST_PROTOCOL)
+                buffers[i] = []
+        for fh, buf in zip(files, buffers):
+            if buf:
+                pickle.dump(buf, fh, pickle.HIGHEST_PROTOCOL)
+            fh.close()
+        os.remove(path)
+        runs = []
+        groups = 0
+        for part in parts:
+            run, n = self._sum_partition(part, depth)
+            if run is not None:
+                runs.append(run)
+                groups += n
+        if not runs:
+            return None, 0
+        merged = f"{path}.run"
+        _dump_stream(
+            merged, heapq.merge(*map(_load_stream, runs), key=lambda r: r[0])
+        )
+        for run in runs:
+            os.remove(run)
+        return merged, groups
+
+    def iter_totals(self) -> Iterator[Tuple[Any, float]]:
+        """Yield (key, total) for every group in order of first appearance."""
+        self.finish()
+        resident = (
+            (seq, key, total)
+            for seq, (key, total) in zip(self._first, self.totals.items())
+        )
+        streams = [resident] + [_load_stream(run) for run in self._runs]
+        for _, key, total in heapq.merge(*streams, key=lambda r: r[0]):
+            yield key, total
+
+    def iter_results(self) -> Iterator[Dict[str, Any]]:
+        total_key = f"total_{self.value_field}"
+        for key, total in self.iter_totals():
+            yield {self.group_by: key, total_key: total}
+
+    def results(self) -> List[Dict[str, Any]]:
+        return list(self.iter_results())
+
+    def close(self) -> None:
+        """Remove the spill directory."""
+        for fh in self._files:
+            fh.close()
+        if self._cleanup is not None:
+            self._cleanup()
+
+    def __len__(self) -> int:
+        return self._groups if self._groups is not None else len(self.totals)
@@ -1,54 +1,711 @@
 """Transformation logic: normalize dates and aggregate amounts."""
 from __future__ import annotations
 
+import re
 from datetime import datetime
-from typing import Any, Dict, Iterable, List
+from decimal import MAX_PREC, Context, Decimal, InvalidOperation
+from functools import lru_cache
+from itertools import islice
+from typing import Any, Dict, Iterable, List, Sequence, Tuple
 
+from .dedup import REASONS as DEDUP_REASONS
+from .dedup import Deduper
 from .logger import get_logger
+from .metrics import RunMetrics
+from .quarantine import SAMPLES, row_number
 
 logger = get_logger(__name__)
 
 
+# tried in order; the first format that parses wins
+DATE_FORMATS = ("%Y-%m-%d", "%d/%m/%Y", "%m/%d/%Y", "%Y/%m/%d")
+# formats no string can share with an earlier format, so trying them first
+# never changes which format wins (%m/%d/%Y overlaps with %d/%m/%Y)
+_LOCKABLE_FORMATS = frozenset({"%Y-%m-%d", "%d/%m/%Y", "%Y/%m/%d"})
+DATE_CACHE_SIZE = 65536
+# rows handed from stage to stage in fold_rows
+FOLD_CHUNK_ROWS = 10_000
+# most fractional digits FixedPointAggregator keeps; finer values are rejected
+MAX_SCALE = 18
+_POW10 = [10**i for i in range(MAX_SCALE + 1)]
+# unbounded precision, so converting totals to Decimal never rounds
+_EXACT = Context(prec=MAX_PREC)
+# integer-valued doubles add exactly while the sum stays below this
+_FLOAT_EXACT = 2**53
+
+
+@lru_cache(maxsize=None)
+def _plain_batch(scale: int, whole_digits: int) -> re.Pattern:
+    """Newline-terminated "[-]digits.digits" values with exactly `scale` decimals."""
+    frac = rf"\.[0-9]{{{scale}}}" if scale else ""
+    return re.compile(rf"(?:[+-]?[0-9]{{1,{whole_digits}}}{frac}\n)*")
+
+
+class DateError(ValueError):
+    """A row's date is missing or cannot be parsed; `reason` is a metrics key."""
+
+    def __init__(self, message: str, reason: str) -> None:
+        super().__init__(message)
+        self.reason = reason
+
+
+class DateNormalizer:
+    """Normalize dates to ISO 8601 (YYYY-MM-DD), remembering what worked.
+
+    The last winning format is tried first, and results are memoized in a
+    bounded LRU cache keyed by the raw string, since dates repeat heavily
+    across rows. Output is identical to trying DATE_FORMATS in order.
+    """
+
+    def __init__(self, cache_size: int = DATE_CACHE_SIZE) -> None:
+        self._locked: str | None = None
+        self.parse = lru_cache(maxsize=cache_size)(self._parse)
+
+    def _parse(self, raw: str) -> str | None:
+        """Return the ISO date for raw, or None if it cannot be parsed."""
+        locked = self._locked
+        if locked is not None:
+            try:
+                return datetime.strptime(raw, locked).date().isoformat()
+            except (TypeError, ValueError):
+                pass
+        for fmt in DATE_FORMATS:
+            if fmt == locked:
+                continue
+            try:
+                iso = datetime.strptime(raw, fmt).date().isoformat()
+            except (TypeError, ValueError):
+                continue
+            if fmt in _LOCKABLE_FORMATS:
+                self._locked = fmt
+            return iso
+
+        # try fromisoformat
+        try:
+            return datetime.fromisoformat(raw).date().isoformat()
+        except (TypeError, ValueError):
+            return None
+
+    def normalize(
+        self, row: Dict[str, Any], date_field: str = "date"
+    ) -> Dict[str, Any]:
+        raw = row.get(date_field)
+        if not raw:
+            raise DateError("missing date", "missing_date")
+        iso = self.parse(raw)
+        if iso is None:
+            raise DateError(f"unparseable date: {raw}", "unparseable_date")
+        row[date_field] = iso
+        return row
+
+
+_default_normalizer = DateNormalizer()
+
+
 def normalize_date(row: Dict[str, Any], date_field: str = "date") -> Dict[str, Any]:
     """Normalize various date formats to ISO 8601 (YYYY-MM-DD).
 
     Raises ValueError if the date cannot be parsed.
     """
-    raw = row.get(date_field)
-    if not raw:
-        raise ValueError("missing date")
+    return _default_normalizer.normalize(row, date_field=date_field)
+
+
+def _update(agg: Any, rows: Iterable[Dict[str, Any]]) -> None:
+    """Fold rows into agg, logging non-numeric values once rather than per row."""
+    add = agg.add
+    rejected = 0
+    examples: List[Any] = []
+    for r in rows:
+        if not add(r):
+            rejected += 1
+            if len(examples) < SAMPLES:
+                examples.append(r.get(agg.value_field))
+    if rejected:
+        logger.warning(
+            "Skipped %d rows with a non-numeric %s, e.g. %s",
+            rejected,
+            agg.value_field,
+            ", ".join(map(repr, examples)),
+        )
+
+
+class Aggregator:
+    """Incrementally sum numeric `value_field` grouped by `group_by`.
+
+    Rows are folded in as they arrive, so memory grows with the number of
+    distinct groups rather than the number of rows.
+    """
+
+    def __init__(self, group_by: str = "date", value_field: str = "amount") -> None:
+        self.group_by = group_by
+        self.value_field = value_field
+        self.totals: Dict[Any, float] = {}
+        self.rows = 0
 
-    # common formats
-    for fmt in ("%Y-%m-%d", "%d/%m/%Y", "%m/%d/%Y", "%Y/%m/%d"):
+    def add(self, row: Dict[str, Any]) -> bool:
+        """Fold a single row in. Returns False if the value was not numeric."""
+        return self.add_value(row.get(self.group_by), row.get(self.value_field, 0))
+
+    def add_value(self, key: Any, value: Any) -> bool:
+        """Fold one (group key, raw value) pair in, as `add` does for a row."""
         try:
-            dt = datetime.strptime(raw, fmt)
-            row[date_field] = dt.date().isoformat()
-            return row
+            val = float(value)
         except Exception:
-            continue
+            return False
+        totals = self.totals
+        totals[key] = totals.get(key, 0.0) + val
+        self.rows += 1
+        return True
 
-    # try fromisoformat
-    try:
-        row[date_field] = datetime.fromisoformat(raw).date().isoformat()
-        return row
-    except Exception as exc:
-        raise ValueError(f"unparseable date: {raw}") from exc
+    def update(self, rows: Iterable[Dict[str, Any]]) -> "Aggregator":
+        _update(self, rows)
+        return self
 
+    def merge(self, other: "Aggregator") -> "Aggregator":
+        """Fold another aggregator's partial totals into this one."""
+        totals = self.totals
+        for k, v in other.totals.items():
+            totals[k] = totals.get(k, 0.0) + v
+        self.rows += other.rows
+        return self
 
-def aggregate(rows: Iterable[Dict[str, Any]], group_by: str = "date", value_field: str = "amount") -> List[Dict[str, Any]]:
-    """Aggregate numeric `value_field` grouped by `group_by`.
+    def results(self) -> List[Dict[str, Any]]:
+        """Return list of dicts with keys group_by and total_{value_field}."""
+        return [
+            {self.group_by: k, f"total_{self.value_field}": v}
+            for k, v in self.totals.items()
+        ]
+
+    def __len__(self) -> int:
+        return len(self.totals)
+
+
+# metrics StatsAggregator can compute per group, and their result keys
+AGG_METRICS = ("sum", "count", "min", "max", "mean")
+_RESULT_KEYS = {
+    "sum": "total_{}",
+    "count": "row_count",
+    "min": "min_{}",
+    "max": "max_{}",
+    "mean": "mean_{}",
+}
+
+
+class GroupStats:
+    """Running sum/count/min/max of one group's values."""
+
+    __slots__ = ("sum", "count", "min", "max")
+
+    def __init__(self, value: float) -> None:
+        # 0.0 + value, so sums match Aggregator bit for bit (even for -0.0)
+        self.sum = 0.0 + value
+        self.count = 1
+        self.min = value
+        self.max = value
 
-    Returns list of dicts with keys group_by and total_{value_field}.
+    def add(self, value: float) -> None:
+        self.sum += value
+        self.count += 1
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def merge(self, other: "GroupStats") -> None:
+        self.sum += other.sum
+        self.count += other.count
+        if other.min < self.min:
+            self.min = other.min
+        if other.max > self.max:
+            self.max = other.max
+
+    def copy(self) -> "GroupStats":
+        other = GroupStats(self.min)
+        other.sum = 0.0 + self.sum
+        other.count = self.count
+        other.max = self.max
+        return other
+
+    def get(self, metric: str) -> float:
+        if metric == "mean":
+            return self.sum / self.count
+        return getattr(self, metric)
+
+
+class StatsAggregator:
+    """Single-pass sum/count/min/max/mean of `value_field` per group.
+
+    `group_by` is a column name or a sequence of names for a composite key
+    (tuples of the column values). Drop-in for `Aggregator` in `fold_rows`
+    and `Aggregator.merge`-style reductions.
     """
-    result: dict[str, float] = {}
-    for r in rows:
-        key = r.get(group_by)
+
+    def __init__(
+        self,
+        group_by: str | Sequence[str] = "date",
+        value_field: str = "amount",
+        stats: Sequence[str] = AGG_METRICS,
+    ) -> None:
+        unknown = set(stats) - set(AGG_METRICS)
+        if unknown:
+            raise ValueError(f"unknown aggregate metrics: {', '.join(sorted(unknown))}")
+        self.group_by = group_by
+        self.value_field = value_field
+        self.stats = tuple(stats)
+        self.groups: Dict[Any, GroupStats] = {}
+        self.rows = 0
+
+    def add(self, row: Dict[str, Any]) -> bool:
+        """Fold a single row in. Returns False if the value was not numeric."""
+        if isinstance(self.group_by, str):
+            key = row.get(self.group_by)
+        else:
+            key = tuple(row.get(k) for k in self.group_by)
+        return self.add_value(key, row.get(self.value_field, 0))
+
+    def add_value(self, key: Any, value: Any) -> bool:
         try:
-            val = float(r.get(value_field, 0))
+            val = float(value)
         except Exception:
-            logger.warning("Non-numeric value for %s: %s", value_field, r.get(value_field))
-            continue
-        result.setdefault(key, 0.0)
-        result[key] += val
+            return False
+        stats = self.groups.get(key)
+        if stats is None:
+            self.groups[key] = GroupStats(val)
+        else:
+            stats.add(val)
+        self.rows += 1
+        return True
+
+    def update(self, rows: Iterable[Dict[str, Any]]) -> "StatsAggregator":
+        _update(self, rows)
+        return self
+
+    def merge(self, other: "StatsAggregator") -> "StatsAggregator":
+        groups = self.groups
+        for k, st in other.groups.items():
+            mine = groups.get(k)
+            if mine is None:
+                groups[k] = st.copy()
+            else:
+                mine.merge(st)
+        self.rows += other.rows
+        return self
 
-    return [{group_by: k, f"total_{value_field}": v} for k, v in result.items()]
+    @property
+    def totals(self) -> Dict[Any, float]:
+        return {k: st.sum for k, st in self.groups.items()}
+
+    def results(self) -> List[Dict[str, Any]]:
+        """One dict per group: the group columns plus one key per metric.
+
+        Metric keys are total_{value_field}, row_count, min_{value_field},
+        max_{value_field} and mean_{value_field}.
+        """
+        names = [(m, _RESULT_KEYS[m].format(self.value_field)) for m in self.stats]
+        out = []
+        for k, st in self.groups.items():
+            if isinstance(self.group_by, str):
+                r = {self.group_by: k}
+            else:
+                r = dict(zip(self.group_by, k))
+            for metric, name in names:
+                r[name] = st.get(metric)
+            out.append(r)
+        return out
+
+    def __len__(self) -> int:
+        return len(self.groups)
+
+
+def parse_scaled(value: Any) -> Tuple[int, int] | None:
+    """Parse a decimal amount into (integer units, scale) without rounding.
+
+    "12.34" becomes (1234, 2). Plain `[-+]digits[.digits]` strings take an
+    integer-only fast path; exponents and other forms `Decimal` accepts go
+    through `Decimal`. Returns None for non-numeric, non-finite or values
+    with more than MAX_SCALE fractional digits.
+    """
+    if isinstance(value, str):
+        whole, _, frac = value.strip().partition(".")
+        # int() alone would accept "1_0" and a sign after the point
+        if (not frac or frac.isdigit()) and "_" not in whole:
+            try:
+                units = int(whole + frac)
+            except ValueError:
+                pass
+            else:
+                return (units, len(frac)) if len(frac) <= MAX_SCALE else None
+    elif isinstance(value, int):
+        return int(value), 0
+    try:
+        d = Decimal(value if isinstance(value, str) else str(value))
+    except (InvalidOperation, TypeError, ValueError):
+        return None
+    if not d.is_finite():
+        return None
+    sign, digits, exp = d.as_tuple()
+    units = int("".join(map(str, digits)))
+    if exp >= 0:
+        units *= 10**exp
+    elif -exp > MAX_SCALE:
+        return None
+    return (-units if sign else units), max(-exp, 0)
+
+
+class FixedPointAggregator:
+    """Exact per-group sums of decimal amounts, kept as scaled integers.
+
+    Amounts are parsed straight into integer units at the finest scale seen
+    so far in the column; when a value with more fractional digits arrives,
+    the running totals are rescaled once. Results are exact `Decimal`s, so
+    NUMERIC totals carry no float drift. Drop-in for `Aggregator` in
+    `fold_rows`, `fold_pairs` and partial merges.
+    """
+
+    def __init__(self, group_by: str = "date", value_field: str = "amount") -> None:
+        self.group_by = group_by
+        self.value_field = value_field
+        self.totals: Dict[Any, int] = {}
+        self.scale = 0
+        self.rows = 0
+
+    def add(self, row: Dict[str, Any]) -> bool:
+        """Fold a single row in. Returns False if the value was not numeric."""
+        return self.add_value(row.get(self.group_by), row.get(self.value_field, 0))
+
+    def add_value(self, key: Any, value: Any) -> bool:
+        try:
+            # fast path for plain "[-]digits[.digits]" strings
+            whole, dot, frac = value.partition(".")
+            if dot and not frac.isdigit():
+                raise ValueError(value)
+            units = int(whole + frac)
+            scale = len(frac)
+        except (AttributeError, ValueError):
+            parsed = parse_scaled(value)
+            if parsed is None:
+                return False
+            units, scale = parsed
+        if scale != self.scale:
+            if scale < self.scale:
+                units *= _POW10[self.scale - scale]
+            elif scale <= MAX_SCALE:
+                self._rescale(scale)
+            else:
+                return False
+        totals = self.totals
+        totals[key] = totals.get(key, 0) + units
+        self.rows += 1
+        return True
+
+    def add_many(self, pairs: Sequence[Tuple[Any, Any]]) -> List[int]:
+        """Fold (key, raw value) pairs in, as `add_value` does.
+
+        Returns the positions in `pairs` of the values that were rejected.
+
+        When every value is a short plain decimal at the column scale (a
+        full match of one regular expression over the batch: sign, digits,
+        exactly `scale` decimals, nothing else), it is parsed in one
+        `map(float, ...)` pass over the digits; integer-valued doubles add
+        exactly below 2**53, so each batch is summed in floats and folded into
+        the integer totals. Anything else falls back to `add_value` per pair.
+        """
+        n = len(pairs)
+        if not n:
+            return []
+        values = [v for _, v in pairs]
+        units = self._plain_units(values)
+        if units is None:
+            add_value = self.add_value
+            return [
+                i for i, (key, value) in enumerate(pairs) if not add_value(key, value)
+            ]
+        batch: Dict[Any, float] = {}
+        get = batch.get
+        for (key, _), u in zip(pairs, units):
+            batch[key] = get(key, 0.0) + u
+        totals = self.totals
+        get = totals.get
+        for key, u in batch.items():
+            totals[key] = get(key, 0) + int(u)
+        self.rows += n
+        return []
+
+    def _plain_units(self, values: List[Any]) -> List[float] | None:
+        """Values as integer units (exact doubles), or None if any is not plain."""
+        first = parse_scaled(values[0])
+        if first is not None and self.scale < first[1] <= MAX_SCALE:
+            self._rescale(first[1])
+        scale = self.scale
+        # digits per value that keep every batch sum below 2**53
+        digits = len(str(_FLOAT_EXACT // len(values))) - 1
+        if digits <= scale:
+            return None
+        try:
+            joined = "\n".join(values)
+        except TypeError:
+            return None
+        # a value holding a newline would pass as two
+        if joined.count("\n") != len(values) - 1:
+            return None
+        if _plain_batch(scale, digits - scale).fullmatch(joined + "\n") is None:
+            return None
+        return list(map(float, joined.replace(".", "").split("\n")))
+
+    def _rescale(self, scale: int) -> None:
+        factor = _POW10[scale - self.scale]
+        self.totals = {k: v * factor for k, v in self.totals.items()}
+        self.scale = scale
+
+    def update(self, rows: Iterable[Dict[str, Any]]) -> "FixedPointAggregator":
+        _update(self, rows)
+        return self
+
+    def merge(self, other: "FixedPointAggregator") -> "FixedPointAggregator":
+        if other.scale > self.scale:
+            self._rescale(other.scale)
+        factor = _POW10[self.scale - other.scale]
+        totals = self.totals
+        for k, v in other.totals.items():
+            totals[k] = totals.get(k, 0) + v * factor
+        self.rows += other.rows
+        return self
+
+    def decimal_totals(self) -> Dict[Any, Decimal]:
+        return {
+            k: Decimal(v).scaleb(-self.scale, _EXACT) for k, v in self.totals.items()
+        }
+
+    def results(self) -> List[Dict[str, Any]]:
+        """Like `Aggregator.results`, with exact `Decimal` totals."""
+        total_key = f"total_{self.value_field}"
+        return [
+            {self.group_by: k, total_key: v} for k, v in self.decimal_totals().items()
+        ]
+
+    def __len__(self) -> int:
+        return len(self.totals)
+
+
+def _drop_duplicates(
+    chunk: List[Dict[str, Any]],
+    dedup: Deduper | None,
+    metrics: RunMetrics,
+    base: int,
+    source: str | None,
+    skipped: Sequence[int],
+) -> Tuple[List[Dict[str, Any]], List[int]]:
+    """Reject the rows of chunk that dedup has seen: (rows kept, positions dropped)."""
+    if dedup is None:
+        return chunk, []
+    with metrics.timed("dedup"):
+        unique, found = dedup.filter(chunk)
+    duplicates = []
+    for i, verdict in found:
+        raw = ",".join(v for v in chunk[i].values() if isinstance(v, str))
+        row = row_number(base + i, skipped)
+        metrics.reject(
+            "dedup", DEDUP_REASONS[verdict], source=source, row=row, value=raw
+        )
+        duplicates.append(i)
+    metrics.count("dedup", len(unique), len(unique))
+    return unique, duplicates
+
+
+def fold_rows(
+    rows: Iterable[Dict[str, Any]],
+    agg: Aggregator,
+    date_field: str = "date",
+    metrics: RunMetrics | None = None,
+    source: str | None = None,
+    skipped: Sequence[int] = (),
+    dedup: Deduper | None = None,
+) -> int:
+    """Normalize dates and fold rows into `agg`.
+
+    Rows whose date cannot be normalized are rejected and skipped. With
+    `dedup`, rows it has seen before (in any file) are rejected first, in a
+    "dedup" stage of their own (see `etl.dedup`). Rows move between stages
+    in chunks of FOLD_CHUNK_ROWS, so each stage is timed on its own while
+    memory stays bounded. Rejects are recorded in `metrics` as rows of file
+    `source`, numbered past the rows the reader already `skipped` (see
+    `etl.quarantine.row_number`); without `metrics` they are logged as a
+    summary at the end. Returns the number of rows consumed.
+    """
+    own_metrics = metrics is None
+    if metrics is None:
+        metrics = RunMetrics()
+    # one normalizer per stream (file or byte range) so the format lock and
+    # the cache follow that input
+    normalize = DateNormalizer().normalize
+    it = iter(rows)
+    seen = 0
+    while True:
+        with metrics.timed("extract"):
+            chunk = list(islice(it, FOLD_CHUNK_ROWS))
+        if not chunk:
+            if own_metrics:
+                metrics.rejects.report()
+            return seen
+        base = seen
+        seen += len(chunk)
+        metrics.count("extract", len(chunk), len(chunk))
+
+        # chunk positions of the duplicates, to number the rows after them
+        chunk, duplicates = _drop_duplicates(
+            chunk, dedup, metrics, base, source, skipped
+        )
+
+        with metrics.timed("transform"):
+            normalized = []
+            dropped: List[int] = []
+            errors = []
+            for i, r in enumerate(chunk):
+                try:
+                    normalized.append(normalize(r, date_field=date_field))
+                except ValueError as exc:
+                    errors.append(
+                        (getattr(exc, "reason", "unparseable_date"), r.get(date_field))
+                    )
+                    dropped.append(i)
+            for (reason, value), pos in zip(errors, _undrop(dropped, duplicates)):
+                metrics.reject(
+                    "transform",
+                    reason,
+                    source=source,
+                    row=row_number(base + pos, skipped),
+                    value=value,
+                )
+        metrics.count("transform", len(normalized), len(normalized))
+
+        with metrics.timed("aggregate"):
+            before = agg.rows
+            if isinstance(agg, FixedPointAggregator):
+                pairs = [
+                    (r.get(agg.group_by), r.get(agg.value_field, 0)) for r in normalized
+                ]
+                rejected = agg.add_many(pairs)
+            else:
+                add = agg.add
+                rejected = [k for k, r in enumerate(normalized) if not add(r)]
+            for k, pos in zip(
+                rejected, _undrop(_undrop(rejected, dropped), duplicates)
+            ):
+                row = row_number(base + pos, skipped)
+                value = normalized[k].get(agg.value_field, 0)
+                metrics.reject(
+                    "aggregate",
+                    "non_numeric_value",
+                    source=source,
+                    row=row,
+                    value=value,
+                )
+            metrics.count("aggregate", agg.rows - before, 0)
+
+
+def fold_pairs(
+    pairs: Iterable[Tuple[str, str]],
+    agg: Aggregator,
+    metrics: RunMetrics | None = None,
+    source: str | None = None,
+    skipped: Sequence[int] = (),
+) -> int:
+    """Like `fold_rows`, for (date, amount) string pairs from a projected reader.
+
+    Rejects and totals are the same as for the equivalent dict rows.
+    Returns the number of pairs consumed.
+    """
+    own_metrics = metrics is None
+    if metrics is None:
+        metrics = RunMetrics()
+    parse = DateNormalizer().parse
+    it = iter(pairs)
+    seen = 0
+    while True:
+        with metrics.timed("extract"):
+            chunk = list(islice(it, FOLD_CHUNK_ROWS))
+        if not chunk:
+            if own_metrics:
+                metrics.rejects.report()
+            return seen
+        base = seen
+        seen += len(chunk)
+        metrics.count("extract", len(chunk), len(chunk))
+
+        with metrics.timed("transform"):
+            normalized = []
+            dropped: List[int] = []
+            for i, (raw, value) in enumerate(chunk):
+                iso = parse(raw) if raw else None
+                if iso is None:
+                    reason = "unparseable_date" if raw else "missing_date"
+                    metrics.reject(
+                        "transform",
+                        reason,
+                        source=source,
+                        row=row_number(base + i, skipped),
+                        value=raw,
+                    )
+                    dropped.append(i)
+                    continue
+                normalized.append((iso, value))
+        metrics.count("transform", len(normalized), len(normalized))
+
+        with metrics.timed("aggregate"):
+            before = agg.rows
+            if isinstance(agg, FixedPointAggregator):
+                rejected = agg.add_many(normalized)
+            else:
+                add_value = agg.add_value
+                rejected = [
+                    k
+                    for k, (key, value) in enumerate(normalized)
+                    if not add_value(key, value)
+                ]
+            for k, pos in zip(rejected, _undrop(rejected, dropped)):
+                row = row_number(base + pos, skipped)
+                metrics.reject(
+                    "aggregate",
+                    "non_numeric_value",
+                    source=source,
+                    row=row,
+                    value=normalized[k][1],
+                )
+            metrics.count("aggregate", agg.rows - before, 0)
+
+
+def _undrop(kept: List[int], dropped: List[int]) -> List[int]:
+    """Chunk positions of the rows at ascending indexes `kept` of what was
+    left after dropping the ascending positions `dropped`."""
+    if not dropped:
+        return kept
+    positions = []
+    j = 0
+    for k in kept:
+        while j < len(dropped) and dropped[j] <= k + j:
+            j += 1
+        positions.append(k + j)
+    return positions
+
+
+def aggregate(
+    rows: Iterable[Dict[str, Any]],
+    group_by: str | Sequence[str] = "date",
+    value_field: str = "amount",
+    stats: Sequence[str] | None = None,
+) -> List[Dict[str, Any]]:
+    """Aggregate numeric `value_field` grouped by `group_by`.
+
+    Returns list of dicts with keys group_by and total_{value_field}. A
+    sequence `group_by` groups by several columns, and `stats` picks metrics
+    from AGG_METRICS to compute in the same pass (see StatsAggregator).
+    """
+    if stats is None and isinstance(group_by, str):
+        return (
+            Aggregator(group_by=group_by, value_field=value_field)
+            .update(rows)
+            .results()
+        )
+    return (
+        StatsAggregator(group_by, value_field, stats or ("sum",)).update(rows).results()
+    )
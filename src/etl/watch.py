@@ -0,0 +1,192 @@
+"""Long-running watch mode: ingest new files as micro-batches.
+
+A `Watcher` keeps one engine (and its connection pool) and the processed-file
+manifest in memory, and polls the input folder every `interval` seconds.
+New or changed files are loaded like `--incremental` runs load them: their
+per-date deltas are added to `results` and the manifest is updated in the
+same transaction.
+
+`interval` bounds how long a file waits before it is picked up; `max_files`
+bounds how many files go into one transaction, so a large backlog is worked
+off in several commits without sleeping in between. A file is only picked
+up once its mtime is `settle` seconds old, so files still being written are
+left for a later poll. Writers that rename finished files into the folder
+can use `settle=0`.
+
+A file that cannot be loaded (e.g. invalid UTF-8, or `.zst` without
+zstandard) must not hold back the files queued after it. After a batch of
+several files fails, files are loaded one at a time until the backlog is
+worked off, so a failure points at one file; a file that fails
+`max_attempts` times is skipped, with an error logged, until it changes.
+"""
+from __future__ import annotations
+
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+from .extract import list_csv_files
+from .logger import get_logger
+from .manifest import FileEntry, Manifest, file_key, load_changed, load_manifest
+from .metrics import RunMetrics
+from .shard import Shard
+
+logger = get_logger(__name__)
+
+DEFAULT_INTERVAL = 5.0
+DEFAULT_SETTLE = 2.0
+DEFAULT_MAX_ATTEMPTS = 3
+
+
+class Watcher:
+    """Polls a folder and loads what is new into the database."""
+
+    def __init__(
+        self,
+        engine,
+        folder: str | Path,
+        *,
+        max_files: int | None = None,
+        settle: float = DEFAULT_SETTLE,
+        workers: int = 1,
+        batch_size: int | None = None,
+        reader: str = "csv",
+        metrics: RunMetrics | None = None,
+        shard: Shard | None = None,
+        max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+    ) -> None:
+        self.engine = engine
+        self.folder = folder
+        self.max_files = max_files
+        self.settle = settle
+        self.workers = workers
+        self.batch_size = batch_size
+        self.reader = reader
+        self.metrics = metrics if metrics is not None else RunMetrics()
+        self.shard = shard
+        self.max_attempts = max_attempts
+        self.manifest: Manifest | None = None
+        self.files = 0
+        self.written = 0
+        # failed attempts per file key, and the (size, mtime_ns) of files given up on
+        self.failures: Dict[str, int] = {}
+        self.skipped: Dict[str, Tuple[int, int]] = {}
+        # load one file per batch, to tell which file fails
+        self.isolate = False
+        # the last batch was full, so more files are likely waiting
+        self.backlog = False
+
+    def _ready(self) -> List[Path]:
+        cutoff = time.time() - self.settle
+        ready = []
+        for f in list_csv_files(self.folder, self.shard):
+            st = f.stat()
+            if st.st_mtime > cutoff:
+                continue
+            key = file_key(f)
+            if key in self.skipped:
+                if self.skipped[key] == (st.st_size, st.st_mtime_ns):
+                    continue
+                del self.skipped[key]
+                logger.info("%s changed since it was skipped; loading it again", key)
+            ready.append(f)
+        return ready
+
+    def _failed(self, changed: List[FileEntry]) -> None:
+        if len(changed) > 1:
+            self.isolate = True
+            return
+        for e in changed:
+            n = self.failures.get(e.path, 0) + 1
+            if n < self.max_attempts:
+                self.failures[e.path] = n
+                continue
+            self.failures.pop(e.path, None)
+            self.skipped[e.path] = (e.size, e.mtime_ns)
+            logger.error(
+                "Skipping %s after %d failed attempts; it is loaded again once it"
+                " changes",
+                e.path,
+                n,
+            )
+
+    def _load_manifest(self) -> Manifest:
+        if self.manifest is None:
+            with self.engine.connect() as conn:
+                self.manifest = load_manifest(conn)
+        return self.manifest
+
+    def poll(self) -> Tuple[int, int]:
+        """Load one micro-batch. Returns (files loaded, rows written)."""
+        self.backlog = False
+        limit = 1 if self.isolate else self.max_files
+        changed, touched = self._load_manifest().changed_files(
+            self._ready(), limit=limit
+        )
+        if not changed:
+            self.isolate = False
+        if not changed and not touched:
+            return 0, 0
+        try:
+            written = load_changed(
+                self.engine,
+                self.manifest,
+                changed,
+                touched,
+                workers=self.workers,
+                batch_size=self.batch_size,
+                metrics=self.metrics,
+                reader=self.reader,
+            )
+        except Exception:
+            # the transaction rolled back; re-read what was actually committed
+            self.manifest = None
+            self._failed(changed)
+            raise
+        for e in changed:
+            self.failures.pop(e.path, None)
+        self.backlog = limit is not None and len(changed) >= limit
+        self.files += len(changed)
+        self.written += written
+        # summarize this micro-batch's rejects rather than the whole uptime's
+        self.metrics.rejects.report()
+        return len(changed), written
+
+    def run(
+        self, stop: threading.Event, interval: float = DEFAULT_INTERVAL
+    ) -> Tuple[int, int]:
+        """Poll until `stop` is set. Returns (files loaded, rows written) in total.
+
+        A micro-batch in progress when `stop` is set is finished first. Errors
+        are logged and the batch retried on the next poll (see the module
+        docstring for files that keep failing); so are errors reading the
+        manifest, at startup too, except that a `results` table the manifest
+        does not cover raises ValueError at once.
+        """
+        logger.info("Watching %s every %.1fs", self.folder, interval)
+        while not stop.is_set():
+            try:
+                self._load_manifest()
+            except ValueError:
+                raise
+            except Exception:
+                logger.exception(
+                    "Reading etl_manifest failed; retrying in %.1fs", interval
+                )
+                stop.wait(interval)
+                continue
+            try:
+                self.poll()
+            except Exception:
+                logger.exception("Micro-batch failed; retrying in %.1fs", interval)
+            # a full batch likely left more files behind: go again right away
+            if not self.backlog:
+                stop.wait(interval)
+        logger.info(
+            "Stopped watching %s: %d files, %d rows written",
+            self.folder,
+            self.files,
+            self.written,
+        )
+        return self.files, self.written
@@ -0,0 +1,112 @@
+"""Unit tests for the parse-once column cache."""
+import os
+from pathlib import Path
+
+import pytest
+
+from etl import cache
+from etl.extract import read_csv_folder
+from etl.main import run
+from etl.metrics import RunMetrics
+from etl.transform import Aggregator, normalize_date
+
+pytestmark = pytest.mark.skipif(not cache.available(), reason="NumPy not installed")
+
+
+def write_files(folder: Path) -> None:
+    (folder / "a.csv").write_text(
+        "date,amount,category\n2025-01-01,1.5,food\n02/01/2025,2,rent\n,9,x\n2025-01-01,x,food\n",
+        encoding="utf8",
+    )
+    (folder / "b.csv").write_text(
+        "date,amount,category\n2025/01/03,4,rent\nbad,1,food\n2025-01-02,0.25\n",
+        encoding="utf8",
+    )
+
+
+def row_engine(folder: Path, group_by: str, value_field: str) -> Aggregator:
+    agg = Aggregator(group_by=group_by, value_field=value_field)
+    for row in read_csv_folder(folder):
+        try:
+            agg.add(normalize_date(row))
+        except ValueError:
+            pass
+    return agg
+
+
+@pytest.mark.parametrize(
+    "group_by,value_field",
+    [
+        ("date", "amount"),
+        ("category", "amount"),
+        ("date", "category"),
+        ("nope", "amount"),
+    ],
+)
+def test_cached_matches_row_engine(tmp_path, group_by, value_field):
+    data = tmp_path / "data"
+    data.mkdir()
+    write_files(data)
+    expected = row_engine(data, group_by, value_field)
+    column_cache = cache.ColumnCache(tmp_path / "cache")
+
+    for _ in range(2):  # miss, then hit
+        agg, seen = cache.aggregate_cached(
+            data, column_cache, group_by=group_by, value_field=value_field
+        )
+        assert agg.results() == expected.results()
+        assert agg.rows == expected.rows
+        assert seen == 6
+
+
+def test_hit_skips_parsing_and_replays_metrics(tmp_path, monkeypatch):
+    data = tmp_path / "data"
+    data.mkdir()
+    write_files(data)
+    column_cache = cache.ColumnCache(tmp_path / "cache")
+    first = RunMetrics()
+    cache.aggregate_cached(data, column_cache, metrics=first)
+
+    monkeypatch.setattr(
+        cache, "read_csv_file", lambda *a, **k: pytest.fail("file was parsed again")
+    )
+    second = RunMetrics()
+    reopened = cache.ColumnCache(tmp_path / "cache")
+    cache.aggregate_cached(data, reopened, metrics=second)
+    for name in ("extract", "transform", "aggregate"):
+        assert second.stage(name).rows_in == first.stage(name).rows_in
+        assert second.stage(name).rejected == first.stage(name).rejected
+
+
+def test_changed_file_invalidates(tmp_path):
+    data = tmp_path / "data"
+    data.mkdir()
+    write_files(data)
+    column_cache = cache.ColumnCache(tmp_path / "cache")
+    cache.aggregate_cached(data, column_cache)
+
+    (data / "b.csv").write_text("date,amount\n2025-01-05,10\n", encoding="utf8")
+    os.utime(data / "b.csv", ns=(1, 1))
+    agg, _ = cache.aggregate_cached(data, column_cache)
+    assert agg.totals == {"2025-01-01": 1.5, "2025-01-02": 2.0, "2025-01-05": 10.0}
+
+
+def test_eviction_bounds_size(tmp_path):
+    data = tmp_path / "data"
+    data.mkdir()
+    write_files(data)
+    column_cache = cache.ColumnCache(tmp_path / "cache", max_bytes=1)
+    agg, _ = cache.aggregate_cached(data, column_cache)
+    assert agg.totals == row_engine(data, "date", "amount").totals
+    assert column_cache.size_bytes() == 0
+    assert [d for d in (tmp_path / "cache").iterdir() if d.is_dir()] == []
+
+
+def test_run_with_cache_dir(tmp_path, caplog):
+    data = tmp_path / "data"
+    data.mkdir()
+    write_files(data)
+    with caplog.at_level("INFO"):
+        run(str(data), dry_run=True, cache_dir=str(tmp_path / "cache"))
+        run(str(data), dry_run=True, cache_dir=str(tmp_path / "cache"))
+    assert any("2 of 2 files hit" in r.getMessage() for r in caplog.records)
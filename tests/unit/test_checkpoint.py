@@ -0,0 +1,89 @@
+"""Unit tests for checkpointed runs."""
+import os
+from pathlib import Path
+
+import pytest
+
+from etl import parallel
+from etl.checkpoint import aggregate_checkpointed, load_checkpoint
+from etl.extract import read_csv_folder
+from etl.main import run
+from etl.metrics import RunMetrics
+from etl.transform import Aggregator, fold_rows
+
+
+def write_files(folder: Path) -> None:
+    (folder / "a.csv").write_text(
+        "date,amount\n2025-01-01,1.5\n02/01/2025,2\n,9\n", encoding="utf8"
+    )
+    (folder / "b.csv").write_text(
+        "date,amount\n2025/01/03,4\n2025-01-01,x\nbad,1\n", encoding="utf8"
+    )
+    (folder / "c.csv").write_text(
+        "date,amount\n2025-01-02,0.25\n2025-01-01,8\n", encoding="utf8"
+    )
+
+
+def test_resume_after_crash_only_reads_unfinished_files(tmp_path, monkeypatch):
+    data = tmp_path / "data"
+    data.mkdir()
+    write_files(data)
+    ckpt_path = tmp_path / "etl.checkpoint"
+    serial = Aggregator()
+    serial_seen = fold_rows(read_csv_folder(data), serial)
+
+    real_read = parallel.read_csv_file
+    read = []
+
+    def reader(crash_on=None):
+        def read_csv_file(path, metrics=None, on_bad=None):
+            read.append(path.name)
+            if path.name == crash_on:
+                raise RuntimeError("container killed")
+            return real_read(path, metrics=metrics, on_bad=on_bad)
+
+        return read_csv_file
+
+    monkeypatch.setattr(parallel, "read_csv_file", reader(crash_on="c.csv"))
+    with pytest.raises(RuntimeError):
+        aggregate_checkpointed(data, ckpt_path, interval=0)
+    assert len(load_checkpoint(ckpt_path).done) == 2
+
+    read.clear()
+    monkeypatch.setattr(parallel, "read_csv_file", reader())
+    metrics = RunMetrics()
+    agg, seen = aggregate_checkpointed(
+        data, ckpt_path, resume=True, interval=0, metrics=metrics
+    )
+    assert read == ["c.csv"]
+    assert agg.results() == serial.results()
+    assert seen == serial_seen
+    # the resumed files' rows and rejects are still counted
+    assert metrics.stage("extract").rejected == {"missing_date_or_amount": 1}
+    assert metrics.stage("aggregate").rejected == {"non_numeric_value": 1}
+
+
+def test_resume_rejects_changed_files_and_options(tmp_path):
+    data = tmp_path / "data"
+    data.mkdir()
+    write_files(data)
+    ckpt_path = tmp_path / "etl.checkpoint"
+    aggregate_checkpointed(data, ckpt_path, interval=0)
+    with pytest.raises(ValueError, match="other options"):
+        aggregate_checkpointed(data, ckpt_path, resume=True, exact=True)
+    (data / "a.csv").write_text("date,amount\n2025-01-01,100\n", encoding="utf8")
+    with pytest.raises(ValueError, match="changed or disappeared"):
+        aggregate_checkpointed(data, ckpt_path, resume=True)
+
+
+def test_run_removes_checkpoint_after_load(tmp_path):
+    data = tmp_path / "data"
+    data.mkdir()
+    write_files(data)
+    ckpt_path = str(tmp_path / "etl.checkpoint")
+    url = f"sqlite:///{tmp_path / 'etl.db'}"
+    assert (
+        run(str(data), database_url=url, checkpoint=ckpt_path, checkpoint_interval=0)
+        == 3
+    )
+    assert not os.path.exists(ckpt_path)
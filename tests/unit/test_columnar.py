@@ -0,0 +1,73 @@
+"""Unit tests for the optional NumPy columnar engine."""
+from pathlib import Path
+
+import pytest
+
+from etl import columnar
+from etl.extract import list_csv_files, read_csv_folder
+from etl.main import run
+from etl.metrics import RunMetrics
+from etl.parallel import fold_file
+from etl.transform import Aggregator, fold_rows
+
+
+def write_fixtures(folder: Path) -> None:
+    (folder / "a.csv").write_text(
+        "date,amount,description\n"
+        "2025-01-01,10.1,valid\n"
+        "01/02/2025,5.0,eu format\n"
+        "2025/03/01,3,slashes\n"
+        "bad-date,7,malformed date\n"
+        ",8,missing date\n"
+        "\n"
+        "2025-01-01,0.2,again\n"
+        "12/31/2025,x,bad amount\n"
+        " 2025-01-01 , 0.3 ,padded\n"
+        "   ,1,blank date\n",
+        encoding="utf8",
+    )
+    (folder / "b.csv").write_text(
+        "amount,date\n1e3,2025-03-01\n4,12/31/2025\n7\n", encoding="utf8"
+    )
+
+
+def serial(folder: Path):
+    agg = Aggregator()
+    seen = fold_rows(read_csv_folder(folder), agg)
+    return agg, seen
+
+
+@pytest.mark.skipif(not columnar.available(), reason="NumPy not installed")
+@pytest.mark.parametrize("chunk_rows", [1, 3, columnar.CHUNK_ROWS])
+def test_columnar_matches_row_engine(tmp_path, chunk_rows):
+    write_fixtures(tmp_path)
+    expected, expected_seen = serial(tmp_path)
+    agg, seen = columnar.aggregate_folder_columnar(tmp_path, chunk_rows=chunk_rows)
+    # exact equality: same groups, same order, same float rounding
+    assert agg.results() == expected.results()
+    assert list(agg.totals) == list(expected.totals)
+    assert agg.rows == expected.rows
+    assert seen == expected_seen
+
+
+@pytest.mark.skipif(not columnar.available(), reason="NumPy not installed")
+def test_columnar_rejects_rows_like_the_row_engine(tmp_path):
+    write_fixtures(tmp_path)
+    expected = RunMetrics(quarantine=True)
+    agg = Aggregator()
+    for f in list_csv_files(tmp_path):
+        fold_file(f, agg, metrics=expected)
+    metrics = RunMetrics(quarantine=True)
+    columnar.aggregate_folder_columnar(tmp_path, metrics=metrics)
+    assert sorted(metrics.rejects.rows) == sorted(expected.rejects.rows)
+    assert ("a.csv", 7, "aggregate", "non_numeric_value", "x") in metrics.rejects.rows
+
+
+def test_run_columnar_falls_back_without_numpy(tmp_path, monkeypatch, caplog):
+    write_fixtures(tmp_path)
+    monkeypatch.setattr(columnar, "np", None)
+    with caplog.at_level("INFO", logger="etl.main"):
+        assert run(str(tmp_path), dry_run=True, engine="columnar") == 0
+    messages = [r.getMessage() for r in caplog.records]
+    assert any("falling back to the row engine" in m for m in messages)
+    assert any("Aggregated into 4 groups" in m for m in messages)
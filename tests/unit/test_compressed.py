@@ -0,0 +1,71 @@
+"""Unit tests for streaming compressed CSV input."""
+import bz2
+import gzip
+import lzma
+
+import pytest
+
+from etl import compressed
+from etl.extract import list_csv_files, read_csv_folder, read_projected_folder
+
+CONTENT = (
+    "date,amount,description\n"
+    "2025-01-01,1.5,a\n"
+    ",2,missing\n"
+    "02/01/2025, 3 ,c\n"
+    "\n"
+    "2025-01-03,4,d\n"
+)
+WRITERS = {"gz": gzip.compress, "bz2": bz2.compress, "xz": lzma.compress}
+
+
+@pytest.mark.parametrize("ext", sorted(WRITERS))
+def test_compressed_rows_match_plain(tmp_path, monkeypatch, ext):
+    plain = tmp_path / "plain"
+    packed = tmp_path / "packed"
+    plain.mkdir()
+    packed.mkdir()
+    (plain / "data.csv").write_text(CONTENT, encoding="utf8")
+    (packed / f"data.csv.{ext}").write_bytes(WRITERS[ext](CONTENT.encode("utf8")))
+    # tiny chunks so records straddle chunk boundaries
+    monkeypatch.setattr(compressed, "CHUNK_BYTES", 7)
+
+    assert list(read_csv_folder(packed)) == list(read_csv_folder(plain))
+    assert list(read_projected_folder(packed)) == list(read_projected_folder(plain))
+
+
+def test_list_csv_files_includes_compressed(tmp_path):
+    for name in ("a.csv", "b.csv.gz", "c.csv.zst", "d.csv.bak", "e.txt.gz"):
+        (tmp_path / name).write_bytes(b"")
+    assert [p.name for p in list_csv_files(tmp_path)] == [
+        "a.csv",
+        "b.csv.gz",
+        "c.csv.zst",
+    ]
+
+
+@pytest.mark.skipif(compressed.zstandard is not None, reason="zstandard is installed")
+def test_zstd_without_package_raises(tmp_path):
+    (tmp_path / "data.csv.zst").write_bytes(b"\x28\xb5\x2f\xfd")
+    with pytest.raises(RuntimeError, match="zstandard"):
+        list(read_csv_folder(tmp_path))
+
+
+def test_corrupt_file_raises_in_reader(tmp_path):
+    (tmp_path / "data.csv.gz").write_bytes(b"not gzip at all")
+    with pytest.raises(OSError):
+        list(read_csv_folder(tmp_path))
+
+
+def test_early_close_stops_decompressor(tmp_path, monkeypatch):
+    monkeypatch.setattr(compressed, "_PUT_POLL_SECONDS", 0.01)
+    (tmp_path / "data.csv.gz").write_bytes(
+        gzip.compress(b"date,amount\n" + b"2025-01-01,1\n" * 10000)
+    )
+    reader = compressed.ThreadedReader(
+        tmp_path / "data.csv.gz", chunk_bytes=16, depth=1
+    )
+    assert reader.read_chunk()
+    reader.close()
+    reader._worker.join(timeout=5)
+    assert not reader._worker.is_alive()
@@ -0,0 +1,291 @@
+"""Unit tests for duplicate-row detection."""
+import json
+import random
+from pathlib import Path
+
+import pytest
+from sqlalchemy import create_engine, text
+
+from etl.dedup import (
+    DEFAULT_MAX_BYTES,
+    DUPLICATE,
+    NEW,
+    PROBABLE,
+    BloomFilter,
+    Deduper,
+    FingerprintSet,
+    capacity,
+    estimate_rows,
+    required_bytes,
+    row_fingerprint,
+)
+from etl.extract import read_csv_file
+from etl.main import main, run
+from etl.metrics import RunMetrics
+
+
+def write_files(folder: Path) -> None:
+    (folder / "a.csv").write_text(
+        "date,amount\n2025-01-01,1.5\n2025-01-02,2\n2025-01-01,1.5\n", encoding="utf8"
+    )
+    # a re-delivery of a.csv's first row after a bad row (blank lines are not rows)
+    (folder / "b.csv").write_text(
+        "date,amount\n,9\n\n2025-01-01,1.5\n2025-01-03,4\n", encoding="utf8"
+    )
+
+
+def fingerprints(n: int, seed: int):
+    rng = random.Random(seed)
+    return list(dict.fromkeys(rng.getrandbits(64) | 1 for _ in range(n)))
+
+
+def test_fingerprint_set_grows_and_keeps_its_members():
+    fps = FingerprintSet(slots=16)
+    values = fingerprints(1000, 7)
+    for fp in values:
+        if fps.full:
+            fps.grow()
+        assert fps.add(fp)
+    assert len(fps) == 1000 and fps.nbytes == 8 * 2048
+    assert all(fp in fps for fp in values)
+    assert not fps.add(values[0])
+    assert 12345 not in fps
+
+
+def test_row_fingerprint_depends_on_the_values():
+    assert row_fingerprint({"date": "2025-01-01", "amount": "1"}) == row_fingerprint(
+        {"date": "2025-01-01", "amount": "1"}
+    )
+    assert row_fingerprint({"date": "2025-01-01", "amount": "1"}) != row_fingerprint(
+        {"date": "2025-01-01", "amount": "2"}
+    )
+    # surplus fields land in a list
+    assert row_fingerprint({"date": "2025-01-01", "amount": "1", None: ["x"]}) > 0
+
+
+def test_deduper_filters_repeated_rows():
+    rows = [{"a": str(i % 3)} for i in range(6)]
+    deduper = Deduper()
+    kept, dropped = deduper.filter(rows)
+    assert kept == rows[:3]
+    assert dropped == [(3, DUPLICATE), (4, DUPLICATE), (5, DUPLICATE)]
+    assert list(deduper.unique([{"a": "0"}, {"a": "9"}])) == [{"a": "9"}]
+    assert (deduper.rows, deduper.duplicates, deduper.probable) == (8, 4, 0)
+
+
+def test_full_budget_fails_without_bloom():
+    deduper = Deduper(max_bytes=64 * 1024)
+    with pytest.raises(RuntimeError, match="dedup budget"):
+        for i in range(1, 10_000):
+            deduper.check(i)
+    assert deduper.nbytes <= 64 * 1024
+    with pytest.raises(ValueError):
+        Deduper(max_bytes=1024)
+
+
+def test_bloom_filter_takes_over_within_the_budget():
+    deduper = Deduper(max_bytes=128 * 1024, bloom=True)
+    values = fingerprints(20_000, 3)
+    verdicts = [deduper.check(fp) for fp in values]
+    assert deduper.bloom is not None
+    assert deduper.nbytes <= 128 * 1024
+    # the frozen table still answers exactly, the Bloom filter approximately
+    assert deduper.check(values[0]) == DUPLICATE
+    assert deduper.check(values[-1]) == PROBABLE
+    assert verdicts.count(NEW) > 19_900
+    assert 0 < deduper.bloom.false_positive_rate < 0.01
+
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = BloomFilter(4096)
+    assert bloom.nbytes == 4096
+    for fp in range(1, 2000, 7):
+        bloom.add(fp * 0x9E3779B97F4A7C15 & ((1 << 64) - 1))
+    assert not any(
+        bloom.add(fp * 0x9E3779B97F4A7C15 & ((1 << 64) - 1)) for fp in range(1, 2000, 7)
+    )
+
+
+def test_run_drops_duplicates_across_files_and_quarantines_them(tmp_path):
+    data = tmp_path / "data"
+    data.mkdir()
+    write_files(data)
+    metrics = RunMetrics(quarantine=True)
+    inserted = run(str(data), dry_run=True, dedup=True, metrics=metrics)
+    assert inserted == 0
+    assert metrics.stage("dedup").rejected == {"duplicate_row": 2}
+    assert metrics.stage("dedup").rows_in == 5 and metrics.stage("dedup").rows_out == 3
+    assert metrics.memory["dedup"] > 0
+    assert metrics.to_dict()["memory_bytes"]["dedup"] == metrics.memory["dedup"]
+
+
+def test_quarantine_lists_duplicates_with_their_row_numbers(tmp_path):
+    data = tmp_path / "data"
+    data.mkdir()
+    write_files(data)
+    path = tmp_path / "rejects.jsonl"
+    main(["--input", str(data), "--dry-run", "--dedup", "--quarantine", str(path)])
+    records = [
+        json.loads(line) for line in path.read_text(encoding="utf8").splitlines()
+    ]
+    duplicates = [r for r in records if r["stage"] == "dedup"]
+    assert duplicates == [
+        {
+            "file": "a.csv",
+            "row": 3,
+            "stage": "dedup",
+            "reason": "duplicate_row",
+            "value": "2025-01-01,1.5",
+        },
+        {
+            "file": "b.csv",
+            "row": 2,
+            "stage": "dedup",
+            "reason": "duplicate_row",
+            "value": "2025-01-01,1.5",
+        },
+    ]
+
+
+def test_dedup_changes_the_totals_only_by_the_duplicates(tmp_path):
+    data = tmp_path / "data"
+    data.mkdir()
+    write_files(data)
+    url = f"sqlite:///{tmp_path / 'etl.db'}"
+    assert run(str(data), database_url=url, dedup=True) == 3
+    with create_engine(url).connect() as conn:
+        rows = conn.execute(
+            text("SELECT date, total_amount FROM results ORDER BY date")
+        ).fetchall()
+    assert [(str(d), float(t)) for d, t in rows] == [
+        ("2025-01-01", 1.5),
+        ("2025-01-02", 2.0),
+        ("2025-01-03", 4.0),
+    ]
+
+
+@pytest.mark.parametrize(
+    "argv",
+    [
+        ["--dedup-bloom"],
+        ["--dedup-memory", "8"],
+        ["--dedup", "--workers", "2"],
+        ["--dedup", "--reader", "mmap"],
+        ["--dedup", "--pipeline"],
+    ],
+)
+def test_cli_rejects_bad_dedup_options(tmp_path, argv):
+    with pytest.raises(SystemExit):
+        main(["--input", str(tmp_path)] + argv)
+
+
+def test_capacity_is_what_fits_before_the_run_fails():
+    assert capacity(DEFAULT_MAX_BYTES) == 32 * 1024 * 1024
+    assert capacity(DEFAULT_MAX_BYTES, bloom=True) == capacity(DEFAULT_MAX_BYTES) // 2
+    assert required_bytes(capacity(DEFAULT_MAX_BYTES)) == DEFAULT_MAX_BYTES
+    assert required_bytes(capacity(DEFAULT_MAX_BYTES) + 1) == 2 * DEFAULT_MAX_BYTES
+    # a billion rows need 16 GiB, not the default
+    assert required_bytes(10**9) == 16 * 1024**3
+    deduper = Deduper(max_bytes=64 * 1024)
+    for fp in range(1, deduper.capacity + 1):
+        deduper.check(fp)
+    with pytest.raises(RuntimeError):
+        deduper.check(deduper.capacity + 1)
+
+
+def test_estimate_rows_from_file_sizes(tmp_path):
+    for name, rows in (("a.csv", 3000), ("b.csv", 1000)):
+        lines = [f"2025-01-{i % 28 + 1:02d},{i}.25" for i in range(rows)]
+        (tmp_path / name).write_text(
+            "date,amount\n" + "\n".join(lines) + "\n", encoding="utf8"
+        )
+    files = sorted(tmp_path.glob("*.csv"))
+    assert 3800 < estimate_rows(files) < 4200
+    assert estimate_rows([]) == 0
+
+
+def test_plan_partitions_on_disk_what_will_not_fit():
+    deduper = Deduper(max_bytes=64 * 1024)
+    deduper.plan(4096)
+    assert not deduper.on_disk
+    deduper.plan(5000)
+    # each partition about half of the table's 4,096 rows
+    assert deduper.on_disk and deduper.partitions == 3
+    # a Bloom filter is an overflow tier, not a way to take billions of rows
+    Deduper(bloom=True).plan(40_000_000)
+    with pytest.raises(ValueError, match="50% of new rows"):
+        Deduper(bloom=True).plan(10**9)
+
+
+def write_repeats(folder: Path, rows: int = 12_000) -> None:
+    # every third row repeats an earlier one, often of the other file
+    def line(i):
+        return f"2025-01-{i % 28 + 1:02d},{i * 0.25}"
+
+    for name, offset in (("a.csv", 0), ("b.csv", rows // 2)):
+        lines = [
+            line(i // 3 if i % 3 == 2 else i)
+            for i in range(offset, offset + rows // 2)
+        ]
+        (folder / name).write_text(
+            "date,amount\n" + "\n".join(lines) + "\n", encoding="utf8"
+        )
+
+
+def test_dedup_on_disk_matches_in_memory(tmp_path, caplog):
+    write_repeats(tmp_path)
+    results = {}
+    for budget in (None, 64 * 1024):
+        metrics = RunMetrics(quarantine=True)
+        with caplog.at_level("INFO", logger="etl.main"):
+            run(
+                str(tmp_path),
+                dry_run=True,
+                dedup=True,
+                dedup_max_bytes=budget,
+                metrics=metrics,
+            )
+        messages = [r.getMessage() for r in caplog.records]
+        results[budget] = (
+            [m for m in messages if "would insert" in m],
+            metrics.rejects.rows,
+            metrics.stage("dedup").rows_out,
+        )
+        caplog.clear()
+    assert results[64 * 1024] == results[None]
+    assert len(results[None][1]) > 2000
+    # the partitions checked one at a time fit the budget
+    assert metrics.memory["dedup"] <= 64 * 1024
+
+
+def test_dedup_on_disk_splits_partitions_the_estimate_undersized(tmp_path):
+    write_repeats(tmp_path, rows=30_000)
+    files = sorted(tmp_path.glob("*.csv"))
+    in_memory = Deduper()
+    deduper = Deduper(max_bytes=64 * 1024, tmp_dir=str(tmp_path))
+    # as if the input were estimated at 4,097 rows rather than 30,000
+    deduper.plan(4097)
+    deduper.scan(files)
+    assert deduper.resplits > 0 and deduper.scanned == 30_000
+    assert deduper.nbytes <= 64 * 1024
+    for f in files:
+        rows = list(read_csv_file(f))
+        assert deduper.filter(rows) == in_memory.filter(rows)
+    deduper.close()
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["a.csv", "b.csv"]
+
+
+def test_dedup_on_disk_fails_when_the_input_changes(tmp_path):
+    write_repeats(tmp_path)
+    files = sorted(tmp_path.glob("*.csv"))
+    deduper = Deduper(max_bytes=64 * 1024)
+    deduper.plan(12_000)
+    deduper.scan(files)
+    deduper.filter(list(read_csv_file(files[0]))[:-1])
+    with pytest.raises(RuntimeError, match="input changed"):
+        deduper.close()
+
+
+def test_run_rejects_dedup_with_parallel_engines(tmp_path):
+    with pytest.raises(ValueError):
+        run(str(tmp_path), dry_run=True, dedup=True, workers=2)
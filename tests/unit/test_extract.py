@@ -5,7 +5,7 @@ from pathlib import Path
 
 import pytest
 
-from etl.extract import read_csv_folder
+from etl.extract import read_csv_folder, read_projected_file, read_projected_folder
 
 
 @pytest.fixture
@@ -32,7 +32,7 @@ def test_read_csv_single_file(temp_dir):
     """Test reading from a single valid CSV file."""
     content = "date,amount\n2025-01-01,100\n2025-01-02,200"
     create_csv_file(temp_dir, "data.csv", content)
-    
+
     rows = list(read_csv_folder(temp_dir))
     assert len(rows) == 2
     assert rows[0] == {"date": "2025-01-01", "amount": "100"}
@@ -43,7 +43,7 @@ def test_read_csv_multiple_files(temp_dir):
     """Test reading from multiple CSV files."""
     create_csv_file(temp_dir, "data1.csv", "date,amount\n2025-01-01,100")
     create_csv_file(temp_dir, "data2.csv", "date,amount\n2025-01-02,200")
-    
+
     rows = list(read_csv_folder(temp_dir))
     assert len(rows) == 2
     dates = {r["date"] for r in rows}
@@ -54,7 +54,7 @@ def test_read_csv_skip_invalid_rows(temp_dir):
     """Test that invalid rows are skipped."""
     content = "date,amount\n2025-01-01,100\n,200\n2025-01-02,\n2025-01-03,300"
     create_csv_file(temp_dir, "data.csv", content)
-    
+
     rows = list(read_csv_folder(temp_dir))
     assert len(rows) == 2
     dates = {r["date"] for r in rows}
@@ -65,7 +65,7 @@ def test_read_csv_strips_whitespace(temp_dir):
     """Test that whitespace is stripped from string values."""
     content = "date,amount\n 2025-01-01 , 100 \n"
     create_csv_file(temp_dir, "data.csv", content)
-    
+
     rows = list(read_csv_folder(temp_dir))
     assert len(rows) == 1
     assert rows[0] == {"date": "2025-01-01", "amount": "100"}
@@ -75,7 +75,7 @@ def test_read_csv_ignores_non_csv_files(temp_dir):
     """Test that non-CSV files are ignored."""
     create_csv_file(temp_dir, "data.csv", "date,amount\n2025-01-01,100")
     create_csv_file(temp_dir, "data.txt", "date,amount\n2025-01-02,200")
-    
+
     rows = list(read_csv_folder(temp_dir))
     assert len(rows) == 1
     assert rows[0] == {"date": "2025-01-01", "amount": "100"}
@@ -85,7 +85,7 @@ def test_read_csv_with_extra_columns(temp_dir):
     """Test reading CSV with additional columns."""
     content = "date,amount,category\n2025-01-01,100,food\n"
     create_csv_file(temp_dir, "data.csv", content)
-    
+
     rows = list(read_csv_folder(temp_dir))
     assert len(rows) == 1
     assert rows[0] == {"date": "2025-01-01", "amount": "100", "category": "food"}
@@ -95,7 +95,42 @@ def test_read_csv_with_empty_strings(temp_dir):
     """Test that empty strings are preserved for non-required fields."""
     content = "date,amount,category\n2025-01-01,100,\n"
     create_csv_file(temp_dir, "data.csv", content)
-    
+
     rows = list(read_csv_folder(temp_dir))
     assert len(rows) == 1
-    assert rows[0] == {"date": "2025-01-01", "amount": "100", "category": ""}
\ No newline at end of file
+    assert rows[0] == {"date": "2025-01-01", "amount": "100", "category": ""}
+
+
+def test_projected_reader_matches_dict_reader(temp_dir):
+    """The mmap reader yields the same date/amount values and skips the same rows."""
+    content = (
+        "description,amount,date\r\n"
+        "a,100, 2025-01-01 \r\n"
+        "\r\n"
+        "b,,2025-01-02\r\n"
+        '"quoted, with comma",3,2025-01-03\r\n'
+        "c,4\r\n"
+        "d,5,2025-01-05"
+    )
+    create_csv_file(temp_dir, "data.csv", content)
+
+    expected = [(r["date"], r["amount"]) for r in read_csv_folder(temp_dir)]
+    assert list(read_projected_folder(temp_dir)) == expected
+    assert expected == [("2025-01-01", "100"), ("2025-01-03", "3"), ("2025-01-05", "5")]
+
+
+def test_projected_reader_numbers_bad_rows_like_dict_reader(temp_dir):
+    create_csv_file(
+        temp_dir, "data.csv", "date,amount\n2025-01-01,1\n\n,2\n2025-01-03,\n"
+    )
+
+    bad = []
+    list(read_projected_file(Path(temp_dir) / "data.csv", on_bad=bad.append))
+    assert bad == [2, 3]
+
+
+def test_projected_reader_empty_and_header_only(temp_dir):
+    create_csv_file(temp_dir, "empty.csv", "")
+    create_csv_file(temp_dir, "header.csv", "date,amount\n")
+
+    assert list(read_projected_folder(temp_dir)) == []
@@ -4,8 +4,18 @@ from sqlalchemy import create_engine, text
 from unittest.mock import Mock, patch
 
 
+import datetime
 import os
-from etl.load import ensure_table, insert_aggregates, load_from_aggregates
+from decimal import Decimal
+
+from etl.load import (
+    ensure_table,
+    insert_aggregates,
+    load_from_aggregates,
+    write_aggregates,
+)
+
+
 @pytest.fixture
 def test_db(tmp_path):
     """Create a test SQLite database and clean up after."""
@@ -30,29 +40,40 @@ def mock_engine():
     return engine
 
 
+def _results_writes(engine):
+    calls = engine.begin().__enter__().execute.call_args_list
+    return [c for c in calls if str(c[0][0]).startswith("INSERT INTO results (")]
+
+
 def test_ensure_table(mock_engine):
     """Test table creation."""
+    conn = mock_engine.begin().__enter__()
+    # no unique date index yet
+    conn.execute = Mock(return_value=Mock(scalar=Mock(return_value=False), rowcount=0))
     ensure_table(mock_engine)
-    
-    # Verify execute was called with CREATE TABLE
-    mock_engine.begin().__enter__().execute.assert_called_once()
-    call_args = mock_engine.begin().__enter__().execute.call_args[0][0]
-    assert "CREATE TABLE" in str(call_args)
-    assert "results" in str(call_args)
+
+    statements = [str(call[0][0]) for call in conn.execute.call_args_list]
+    assert statements[0] == "CREATE SCHEMA IF NOT EXISTS etl"
+    assert "CREATE TABLE IF NOT EXISTS results" in statements[1]
+    # duplicates are merged before the unique index is built
+    assert statements[-2].startswith("DELETE FROM results")
+    assert statements[-1].startswith(
+        "CREATE UNIQUE INDEX IF NOT EXISTS results_date_key"
+    )
 
 
 def test_insert_aggregates(mock_engine):
     """Test inserting aggregated data."""
     rows = [
-        {"date": "2025-01-01", "total_amount": "100.50"},
-        {"date": "2025-01-02", "total_amount": "200.75"}
+        {"date": datetime.date(2025, 1, 1), "total_amount": Decimal("100.50")},
+        {"date": datetime.date(2025, 1, 2), "total_amount": 200.75},
     ]
-    
+
     count = insert_aggregates(mock_engine, rows)
     assert count == 2
-    
-    # Verify execute was called twice with INSERT
-    assert mock_engine.begin().__enter__().execute.call_count == 2
+
+    # Verify a single multi-row INSERT was issued, then the rollups refreshed
+    assert len(_results_writes(mock_engine)) == 1
     for call in mock_engine.begin().__enter__().execute.call_args_list:
         assert "INSERT INTO" in str(call[0][0])
 
@@ -61,7 +82,7 @@ def test_insert_aggregates_empty(mock_engine):
     """Test inserting empty data."""
     count = insert_aggregates(mock_engine, [])
     assert count == 0
-    
+
     # Verify execute was not called
     mock_engine.begin().__enter__().execute.assert_not_called()
 
@@ -69,30 +90,27 @@ def test_insert_aggregates_empty(mock_engine):
 def test_insert_aggregates_null_values(mock_engine):
     """Test inserting rows with null values."""
     rows = [
-        {"date": "2025-01-01", "total_amount": None},
-        {"date": "2025-01-02", "total_amount": "100.50"}
+        {"date": datetime.date(2025, 1, 1), "total_amount": None},
+        {"date": datetime.date(2025, 1, 2), "total_amount": Decimal("100.50")},
     ]
-    
-    count = insert_aggregates(mock_engine, rows)
-    assert count == 2
-    
-    # Verify execute was called twice
-    assert mock_engine.begin().__enter__().execute.call_count == 2
-
 
+    count = insert_aggregates(mock_engine, rows)
+    assert count == 1
 
+    # The null amount fails the sanity check; the rest goes in one statement
+    assert len(_results_writes(mock_engine)) == 1
 
 
 def test_insert_aggregates(mock_engine):
     """Test inserting aggregated data (mocked)."""
     rows = [
-        {"date": "2025-01-01", "total_amount": "100.50"},
-        {"date": "2025-01-02", "total_amount": "200.75"}
+        {"date": datetime.date(2025, 1, 1), "total_amount": Decimal("100.50")},
+        {"date": datetime.date(2025, 1, 2), "total_amount": 200.75},
     ]
     count = insert_aggregates(mock_engine, rows)
     assert count == 2
-    # Verify execute was called twice with INSERT
-    assert mock_engine.begin().__enter__().execute.call_count == 2
+    # Verify a single multi-row INSERT was issued, then the rollups refreshed
+    assert len(_results_writes(mock_engine)) == 1
     for call in mock_engine.begin().__enter__().execute.call_args_list:
         assert "INSERT INTO" in str(call[0][0])
 
@@ -108,34 +126,378 @@ def test_insert_aggregates_empty(mock_engine):
 def test_insert_aggregates_null_values(mock_engine):
     """Test inserting rows with null values (mocked)."""
     rows = [
-        {"date": "2025-01-01", "total_amount": None},
-        {"date": "2025-01-02", "total_amount": "100.50"}
+        {"date": datetime.date(2025, 1, 1), "total_amount": None},
+        {"date": datetime.date(2025, 1, 2), "total_amount": Decimal("100.50")},
     ]
     count = insert_aggregates(mock_engine, rows)
-    assert count == 2
-    # Verify execute was called twice
-    assert mock_engine.begin().__enter__().execute.call_count == 2
+    assert count == 1
+    # The null amount fails the sanity check; the rest goes in one statement
+    assert len(_results_writes(mock_engine)) == 1
 
 
 def test_load_from_aggregates_with_mock_engine(monkeypatch, test_db):
     """Test the full load process with a mock engine."""
     rows = [
-        {"date": "2025-01-01", "total_amount": "100.50"},
-        {"date": "2025-01-02", "total_amount": "200.75"}
+        {"date": datetime.date(2025, 1, 1), "total_amount": Decimal("100.50")},
+        {"date": datetime.date(2025, 1, 2), "total_amount": 200.75},
     ]
-    
+
     def mock_get_engine(url):
         return test_db
-        
+
     monkeypatch.setattr("etl.db.get_engine", mock_get_engine)
-    
+
     count = load_from_aggregates(f"sqlite:///{test_db.url.database}", rows)
     assert count == 2
-    
+
     # Verify data was loaded
     with test_db.begin() as conn:
-        result = conn.execute(text(
-            "SELECT count(*) FROM results"
-        )).fetchone()
+        result = conn.execute(text("SELECT count(*) FROM results")).fetchone()
         assert result[0] == 2
 
+
+def test_insert_aggregates_batches_multi_row_insert(test_db):
+    """Without COPY, rows are written in multi-row INSERT batches."""
+    ensure_table(test_db)
+    rows = [
+        {"date": datetime.date(2025, 1, d), "total_amount": d * 1.5}
+        for d in range(1, 11)
+    ]
+    rows.append({"date": "2025-02-01", "total_amount": 1.0})
+    assert insert_aggregates(test_db, rows, batch_size=3) == 10
+    with test_db.begin() as conn:
+        total = conn.execute(text("SELECT sum(total_amount) FROM results")).scalar()
+    assert total == pytest.approx(82.5)
+
+
+def test_write_aggregates_uses_copy_on_psycopg2():
+    """On psycopg2 the rows are streamed through COPY FROM STDIN."""
+    conn = Mock()
+    conn.dialect.driver = "psycopg2"
+    cursor = conn.connection.cursor.return_value
+    captured = {}
+    cursor.copy_expert.side_effect = lambda sql, buf: captured.update(
+        sql=sql, data=buf.read()
+    )
+    rows = [
+        {"date": datetime.date(2025, 1, 1), "total_amount": Decimal("100.50")},
+        {"date": "not-a-date", "total_amount": 1},
+        {"date": datetime.date(2025, 1, 2), "total_amount": 2.5},
+    ]
+    assert write_aggregates(conn, rows, mode="insert") == 2
+    # no INSERT: the only statements refresh the rollups
+    statements = [str(c[0][0]) for c in conn.execute.call_args_list]
+    assert [s.split()[2] for s in statements] == ["results_monthly", "results_yearly"]
+    assert captured["sql"].startswith("COPY results (date, total_amount) FROM STDIN")
+    assert captured["data"].splitlines() == ["2025-01-01,100.50", "2025-01-02,2.5"]
+
+
+def test_write_aggregates_copy_upsert_goes_through_staging():
+    """COPY cannot resolve conflicts, so upserts stage rows first."""
+    conn = Mock()
+    conn.dialect.driver = "psycopg2"
+    cursor = conn.connection.cursor.return_value
+    rows = [{"date": datetime.date(2025, 1, 1), "total_amount": 1.0}]
+    assert write_aggregates(conn, rows, mode="upsert") == 1
+    assert cursor.copy_expert.call_args[0][0].startswith("COPY results_load ")
+    statements = [str(c[0][0]) for c in conn.execute.call_args_list]
+    assert "CREATE TEMP TABLE" in statements[0]
+    assert "ON CONFLICT (date) DO UPDATE" in statements[1]
+    assert statements[2] == "TRUNCATE results_load"
+
+
+def _stored_totals(engine):
+    with engine.begin() as conn:
+        return dict(
+            conn.execute(
+                text("SELECT date, total_amount FROM results ORDER BY date")
+            ).all()
+        )
+
+
+def test_upsert_is_idempotent(test_db):
+    """Re-loading the same aggregates leaves one row per date."""
+    ensure_table(test_db)
+    rows = [
+        {"date": datetime.date(2025, 1, 1), "total_amount": 10.0},
+        {"date": datetime.date(2025, 1, 2), "total_amount": 20.0},
+    ]
+    insert_aggregates(test_db, rows, mode="upsert")
+    insert_aggregates(test_db, rows, mode="upsert", batch_size=1)
+    insert_aggregates(
+        test_db,
+        [{"date": datetime.date(2025, 1, 2), "total_amount": 25.0}],
+        mode="upsert",
+    )
+    assert _stored_totals(test_db) == {"2025-01-01": 10.0, "2025-01-02": 25.0}
+
+
+def test_add_mode_accumulates(test_db):
+    """Add mode sums into the stored totals."""
+    ensure_table(test_db)
+    insert_aggregates(
+        test_db, [{"date": datetime.date(2025, 1, 1), "total_amount": 10.0}], mode="add"
+    )
+    insert_aggregates(
+        test_db,
+        [
+            {"date": datetime.date(2025, 1, 1), "total_amount": 5.0},
+            {"date": datetime.date(2025, 1, 3), "total_amount": 1.0},
+        ],
+        mode="add",
+    )
+    assert _stored_totals(test_db) == {"2025-01-01": 15.0, "2025-01-03": 1.0}
+
+
+def test_insert_mode_rejects_duplicate_dates(test_db):
+    """Plain insert hits the unique index on date."""
+    from sqlalchemy.exc import IntegrityError
+
+    ensure_table(test_db)
+    rows = [{"date": datetime.date(2025, 1, 1), "total_amount": 10.0}]
+    insert_aggregates(test_db, rows, mode="insert")
+    with pytest.raises(IntegrityError):
+        insert_aggregates(test_db, rows, mode="insert")
+
+
+def test_write_aggregates_unknown_mode(mock_engine):
+    with pytest.raises(ValueError, match="unknown load mode"):
+        write_aggregates(mock_engine, [], mode="merge")
+
+
+def _stored_stats(engine):
+    with engine.begin() as conn:
+        return {
+            r[0]: tuple(r[1:])
+            for r in conn.execute(
+                text(
+                    "SELECT date, total_amount, row_count, min_amount, max_amount,"
+                    " mean_amount FROM results"
+                )
+            )
+        }
+
+
+def test_stats_columns_upsert_and_add(test_db):
+    """Per-date stats are stored with the total and combined in add mode."""
+    ensure_table(test_db)
+    day = datetime.date(2025, 1, 1)
+    stats = {
+        "date": day,
+        "total_amount": 10,
+        "row_count": 4,
+        "min_amount": 1,
+        "max_amount": 4,
+        "mean_amount": 2.5,
+    }
+    insert_aggregates(test_db, [stats], mode="upsert")
+    assert _stored_stats(test_db) == {"2025-01-01": (10, 4, 1, 4, 2.5)}
+
+    more = {
+        "date": day,
+        "total_amount": 5,
+        "row_count": 1,
+        "min_amount": 5,
+        "max_amount": 5,
+        "mean_amount": 5.0,
+    }
+    insert_aggregates(test_db, [more], mode="add")
+    assert _stored_stats(test_db) == {"2025-01-01": (15, 5, 1, 5, 3.0)}
+
+    # a plain total leaves no stale stats behind
+    insert_aggregates(test_db, [{"date": day, "total_amount": 1.0}], mode="add")
+    assert _stored_stats(test_db) == {"2025-01-01": (16, None, None, None, None)}
+    insert_aggregates(test_db, [stats], mode="upsert")
+    insert_aggregates(test_db, [{"date": day, "total_amount": 7.0}], mode="upsert")
+    assert _stored_stats(test_db) == {"2025-01-01": (7, None, None, None, None)}
+
+
+def test_ensure_table_adds_stats_columns_to_old_table(test_db):
+    with test_db.begin() as conn:
+        conn.execute(
+            text(
+                "CREATE TABLE results (id INTEGER PRIMARY KEY, date DATE NOT NULL,"
+                " total_amount NUMERIC)"
+            )
+        )
+    ensure_table(test_db)
+    ensure_table(test_db)
+    with test_db.begin() as conn:
+        cols = {r[1] for r in conn.execute(text("PRAGMA table_info(results)"))}
+    assert {"row_count", "min_amount", "max_amount", "mean_amount"} <= cols
+
+
+def test_ensure_table_merges_duplicate_dates_before_indexing(test_db, caplog):
+    with test_db.begin() as conn:
+        conn.execute(
+            text(
+                "CREATE TABLE results (id INTEGER PRIMARY KEY, date DATE NOT NULL,"
+                " total_amount NUMERIC)"
+            )
+        )
+        conn.execute(
+            text(
+                "INSERT INTO results (date, total_amount) VALUES"
+                " ('2025-01-01', 1), ('2025-01-02', 2), ('2025-01-01', 1),"
+                " ('2025-01-01', 3)"
+            )
+        )
+    with caplog.at_level("WARNING"):
+        ensure_table(test_db)
+    assert "Removed 2 older copies" in caplog.text
+    with test_db.begin() as conn:
+        rows = conn.execute(
+            text("SELECT date, total_amount FROM results ORDER BY date")
+        ).fetchall()
+    assert [(str(d), float(t)) for d, t in rows] == [
+        ("2025-01-01", 3.0),
+        ("2025-01-02", 2.0),
+    ]
+    # the index is in place, so reloads upsert instead of adding copies
+    write = [{"date": datetime.date(2025, 1, 1), "total_amount": 5.0}]
+    insert_aggregates(test_db, write, mode="upsert")
+    ensure_table(test_db)
+    with test_db.begin() as conn:
+        assert conn.execute(
+            text("SELECT COUNT(*), SUM(total_amount) FROM results")
+        ).one() == (2, 7)
+
+
+def _rollups(engine):
+    with engine.begin() as conn:
+        monthly = {
+            r[0]: tuple(r[1:])
+            for r in conn.execute(
+                text(
+                    "SELECT month, total_amount, days, row_count, min_amount,"
+                    " max_amount FROM results_monthly"
+                )
+            )
+        }
+        yearly = {
+            r[0]: tuple(r[1:])
+            for r in conn.execute(
+                text(
+                    "SELECT year, total_amount, days, row_count, min_amount, max_amount"
+                    " FROM results_yearly"
+                )
+            )
+        }
+    return monthly, yearly
+
+
+def test_loads_refresh_monthly_and_yearly_rollups(test_db):
+    """Rollups follow every load mode in the same transaction."""
+    ensure_table(test_db)
+    rows = [
+        {"date": datetime.date(2024, 12, 31), "total_amount": 1.0},
+        {"date": datetime.date(2025, 1, 1), "total_amount": 10.0},
+        {"date": datetime.date(2025, 1, 31), "total_amount": 5.0},
+        {"date": datetime.date(2025, 2, 1), "total_amount": 2.0},
+    ]
+    insert_aggregates(test_db, rows, mode="upsert", batch_size=2)
+    monthly, yearly = _rollups(test_db)
+    assert {m: r[:2] for m, r in monthly.items()} == {
+        "2024-12-01": (1.0, 1),
+        "2025-01-01": (15.0, 2),
+        "2025-02-01": (2.0, 1),
+    }
+    assert {y: r[:2] for y, r in yearly.items()} == {2024: (1.0, 1), 2025: (17.0, 3)}
+
+    # upsert replaces a day, add sums into one; untouched periods stay as they are
+    insert_aggregates(
+        test_db,
+        [{"date": datetime.date(2025, 1, 1), "total_amount": 4.0}],
+        mode="upsert",
+    )
+    insert_aggregates(
+        test_db, [{"date": datetime.date(2025, 2, 1), "total_amount": 3.0}], mode="add"
+    )
+    monthly, yearly = _rollups(test_db)
+    assert monthly["2025-01-01"][:2] == (9.0, 2)
+    assert monthly["2025-02-01"][:2] == (5.0, 1)
+    assert yearly[2025][:2] == (14.0, 3)
+    assert yearly[2024][:2] == (1.0, 1)
+
+
+def test_rollup_stats_need_every_date_of_the_period(test_db):
+    ensure_table(test_db)
+    stats = [
+        {
+            "date": datetime.date(2025, 1, d),
+            "total_amount": 10,
+            "row_count": 2,
+            "min_amount": d,
+            "max_amount": 9,
+            "mean_amount": 5.0,
+        }
+        for d in (1, 2)
+    ]
+    insert_aggregates(test_db, stats, mode="upsert")
+    monthly, yearly = _rollups(test_db)
+    assert monthly["2025-01-01"] == (20, 2, 4, 1, 9)
+    assert yearly[2025] == (20, 2, 4, 1, 9)
+
+    # a date without stats makes the period's stats unknown
+    insert_aggregates(
+        test_db,
+        [{"date": datetime.date(2025, 1, 3), "total_amount": 1.0}],
+        mode="upsert",
+    )
+    monthly, yearly = _rollups(test_db)
+    assert monthly["2025-01-01"] == (21, 3, None, None, None)
+    assert yearly[2025] == (21, 3, None, None, None)
+
+
+def test_callers_collect_months_and_refresh_them_once(test_db):
+    from etl.rollup import refresh_rollups
+
+    ensure_table(test_db)
+    months = set()
+    with test_db.begin() as conn:
+        for d in (datetime.date(2025, 1, 5), datetime.date(2025, 3, 7)):
+            write_aggregates(conn, [{"date": d, "total_amount": 1.0}], months=months)
+        # a month no load touched stays out of the rollups
+        conn.execute(
+            text("INSERT INTO results (date, total_amount) VALUES ('2025-02-01', 9)")
+        )
+        assert months == {datetime.date(2025, 1, 1), datetime.date(2025, 3, 1)}
+        assert _rollups_on(conn) == ({}, {})
+        refresh_rollups(conn, months, "sqlite")
+    monthly, yearly = _rollups(test_db)
+    assert {m: r[:2] for m, r in monthly.items()} == {
+        "2025-01-01": (1.0, 1),
+        "2025-03-01": (1.0, 1),
+    }
+    # years are recomputed from the months
+    assert yearly[2025][:2] == (2.0, 2)
+
+
+def _rollups_on(conn):
+    return (
+        dict(
+            conn.execute(text("SELECT month, total_amount FROM results_monthly")).all()
+        ),
+        dict(conn.execute(text("SELECT year, total_amount FROM results_yearly")).all()),
+    )
+
+
+def test_refresh_rollups_merges_consecutive_months():
+    from etl.rollup import refresh_rollups
+
+    conn = Mock()
+    months = [
+        datetime.date(2024, 12, 9),
+        datetime.date(2025, 1, 1),
+        datetime.date(2025, 1, 20),
+    ]
+    refresh_rollups(conn, months + [datetime.date(2025, 6, 2)], "sqlite")
+    bounds = [call.args[1] for call in conn.execute.call_args_list]
+    assert bounds == [
+        {"lo": datetime.date(2024, 12, 1), "hi": datetime.date(2025, 2, 1)},
+        {"lo": datetime.date(2025, 6, 1), "hi": datetime.date(2025, 7, 1)},
+        {"lo": datetime.date(2024, 1, 1), "hi": datetime.date(2026, 1, 1)},
+    ]
+    conn.reset_mock()
+    refresh_rollups(conn, [], "sqlite")
+    conn.execute.assert_not_called()
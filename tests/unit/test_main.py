@@ -0,0 +1,164 @@
+"""Unit tests for the CLI entrypoint."""
+from pathlib import Path
+
+from etl.main import run
+
+
+def test_run_dry_run_streams_rows(tmp_path, caplog):
+    """Dry run aggregates without touching the database."""
+    (Path(tmp_path) / "data.csv").write_text(
+        "date,amount\n2025-01-01,1\n01/02/2025,2\nbad,3\n2025-01-01,4\n",
+        encoding="utf8",
+    )
+    with caplog.at_level("INFO", logger="etl.main"):
+        assert run(str(tmp_path), dry_run=True) == 0
+    messages = [r.getMessage() for r in caplog.records]
+    assert any(
+        "Streamed 4 rows" in m and "rows/sec" in m and "peak RSS" in m for m in messages
+    )
+    assert any("Aggregated into 2 groups" in m for m in messages)
+
+
+def test_run_with_workers(tmp_path, caplog):
+    for i in range(3):
+        (Path(tmp_path) / f"data{i}.csv").write_text(
+            f"date,amount\n2025-01-0{i + 1},1\n", encoding="utf8"
+        )
+    with caplog.at_level("INFO", logger="etl.main"):
+        assert run(str(tmp_path), dry_run=True, workers=2) == 0
+    assert any("Aggregated into 3 groups" in r.getMessage() for r in caplog.records)
+
+
+def test_run_mmap_reader_matches_csv_reader(tmp_path, caplog):
+    (Path(tmp_path) / "data.csv").write_text(
+        "date,amount,description\n2025-01-01,1,x\n01/02/2025,2,y\nbad,3,z\n2025-01-01,oops,w\n,5,v\n",
+        encoding="utf8",
+    )
+    results = {}
+    for reader in ("csv", "mmap"):
+        caplog.clear()
+        with caplog.at_level("INFO"):
+            run(str(tmp_path), dry_run=True, reader=reader)
+        results[reader] = [
+            r.getMessage() for r in caplog.records if r.name != "etl.main"
+        ]
+        results[reader].append(
+            next(
+                r.getMessage()
+                for r in caplog.records
+                if "would insert" in r.getMessage()
+            )
+        )
+    assert results["mmap"] == results["csv"]
+
+
+def test_run_with_stats_loads_extra_metrics(tmp_path):
+    from sqlalchemy import create_engine, text
+
+    data = Path(tmp_path) / "data"
+    data.mkdir()
+    (data / "a.csv").write_text(
+        "date,amount\n2025-01-01,1\n2025-01-01,3\n2025-01-02,2\n", encoding="utf8"
+    )
+    url = f"sqlite:///{tmp_path / 'etl.db'}"
+    assert run(str(data), database_url=url, stats=True) == 2
+    with create_engine(url).begin() as conn:
+        rows = conn.execute(
+            text(
+                "SELECT date, total_amount, row_count, min_amount, max_amount,"
+                " mean_amount FROM results ORDER BY date"
+            )
+        ).all()
+    assert [tuple(r) for r in rows] == [
+        ("2025-01-01", 4, 2, 1, 3, 2),
+        ("2025-01-02", 2, 1, 2, 2, 2),
+    ]
+
+
+def test_run_exact_loads_decimal_totals(tmp_path):
+    from sqlalchemy import create_engine, text
+
+    data = Path(tmp_path) / "data"
+    data.mkdir()
+    (data / "a.csv").write_text(
+        "date,amount\n" + "2025-01-01,0.1\n" * 10 + "2025-01-02,2.005\n",
+        encoding="utf8",
+    )
+    url = f"sqlite:///{tmp_path / 'etl.db'}"
+    assert run(str(data), database_url=url, exact=True) == 2
+    with create_engine(url).begin() as conn:
+        rows = conn.execute(
+            text("SELECT date, CAST(total_amount AS TEXT) FROM results ORDER BY date")
+        ).all()
+    assert [tuple(r) for r in rows] == [("2025-01-01", "1"), ("2025-01-02", "2.005")]
+
+
+def test_run_pushdown_matches_python_aggregation(tmp_path):
+    from sqlalchemy import create_engine, text
+
+    data = Path(tmp_path) / "data"
+    data.mkdir()
+    (data / "a.csv").write_text(
+        "date,amount\n2025-01-01,1.25\n01/02/2025,2\nbad,3\n2025-01-01,oops\n,5\n2025-01-01,1e1\n",
+        encoding="utf8",
+    )
+    totals = {}
+    for name, pushdown in (("python", False), ("pushdown", True)):
+        url = f"sqlite:///{tmp_path / f'{name}.db'}"
+        assert run(str(data), database_url=url, pushdown=pushdown) == 2
+        # reloading unchanged totals still reports the per-date rows produced
+        assert run(str(data), database_url=url, pushdown=pushdown) == 2
+        with create_engine(url).begin() as conn:
+            totals[name] = conn.execute(
+                text("SELECT date, total_amount FROM results ORDER BY date")
+            ).all()
+            totals[name + " monthly"] = conn.execute(
+                text("SELECT month, total_amount FROM results_monthly")
+            ).all()
+    assert (
+        totals["pushdown"]
+        == totals["python"]
+        == [("2025-01-01", 11.25), ("2025-02-01", 2)]
+    )
+    assert (
+        totals["pushdown monthly"]
+        == totals["python monthly"]
+        == [("2025-01-01", 11.25), ("2025-02-01", 2)]
+    )
+
+
+def test_pushdown_stages_into_a_new_table_each_run(tmp_path, monkeypatch):
+    import pytest
+    from sqlalchemy import create_engine, text
+
+    from etl import pushdown
+    from etl.load import ensure_table
+
+    data = Path(tmp_path) / "data"
+    data.mkdir()
+    (data / "a.csv").write_text(
+        "date,amount\n2025-01-01,1.5\n2025-01-02,2\n", encoding="utf8"
+    )
+    engine = create_engine(f"sqlite:///{tmp_path / 'etl.db'}")
+    ensure_table(engine)
+    assert pushdown.load_pushdown(engine, data, mode="add") == (2, 2)
+
+    def crash(conn, batch):
+        raise RuntimeError("connection lost")
+
+    # a failed run leaves nothing staged for the next one on the same connection
+    with monkeypatch.context() as m:
+        m.setattr(pushdown, "_insert_raw", crash)
+        with pytest.raises(RuntimeError):
+            pushdown.load_pushdown(engine, data, mode="add")
+    assert pushdown.load_pushdown(engine, data, mode="add") == (2, 2)
+    with engine.connect() as conn:
+        assert conn.execute(
+            text("SELECT date, total_amount FROM results ORDER BY date")
+        ).all() == [
+            ("2025-01-01", 3),
+            ("2025-01-02", 4),
+        ]
+        assert not conn.execute(
+            text("SELECT name FROM sqlite_temp_master WHERE name = 'results_raw'")
+        ).all()
@@ -0,0 +1,229 @@
+"""Unit tests for incremental runs driven by the processed-file manifest."""
+import os
+import shutil
+
+import pytest
+from sqlalchemy import create_engine, text
+
+from etl.load import ensure_table
+from etl.main import main, run, run_incremental
+from etl.manifest import FileEntry, Manifest, ensure_manifest_table, load_incremental
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'etl.db'}")
+    ensure_table(engine)
+    ensure_manifest_table(engine)
+    return engine
+
+
+def totals(engine):
+    with engine.begin() as conn:
+        return dict(
+            conn.execute(
+                text("SELECT date, total_amount FROM results ORDER BY date")
+            ).all()
+        )
+
+
+def test_incremental_skips_unchanged_files(tmp_path, engine):
+    data = tmp_path / "data"
+    data.mkdir()
+    (data / "a.csv").write_text(
+        "date,amount\n2025-01-01,10\n2025-01-02,5\n", encoding="utf8"
+    )
+    (data / "b.csv").write_text("date,amount\n2025-01-01,1\n", encoding="utf8")
+
+    assert load_incremental(engine, data) == (2, 2)
+    assert totals(engine) == {"2025-01-01": 11, "2025-01-02": 5}
+
+    # nothing changed: no file is read and nothing is written
+    assert load_incremental(engine, data) == (0, 0)
+    assert totals(engine) == {"2025-01-01": 11, "2025-01-02": 5}
+
+    # a new file only adds its own totals
+    (data / "c.csv").write_text("date,amount\n2025-01-03,7\n", encoding="utf8")
+    assert load_incremental(engine, data) == (1, 1)
+    assert totals(engine) == {"2025-01-01": 11, "2025-01-02": 5, "2025-01-03": 7}
+
+
+def test_incremental_replaces_changed_file_contribution(tmp_path, engine):
+    data = tmp_path / "data"
+    data.mkdir()
+    a = data / "a.csv"
+    a.write_text("date,amount\n2025-01-01,10\n2025-01-02,5\n", encoding="utf8")
+    (data / "b.csv").write_text("date,amount\n2025-01-01,1\n", encoding="utf8")
+    load_incremental(engine, data)
+
+    a.write_text("date,amount\n2025-01-01,10\n2025-01-03,2\n", encoding="utf8")
+    # 2025-01-01 is unchanged in a.csv, so only two deltas are written
+    assert load_incremental(engine, data) == (1, 2)
+    assert totals(engine) == {"2025-01-01": 11, "2025-01-02": 0, "2025-01-03": 2}
+
+
+def test_touched_file_is_not_reloaded(tmp_path, engine):
+    data = tmp_path / "data"
+    data.mkdir()
+    a = data / "a.csv"
+    a.write_text("date,amount\n2025-01-01,10\n", encoding="utf8")
+    load_incremental(engine, data)
+
+    st = a.stat()
+    os.utime(a, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+    with engine.connect() as conn:
+        changed, touched = Manifest.load(conn).changed_files([a])
+    assert changed == [] and len(touched) == 1
+
+    assert load_incremental(engine, data) == (0, 0)
+    with engine.connect() as conn:
+        changed, touched = Manifest.load(conn).changed_files([a])
+    assert changed == [] and touched == []
+    assert totals(engine) == {"2025-01-01": 10}
+
+
+def test_run_incremental_cli_path(tmp_path):
+    data = tmp_path / "data"
+    data.mkdir()
+    (data / "a.csv").write_text(
+        "date,amount\n2025-01-01,10\n01/02/2025,3\n", encoding="utf8"
+    )
+    url = f"sqlite:///{tmp_path / 'cli.db'}"
+    assert run_incremental(str(data), database_url=url) == 2
+    assert run_incremental(str(data), database_url=url) == 0
+
+
+def write_archive(data):
+    data.mkdir()
+    (data / "a.csv").write_text("date,amount\n2025-01-01,10\n", encoding="utf8")
+    (data / "b.csv").write_text("date,amount\n2025-01-02,5\n", encoding="utf8")
+
+
+@pytest.mark.parametrize(
+    "options",
+    [{}, {"pipeline": True}, {"pipeline": True, "commit": "batch"}, {"pushdown": True}],
+)
+def test_incremental_runs_follow_a_full_run(tmp_path, options):
+    data = tmp_path / "data"
+    write_archive(data)
+    url = f"sqlite:///{tmp_path / 'etl.db'}"
+    assert run(str(data), database_url=url, **options) == 2
+    # the files the full run read are recorded; only new ones are added
+    (data / "c.csv").write_text("date,amount\n2025-01-01,1\n", encoding="utf8")
+    assert run_incremental(str(data), database_url=url) == 1
+    assert totals(create_engine(url)) == {"2025-01-01": 11, "2025-01-02": 5}
+    # and a periodic full rescan keeps working alongside
+    # pipelined loads count the rows of every per-file partial they write
+    written = 3 if options.get("pipeline") else 2
+    assert run(str(data), database_url=url, **options) == written
+    assert run_incremental(str(data), database_url=url) == 0
+    assert totals(create_engine(url)) == {"2025-01-01": 11, "2025-01-02": 5}
+
+
+def test_files_changed_after_a_full_run_wait_for_the_next_one(tmp_path, caplog):
+    data = tmp_path / "data"
+    write_archive(data)
+    url = f"sqlite:///{tmp_path / 'etl.db'}"
+    run(str(data), database_url=url)
+    (data / "a.csv").write_text("date,amount\n2025-01-01,12\n", encoding="utf8")
+    # its totals before the change are unknown, so no delta can be added
+    assert run_incremental(str(data), database_url=url) == 0
+    assert "changed since a full run loaded it" in caplog.text
+    assert totals(create_engine(url)) == {"2025-01-01": 10, "2025-01-02": 5}
+    run(str(data), database_url=url)
+    assert totals(create_engine(url)) == {"2025-01-01": 12, "2025-01-02": 5}
+    assert run_incremental(str(data), database_url=url) == 0
+
+
+def test_full_run_keeps_the_totals_of_incremental_files(tmp_path):
+    data = tmp_path / "data"
+    data.mkdir()
+    (data / "a.csv").write_text("date,amount\n2025-01-01,10\n", encoding="utf8")
+    url = f"sqlite:///{tmp_path / 'etl.db'}"
+    assert run_incremental(str(data), database_url=url) == 1
+    (data / "b.csv").write_text("date,amount\n2025-01-01,1\n", encoding="utf8")
+    assert run(str(data), database_url=url) == 1
+    with create_engine(url).connect() as conn:
+        entries = Manifest.load(conn).entries
+    assert [e.totals for _, e in sorted(entries.items())] == [
+        {"2025-01-01": 10.0},
+        None,
+    ]
+    # a.csv changes as an incremental file: its delta is known
+    (data / "a.csv").write_text("date,amount\n2025-01-01,13\n", encoding="utf8")
+    assert run_incremental(str(data), database_url=url) == 1
+    assert totals(create_engine(url)) == {"2025-01-01": 14}
+
+
+def test_incremental_refuses_totals_the_manifest_does_not_record(tmp_path, engine):
+    data = tmp_path / "data"
+    write_archive(data)
+    with engine.begin() as conn:
+        conn.execute(
+            text("INSERT INTO results (date, total_amount) VALUES ('2025-01-01', 1)")
+        )
+    with pytest.raises(ValueError, match="does not record"):
+        load_incremental(engine, data)
+    assert totals(engine) == {"2025-01-01": 1}
+
+
+def test_cli_refuses_unrecorded_totals_as_a_usage_error(tmp_path, capsys, monkeypatch):
+    data = tmp_path / "data"
+    write_archive(data)
+    url = f"sqlite:///{tmp_path / 'etl.db'}"
+    engine = create_engine(url)
+    ensure_table(engine)
+    with engine.begin() as conn:
+        conn.execute(
+            text("INSERT INTO results (date, total_amount) VALUES ('2025-01-01', 1)")
+        )
+    monkeypatch.setenv("DATABASE_URL", url)
+    for option in ("--incremental", "--watch"):
+        with pytest.raises(SystemExit) as exc:
+            main(["--input", str(data), option])
+        assert exc.value.code == 2
+        assert f"{option}: results holds totals" in capsys.readouterr().err
+
+
+def test_entries_are_keyed_by_name_wherever_the_folder_is_mounted(tmp_path, engine):
+    data = tmp_path / "data"
+    write_archive(data)
+    assert load_incremental(engine, data) == (2, 2)
+    # another host mounting the same files elsewhere
+    moved = tmp_path / "mnt" / "data"
+    shutil.copytree(data, moved)
+    assert load_incremental(engine, moved) == (0, 0)
+    assert totals(engine) == {"2025-01-01": 10, "2025-01-02": 5}
+    with engine.connect() as conn:
+        assert sorted(Manifest.load(conn).entries) == ["a.csv", "b.csv"]
+
+
+def test_absolute_keys_of_older_versions_are_rewritten(tmp_path, engine):
+    data = tmp_path / "data"
+    write_archive(data)
+    assert load_incremental(engine, data) == (2, 2)
+    with engine.begin() as conn:
+        conn.execute(
+            text("UPDATE etl_manifest SET path = :root || '/' || path"),
+            {"root": str(data.resolve())},
+        )
+    assert load_incremental(engine, data) == (0, 0)
+    (data / "a.csv").write_text("date,amount\n2025-01-01,12\n", encoding="utf8")
+    assert load_incremental(engine, data) == (1, 1)
+    assert totals(engine) == {"2025-01-01": 12, "2025-01-02": 5}
+    with engine.connect() as conn:
+        rows = conn.execute(text("SELECT path FROM etl_manifest"))
+        paths = sorted(r[0] for r in rows)
+    assert paths == [str(data.resolve() / "b.csv"), "a.csv"]
+
+
+def test_delta_ignores_float_rounding():
+    prev = FileEntry(
+        "a.csv", 1, 1, "x", {"2025-01-01": 0.1 + 0.2 + 0.3, "2025-01-02": 5.0}
+    )
+    manifest = Manifest({"a.csv": prev})
+    changed = FileEntry(
+        "a.csv", 2, 2, "y", {"2025-01-01": 0.3 + 0.2 + 0.1, "2025-01-02": 5.5}
+    )
+    assert 0.1 + 0.2 + 0.3 != 0.3 + 0.2 + 0.1
+    assert manifest.delta(changed) == {"2025-01-02": 0.5}
@@ -0,0 +1,80 @@
+"""Unit tests for per-stage run metrics."""
+import json
+from pathlib import Path
+
+from etl.main import main, run
+from etl.metrics import RunMetrics
+
+
+def write_data(folder: Path) -> None:
+    (folder / "data.csv").write_text(
+        "date,amount\n2025-01-01,1\n,5\nbad,3\n2025-01-02,x\n01/02/2025,2\n2025-01-01,4\n",
+        encoding="utf8",
+    )
+
+
+def test_run_records_stage_counts(tmp_path):
+    write_data(tmp_path)
+    metrics = RunMetrics()
+    assert run(str(tmp_path), dry_run=True, metrics=metrics) == 0
+
+    extract = metrics.stage("extract")
+    assert extract.rows_in == 6 and extract.rows_out == 5
+    assert extract.rejected == {"missing_date_or_amount": 1}
+    transform = metrics.stage("transform")
+    assert transform.rows_in == 5 and transform.rows_out == 4
+    assert transform.rejected == {"unparseable_date": 1}
+    aggregate = metrics.stage("aggregate")
+    assert aggregate.rows_in == 4 and aggregate.rows_out == 2
+    assert aggregate.rejected == {"non_numeric_value": 1}
+    assert extract.wall_seconds > 0
+
+
+def test_merge_sums_stages():
+    a, b = RunMetrics(), RunMetrics()
+    a.reject("transform", "missing_date")
+    b.reject("transform", "missing_date", 2)
+    b.count("load", 3, 3)
+    a.merge(b)
+    assert a.stage("transform").rejected == {"missing_date": 3}
+    assert a.stage("transform").rows_in == 3
+    assert a.stage("load").rows_out == 3
+
+
+def test_cli_writes_json_and_prometheus(tmp_path):
+    data = tmp_path / "data"
+    data.mkdir()
+    write_data(data)
+    out_json, out_prom = tmp_path / "m.json", tmp_path / "m.prom"
+    main(
+        [
+            "-i",
+            str(data),
+            "--dry-run",
+            "--metrics-json",
+            str(out_json),
+            "--metrics-prom",
+            str(out_prom),
+        ]
+    )
+
+    doc = json.loads(out_json.read_text(encoding="utf8"))
+    assert doc["stages"]["extract"]["rows_rejected"] == {"missing_date_or_amount": 1}
+    assert doc["stages"]["aggregate"]["rows_out"] == 2
+
+    prom = out_prom.read_text(encoding="utf8")
+    assert "# TYPE etl_stage_wall_seconds gauge" in prom
+    assert 'etl_stage_rows_in{stage="transform"} 5' in prom
+    assert (
+        'etl_stage_rows_rejected{stage="transform",reason="unparseable_date"} 1' in prom
+    )
+    assert "etl_last_run_timestamp_seconds" in prom
+
+
+def test_cli_profile_dumps_stats(tmp_path):
+    data = tmp_path / "data"
+    data.mkdir()
+    write_data(data)
+    out = tmp_path / "run.pstats"
+    main(["-i", str(data), "--dry-run", "--profile", str(out)])
+    assert out.stat().st_size > 0
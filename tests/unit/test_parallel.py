@@ -0,0 +1,154 @@
+"""Unit tests for multi-process extraction."""
+import math
+from pathlib import Path
+
+from etl.extract import read_csv_folder
+from etl.metrics import RunMetrics
+from etl.parallel import (
+    aggregate_file,
+    aggregate_folder_parallel,
+    aggregate_range,
+    fold_file,
+    new_aggregator,
+    plan_tasks,
+    split_byte_ranges,
+)
+from etl.transform import Aggregator, FixedPointAggregator, fold_rows
+
+
+def write_files(folder: Path) -> None:
+    (folder / "a.csv").write_text(
+        "date,amount\n2025-01-01,1.5\n02/01/2025,2\n,9\n", encoding="utf8"
+    )
+    (folder / "b.csv").write_text(
+        "date,amount\n2025/01/03,4\n2025-01-01,x\nbad,1\n", encoding="utf8"
+    )
+    (folder / "c.csv").write_text(
+        "date,amount\n2025-01-02,0.25\n2025-01-01,8\n", encoding="utf8"
+    )
+
+
+def test_aggregate_file_returns_partial_totals(tmp_path):
+    write_files(tmp_path)
+    partial, seen, metrics = aggregate_file(str(tmp_path / "a.csv"))
+    assert isinstance(partial, Aggregator)
+    assert partial.totals == {"2025-01-01": 1.5, "2025-01-02": 2.0}
+    assert seen == 2
+    assert metrics.stage("extract").rejected == {"missing_date_or_amount": 1}
+
+
+def test_parallel_matches_serial(tmp_path):
+    write_files(tmp_path)
+    serial = Aggregator()
+    serial_seen = fold_rows(read_csv_folder(tmp_path), serial)
+
+    merged, seen = aggregate_folder_parallel(tmp_path, workers=2)
+    assert merged.results() == serial.results()
+    assert merged.rows == serial.rows
+    assert seen == serial_seen
+
+
+def test_parallel_exact_matches_serial(tmp_path):
+    write_files(tmp_path)
+    serial = FixedPointAggregator()
+    fold_rows(read_csv_folder(tmp_path), serial)
+
+    merged, _ = aggregate_folder_parallel(tmp_path, workers=2, exact=True)
+    assert isinstance(merged, FixedPointAggregator)
+    assert merged.results() == serial.results()
+    assert [str(r["total_amount"]) for r in merged.results()] == [
+        "9.50",
+        "2.25",
+        "4.00",
+    ]
+
+
+def test_parallel_empty_folder(tmp_path):
+    merged, seen = aggregate_folder_parallel(tmp_path, workers=4)
+    assert merged.results() == []
+    assert seen == 0
+
+
+def write_big_file(path: Path, rows: int = 2000) -> None:
+    lines = ["date,amount,description"]
+    for i in range(rows):
+        if i % 97 == 0:
+            lines.append(f",{i},missing date")
+        elif i % 3 == 0:
+            lines.append(f"0{i % 9 + 1}/01/2025,{i % 50}.25,eu")
+        else:
+            lines.append(f"2025-02-{i % 28 + 1:02d},{i % 13}.5,iso")
+    path.write_text("\n".join(lines) + "\n", encoding="utf8")
+
+
+def test_split_byte_ranges_align_to_newlines(tmp_path):
+    path = tmp_path / "big.csv"
+    write_big_file(path)
+    data = path.read_bytes()
+    fieldnames, ranges = split_byte_ranges(path, 7)
+    assert fieldnames == ["date", "amount", "description"]
+    assert len(ranges) == 7
+    assert ranges[0][0] == data.index(b"\n") + 1
+    assert ranges[-1][1] == len(data)
+    for (_, end), (start, _) in zip(ranges, ranges[1:]):
+        assert end == start
+        assert data[start - 1 : start] == b"\n"
+
+
+def test_byte_range_split_matches_serial(tmp_path):
+    write_big_file(tmp_path / "big.csv")
+    serial = Aggregator()
+    serial_metrics = RunMetrics(quarantine=True)
+    serial_seen = fold_file(tmp_path / "big.csv", serial, metrics=serial_metrics)
+
+    tasks = plan_tasks([tmp_path / "big.csv"], workers=4, min_range_bytes=1024)
+    assert len(tasks) == 4 and all(t[1] is not None for t in tasks)
+    metrics = RunMetrics(quarantine=True)
+    merged, seen = aggregate_folder_parallel(
+        tmp_path, workers=4, min_range_bytes=1024, metrics=metrics
+    )
+
+    assert merged.results() == serial.results()
+    assert seen == serial_seen
+    # rejects carry file row numbers, not range-relative ones
+    assert (
+        metrics.rejects.rows == serial_metrics.rejects.rows
+        and len(metrics.rejects.rows) == 21
+    )
+    assert metrics.rejects.samples == serial_metrics.rejects.samples
+
+
+def test_byte_range_partials_are_one_compensated_total_per_group(tmp_path):
+    # float sums of these depend on the order they are added in
+    amounts = ["0.1", "0.2", "0.3", "0.7", "1e-3"]
+    lines = ["date,amount"]
+    lines += [
+        f"2025-01-{i % 3 + 1:02d},{amounts[i % len(amounts)]}" for i in range(3000)
+    ]
+    (tmp_path / "big.csv").write_text("\n".join(lines) + "\n", encoding="utf8")
+    values = {}
+    for line in lines[1:]:
+        date, amount = line.split(",")
+        values.setdefault(date, []).append(float(amount))
+    exact = {d: math.fsum(v) for d, v in values.items()}
+    fieldnames, ranges = split_byte_ranges(tmp_path / "big.csv", 4)
+    assert len(ranges) == 4
+    part = aggregate_range(str(tmp_path / "big.csv"), *ranges[0], fieldnames)[0]
+    assert type(part) is Aggregator and len(part.totals) == 3
+    for stats in (False, True):
+        serial = new_aggregator(stats)
+        fold_file(tmp_path / "big.csv", serial)
+        merged, seen = aggregate_folder_parallel(
+            tmp_path, workers=4, min_range_bytes=1024, stats=stats
+        )
+        assert seen == 3000 and merged.rows == serial.rows
+        assert list(merged.totals) == list(serial.totals)
+        for date, total in merged.totals.items():
+            assert math.isclose(total, serial.totals[date], rel_tol=1e-12)
+        if not stats:
+            # the compensated ranges are no further from the exact sums
+            for date, total in merged.totals.items():
+                error = abs(total - exact[date])
+                assert error <= abs(serial.totals[date] - exact[date])
+
+
@@ -0,0 +1,186 @@
+"""Unit tests for rejected-row diagnostics and the quarantine file."""
+import csv
+import json
+from pathlib import Path
+
+import pytest
+
+from etl import cache, quarantine
+from etl.main import main, run
+from etl.metrics import RunMetrics
+from etl.parallel import aggregate_file
+from etl.quarantine import SAMPLES, RejectLog, row_number
+
+
+def write_files(folder: Path) -> None:
+    (folder / "a.csv").write_text(
+        "date,amount\n2025-01-01,1.5\n02/01/2025,2\n,9\n", encoding="utf8"
+    )
+    (folder / "b.csv").write_text(
+        "date,amount\n2025/01/03,4\n2025-01-01,x\nbad,1\n\n,\n2025-01-02,y\n",
+        encoding="utf8",
+    )
+
+
+EXPECTED = [
+    {
+        "file": "a.csv",
+        "row": 3,
+        "stage": "extract",
+        "reason": "missing_date_or_amount",
+        "value": ",9",
+    },
+    {
+        "file": "b.csv",
+        "row": 4,
+        "stage": "extract",
+        "reason": "missing_date_or_amount",
+        "value": ",",
+    },
+    {
+        "file": "b.csv",
+        "row": 3,
+        "stage": "transform",
+        "reason": "unparseable_date",
+        "value": "bad",
+    },
+    {
+        "file": "b.csv",
+        "row": 2,
+        "stage": "aggregate",
+        "reason": "non_numeric_value",
+        "value": "x",
+    },
+    {
+        "file": "b.csv",
+        "row": 5,
+        "stage": "aggregate",
+        "reason": "non_numeric_value",
+        "value": "y",
+    },
+]
+
+
+def test_row_number_counts_past_skipped_rows():
+    # rows 2, 3 and 6 were dropped by the reader
+    skipped = [2, 3, 6]
+    assert [row_number(i, skipped) for i in range(5)] == [1, 4, 5, 7, 8]
+    assert row_number(4, []) == 5
+
+
+def test_reject_log_merges_counts_samples_and_offsets_rows():
+    part = RejectLog(keep=True)
+    for row in range(1, 6):
+        part.add("big.csv", row, "extract", "missing_date_or_amount", "x")
+    log = RejectLog(keep=True)
+    log.add("big.csv", 2, "extract", "missing_date_or_amount", "y")
+    log.merge(part, row_offset=100)
+    assert log.counts == {("big.csv", "extract", "missing_date_or_amount"): 6}
+    assert log.samples[("big.csv", "extract", "missing_date_or_amount")] == [
+        (2, "y"),
+        (101, "x"),
+        (102, "x"),
+    ]
+    assert [r[1] for r in log.rows] == [2, 101, 102, 103, 104, 105]
+    # logs without `keep` only count
+    counts_only = RejectLog().merge(log)
+    assert counts_only.rows == [] and counts_only.counts == log.counts
+
+
+def test_workers_spill_rejected_rows_in_capped_batches(tmp_path, monkeypatch):
+    monkeypatch.setattr(quarantine, "FLUSH_ROWS", 4)
+    rows = "".join(f"2025-01-01,bad{i}\n" for i in range(10))
+    (tmp_path / "a.csv").write_text("date,amount\n" + rows, encoding="utf8")
+    _, _, worker_metrics = aggregate_file(str(tmp_path / "a.csv"), quarantine=True)
+    part = worker_metrics.rejects
+    # two batches of 4 went to the worker's spill file; 2 rows are still buffered
+    assert len(part.rows) == 2 and Path(part.spill).exists()
+    spill = part.spill
+    metrics = RunMetrics()
+    metrics.quarantine(str(tmp_path / "rejects.jsonl"))
+    metrics.merge(worker_metrics, row_offset=100)
+    metrics.rejects.close()
+    assert not Path(spill).exists() and part.spill is None
+    # without a quarantine file, a report leaves the kept rows where they are
+    log = RejectLog(keep=True)
+    log.add("a.csv", 1, "extract", "missing_date_or_amount")
+    log.report()
+    assert len(log.rows) == 1 and log.spill is None
+    lines = (tmp_path / "rejects.jsonl").read_text(encoding="utf8").splitlines()
+    assert [json.loads(line)["row"] for line in lines] == list(range(101, 111))
+
+
+def test_run_quarantines_rejected_rows_and_logs_a_summary(tmp_path, caplog):
+    write_files(tmp_path)
+    path = tmp_path / "rejects.jsonl"
+    with caplog.at_level("WARNING"):
+        main(["--input", str(tmp_path), "--dry-run", "--quarantine", str(path)])
+    records = [
+        json.loads(line) for line in path.read_text(encoding="utf8").splitlines()
+    ]
+    assert records == EXPECTED
+    # one line per file, stage and reason, whatever the number of bad rows
+    warnings = [r.getMessage() for r in caplog.records if r.levelname == "WARNING"]
+    assert len(warnings) == 4
+    assert (
+        "Rejected 2 rows of b.csv at aggregate (non_numeric_value), e.g. row 2: 'x',"
+        " row 5: 'y'"
+        in warnings
+    )
+
+
+@pytest.mark.parametrize(
+    "options", [{"reader": "mmap"}, {"workers": 2}, {"pushdown": True}]
+)
+def test_quarantine_matches_across_readers_and_workers(tmp_path, options):
+    data = tmp_path / "data"
+    data.mkdir()
+    write_files(data)
+    metrics = RunMetrics()
+    path = tmp_path / "rejects.csv"
+    metrics.quarantine(str(path))
+    url = f"sqlite:///{tmp_path / 'etl.db'}"
+    run(
+        str(data),
+        dry_run=not options.get("pushdown"),
+        database_url=url,
+        metrics=metrics,
+        **options,
+    )
+    metrics.rejects.close()
+    with open(path, newline="", encoding="utf8") as fh:
+        rows = list(csv.DictReader(fh))
+    expected = [dict(r, row=str(r["row"])) for r in EXPECTED]
+    assert sorted(rows, key=lambda r: (r["file"], r["stage"], r["row"])) == sorted(
+        expected, key=lambda r: (r["file"], r["stage"], r["row"])
+    )
+
+
+@pytest.mark.skipif(not cache.available(), reason="NumPy not installed")
+def test_cache_hits_replay_rejected_rows(tmp_path):
+    data = tmp_path / "data"
+    data.mkdir()
+    write_files(data)
+    column_cache = cache.ColumnCache(tmp_path / "cache")
+    runs = []
+    for _ in range(2):
+        metrics = RunMetrics(quarantine=True)
+        cache.aggregate_cached(data, column_cache, metrics=metrics)
+        runs.append(sorted(metrics.rejects.rows))
+    assert runs[0] == runs[1]
+    assert sorted(runs[0]) == sorted(tuple(r.values()) for r in EXPECTED)
+
+
+def test_samples_are_capped_per_reason(tmp_path):
+    rows = "".join(f"2025-01-01,bad{i}\n" for i in range(50))
+    (tmp_path / "a.csv").write_text("date,amount\n" + rows, encoding="utf8")
+    metrics = RunMetrics()
+    run(str(tmp_path), dry_run=True, metrics=metrics)
+    assert metrics.stage("aggregate").rejected == {"non_numeric_value": 50}
+    # reported at the end of the run, then cleared
+    assert metrics.rejects.counts == {}
+    assert metrics.rejects.rows == []
+    log = RejectLog()
+    for i in range(50):
+        log.add("a.csv", i + 1, "aggregate", "non_numeric_value", f"bad{i}")
+    assert len(log.samples[("a.csv", "aggregate", "non_numeric_value")]) == SAMPLES
@@ -0,0 +1,121 @@
+"""Unit tests for sharded runs."""
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+from sqlalchemy import create_engine, text
+
+from etl.extract import list_csv_files
+from etl.main import main, run
+from etl.shard import select_shard, shard_of
+
+SRC = str(Path(__file__).resolve().parents[2] / "src")
+
+
+def write_files(folder: Path, n: int = 12) -> None:
+    for i in range(n):
+        rows = "".join(
+            f"2025-0{1 + (i + d) % 3}-0{1 + d},{i + d}.5\n" for d in range(4)
+        )
+        (folder / f"part-{i:03d}.csv").write_text(
+            "date,amount\n" + rows + "bad,1\n", encoding="utf8"
+        )
+
+
+def test_assignment_depends_only_on_the_file_name(tmp_path):
+    # pinned: shards on other hosts and versions must agree
+    assert [shard_of(n, 4) for n in ("a.csv", "b.csv", "2025-01-01.csv.gz")] == [
+        2,
+        0,
+        2,
+    ]
+    files = [Path("/mnt/x") / f"f{i}.csv" for i in range(200)]
+    shards = [select_shard(files, (i, 4)) for i in range(4)]
+    assert sorted(f for s in shards for f in s) == sorted(files)
+    assert all(len(s) > 30 for s in shards)
+    assert select_shard([Path("/elsewhere") / f.name for f in shards[1]], (1, 4)) == [
+        Path("/elsewhere") / f.name for f in shards[1]
+    ]
+
+
+def test_list_csv_files_selects_the_shard(tmp_path):
+    write_files(tmp_path)
+    every = list_csv_files(tmp_path)
+    parts = [list_csv_files(tmp_path, (i, 3)) for i in range(3)]
+    assert sorted(f for p in parts for f in p) == every
+    assert all(p == sorted(p) for p in parts)
+
+
+def _stored(url):
+    with create_engine(url).begin() as conn:
+        return (
+            conn.execute(
+                text("SELECT date, total_amount FROM results ORDER BY date")
+            ).all(),
+            conn.execute(
+                text(
+                    "SELECT month, total_amount, days FROM results_monthly ORDER BY"
+                    " month"
+                )
+            ).all(),
+        )
+
+
+def test_concurrent_shard_processes_match_a_single_run(tmp_path):
+    data = tmp_path / "data"
+    data.mkdir()
+    write_files(data)
+    single = f"sqlite:///{tmp_path / 'single.db'}"
+    run(str(data), database_url=single)
+
+    sharded = f"sqlite:///{tmp_path / 'sharded.db'}"
+    env = dict(os.environ, PYTHONPATH=SRC, DATABASE_URL=sharded)
+    procs = [
+        subprocess.Popen(
+            [
+                sys.executable,
+                "-m",
+                "etl",
+                "--input",
+                str(data),
+                "--shard-index",
+                str(i),
+                "--shard-count",
+                "3",
+            ],
+            env=env,
+            cwd=tmp_path,
+        )
+        for i in range(3)
+    ]
+    assert [p.wait(timeout=60) for p in procs] == [0, 0, 0]
+    assert _stored(sharded) == _stored(single)
+
+
+def test_shards_add_to_results(tmp_path):
+    write_files(tmp_path)
+    url = f"sqlite:///{tmp_path / 'etl.db'}"
+    with pytest.raises(ValueError, match="--load-mode must be add"):
+        run(str(tmp_path), database_url=url, shard=(0, 2))
+    for i in range(2):
+        run(str(tmp_path), database_url=url, load_mode="add", shard=(i, 2))
+    sharded = _stored(url)
+    url = f"sqlite:///{tmp_path / 'single.db'}"
+    run(str(tmp_path), database_url=url)
+    assert sharded == _stored(url)
+
+
+@pytest.mark.parametrize(
+    "argv",
+    [
+        ["--shard-index", "0"],
+        ["--shard-index", "3", "--shard-count", "3"],
+        ["--shard-index", "0", "--shard-count", "2", "--load-mode", "upsert"],
+        ["--shard-index", "0", "--shard-count", "2", "--pipeline"],
+    ],
+)
+def test_cli_rejects_bad_shard_options(tmp_path, argv):
+    with pytest.raises(SystemExit):
+        main(["--input", str(tmp_path)] + argv)
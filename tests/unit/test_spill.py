@@ -0,0 +1,70 @@
+import os
+import random
+from pathlib import Path
+
+import pytest
+
+from etl.main import run
+from etl.spill import BYTES_PER_GROUP, SpillingAggregator
+from etl.transform import Aggregator
+
+
+def _rows(n, keys, seed=0):
+    rnd = random.Random(seed)
+    return [
+        {"date": f"k{rnd.randrange(keys)}", "amount": str(rnd.uniform(-1e6, 1e6))}
+        for _ in range(n)
+    ]
+
+
+def test_spilling_matches_in_memory_exactly(tmp_path):
+    rows = _rows(20000, 3000)
+    expected = Aggregator().update(rows).results()
+    agg = SpillingAggregator(
+        memory_budget=BYTES_PER_GROUP * 50, tmp_dir=str(tmp_path), partitions=4
+    )
+    agg.update(rows)
+    assert agg.spilled_rows > 0
+    agg.finish()
+    assert len(agg) == len(expected)
+    assert agg.results() == expected
+    agg.close()
+    assert os.listdir(tmp_path) == []
+
+
+def test_oversized_partitions_are_split_again(tmp_path):
+    rows = _rows(20000, 3000, seed=1)
+    expected = Aggregator().update(rows).results()
+    # 2 partitions of ~1500 groups each against a budget of 50
+    agg = SpillingAggregator(
+        memory_budget=BYTES_PER_GROUP * 50, tmp_dir=str(tmp_path), partitions=2
+    )
+    agg.update(rows)
+    agg.finish()
+    # both partitions, and some of their parts, were split again
+    assert agg.resplits > 2
+    assert len(agg) == len(expected)
+    assert agg.results() == expected
+    agg.close()
+    assert os.listdir(tmp_path) == []
+
+
+def test_no_spill_under_budget(tmp_path):
+    rows = _rows(500, 10) + [{"date": "k1", "amount": "oops"}]
+    agg = SpillingAggregator(tmp_dir=str(tmp_path))
+    agg.update(rows)
+    assert agg.spilled_rows == 0
+    assert agg.results() == Aggregator().update(rows).results()
+    assert os.listdir(tmp_path) == []
+
+
+def test_run_with_memory_budget(tmp_path, caplog):
+    (Path(tmp_path) / "data.csv").write_text(
+        "date,amount\n2025-01-01,1\n2025-01-02,2\n2025-01-03,3\n2025-01-01,4\n",
+        encoding="utf8",
+    )
+    with caplog.at_level("INFO", logger="etl.main"):
+        assert run(str(tmp_path), dry_run=True, memory_budget=BYTES_PER_GROUP) == 0
+    assert any("Aggregated into 3 groups" in r.getMessage() for r in caplog.records)
+    with pytest.raises(ValueError):
+        run(str(tmp_path), dry_run=True, memory_budget=BYTES_PER_GROUP, workers=2)
@@ -0,0 +1,91 @@
+"""Unit tests keeping short runs from importing what they do not use."""
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+import etl
+
+SRC = str(Path(__file__).resolve().parents[2] / "src")
+# imported by the code paths that connect to a database or start workers
+HEAVY = ("sqlalchemy", "yaml", "psycopg2", "numpy", "multiprocessing")
+
+
+def imported(argv, env=None):
+    """Modules a fresh interpreter imports running argv, per `-X importtime`."""
+    env = dict(os.environ, PYTHONPATH=SRC, **(env or {}))
+    out = subprocess.run(
+        [sys.executable, "-X", "importtime", *argv],
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return {
+        line.rsplit("|", 1)[1].strip()
+        for line in out.stderr.splitlines()
+        if line.startswith("import time:")
+    }
+
+
+def heavy(modules):
+    return sorted(m for m in modules if m.split(".")[0] in HEAVY)
+
+
+@pytest.mark.parametrize(
+    "module",
+    ["etl", "etl.main", "etl.extract", "etl.load", "etl.config", "etl.parallel"],
+)
+def test_importing_skips_heavy_dependencies(module):
+    assert heavy(imported(["-c", f"import {module}"])) == []
+
+
+def test_dry_run_skips_heavy_dependencies(tmp_path):
+    (tmp_path / "a.csv").write_text("date,amount\n2025-01-01,1.5\n", encoding="utf8")
+    # config.yml is only read to connect
+    modules = imported(
+        ["-m", "etl", "--input", str(tmp_path), "--dry-run"], env={"DATABASE_URL": ""}
+    )
+    assert "etl.main" in modules
+    assert heavy(modules) == []
+
+
+def test_dry_run_with_cache_dir_skips_sqlalchemy(tmp_path):
+    (tmp_path / "a.csv").write_text("date,amount\n2025-01-01,1.5\n", encoding="utf8")
+    # the column cache hashes files but keeps no manifest
+    modules = imported(
+        [
+            "-m",
+            "etl",
+            "--input",
+            str(tmp_path),
+            "--dry-run",
+            "--cache-dir",
+            str(tmp_path / "cache"),
+        ],
+        env={"DATABASE_URL": ""},
+    )
+    assert "etl.cache" in modules
+    assert "sqlalchemy" not in modules and "etl.manifest" not in modules
+
+
+def test_loading_still_imports_sqlalchemy(tmp_path):
+    (tmp_path / "a.csv").write_text("date,amount\n2025-01-01,1.5\n", encoding="utf8")
+    url = f"sqlite:///{tmp_path / 'etl.db'}"
+    assert "sqlalchemy" in imported(
+        ["-m", "etl", "--input", str(tmp_path)], env={"DATABASE_URL": url}
+    )
+
+
+def test_package_main_is_resolved_lazily():
+    code = (
+        "import sys, etl; assert 'etl.main' not in sys.modules;"
+        " from etl import main; assert main.__module__ == 'etl.main' and callable(main)"
+    )
+    subprocess.run(
+        [sys.executable, "-c", code], env=dict(os.environ, PYTHONPATH=SRC), check=True
+    )
+    with pytest.raises(AttributeError):
+        etl.missing
@@ -1,5 +1,15 @@
 import pytest
-from etl.transform import normalize_date, aggregate
+from decimal import Decimal
+
+from etl.transform import (
+    normalize_date,
+    aggregate,
+    Aggregator,
+    DateNormalizer,
+    FixedPointAggregator,
+    StatsAggregator,
+    parse_scaled,
+)
 
 
 def test_normalize_date_iso():
@@ -51,7 +61,11 @@ def test_normalize_date_invalid_format():
 
 
 def test_aggregate_simple():
-    rows = [{"date": "2025-01-01", "amount": "1"}, {"date": "2025-01-01", "amount": "2"}, {"date": "2025-01-02", "amount": "3"}]
+    rows = [
+        {"date": "2025-01-01", "amount": "1"},
+        {"date": "2025-01-01", "amount": "2"},
+        {"date": "2025-01-02", "amount": "3"},
+    ]
     out = aggregate(rows)
     d = {r["date"]: r["total_amount"] for r in out}
     assert d["2025-01-01"] == 3.0
@@ -66,7 +80,7 @@ def test_aggregate_custom_fields():
     rows = [
         {"group": "A", "value": "10"},
         {"group": "A", "value": "20"},
-        {"group": "B", "value": "30"}
+        {"group": "B", "value": "30"},
     ]
     out = aggregate(rows, group_by="group", value_field="value")
     d = {r["group"]: r["total_value"] for r in out}
@@ -85,7 +99,7 @@ def test_aggregate_missing_group():
 def test_aggregate_invalid_amount():
     rows = [
         {"date": "2025-01-01", "amount": "invalid"},
-        {"date": "2025-01-01", "amount": "2"}
+        {"date": "2025-01-01", "amount": "2"},
     ]
     out = aggregate(rows)
     d = {r["date"]: r["total_amount"] for r in out}
@@ -93,10 +107,256 @@ def test_aggregate_invalid_amount():
 
 
 def test_aggregate_missing_amount():
-    rows = [
-        {"date": "2025-01-01"},
-        {"date": "2025-01-01", "amount": "2"}
-    ]
+    rows = [{"date": "2025-01-01"}, {"date": "2025-01-01", "amount": "2"}]
     out = aggregate(rows)
     d = {r["date"]: r["total_amount"] for r in out}
     assert d["2025-01-01"] == 2.0
+
+
+def test_aggregator_incremental_matches_aggregate():
+    rows = [
+        {"date": "2025-01-01", "amount": "1.5"},
+        {"date": "2025-01-02", "amount": "2"},
+        {"date": "2025-01-01", "amount": "x"},
+    ]
+    agg = Aggregator()
+    for r in rows:
+        agg.add(r)
+    assert agg.results() == aggregate(rows)
+    assert agg.rows == 2
+    assert len(agg) == 2
+
+
+def test_aggregator_memory_bounded_by_groups():
+    import tracemalloc
+
+    def gen(n):
+        for i in range(n):
+            yield {"date": f"2025-01-0{i % 3 + 1}", "amount": "1"}
+
+    tracemalloc.start()
+    agg = Aggregator().update(gen(50_000))
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert len(agg) == 3
+    assert agg.totals["2025-01-01"] == 16667.0
+    assert peak < 256 * 1024
+
+
+def test_date_normalizer_lock_keeps_format_precedence():
+    """A locked format never changes which format wins."""
+    n = DateNormalizer(cache_size=0)
+    assert n.normalize({"date": "2025/03/04"})["date"] == "2025-03-04"
+    # locked on %Y/%m/%d, but DD/MM still beats MM/DD for ambiguous input
+    assert n.normalize({"date": "01/02/2025"})["date"] == "2025-02-01"
+    assert n.normalize({"date": "12/31/2025"})["date"] == "2025-12-31"
+    assert n.normalize({"date": "05/06/2025"})["date"] == "2025-06-05"
+    assert n.normalize({"date": "2025-01-02T15:30:00"})["date"] == "2025-01-02"
+
+
+def test_date_normalizer_cache_is_bounded():
+    n = DateNormalizer(cache_size=2)
+    for raw in ("2025-01-01", "2025-01-02", "2025-01-03", "2025-01-03"):
+        n.normalize({"date": raw})
+    info = n.parse.cache_info()
+    assert info.currsize == 2
+    assert info.hits == 1
+
+
+def test_date_normalizer_caches_failures():
+    n = DateNormalizer()
+    for _ in range(2):
+        with pytest.raises(ValueError, match="unparseable date"):
+            n.normalize({"date": "invalid-date"})
+    assert n.parse.cache_info().hits == 1
+
+
+STAT_ROWS = [
+    {"date": "2025-01-01", "category": "food", "amount": "10"},
+    {"date": "2025-01-01", "category": "rent", "amount": "-2.5"},
+    {"date": "2025-01-02", "category": "food", "amount": "4"},
+    {"date": "2025-01-01", "category": "food", "amount": "1"},
+    {"date": "2025-01-02", "category": "food", "amount": "oops"},
+]
+
+
+def test_aggregate_multi_metric_single_key():
+    out = aggregate(STAT_ROWS, stats=("sum", "count", "min", "max", "mean"))
+    assert out == [
+        {
+            "date": "2025-01-01",
+            "total_amount": 8.5,
+            "row_count": 3,
+            "min_amount": -2.5,
+            "max_amount": 10.0,
+            "mean_amount": 8.5 / 3,
+        },
+        {
+            "date": "2025-01-02",
+            "total_amount": 4.0,
+            "row_count": 1,
+            "min_amount": 4.0,
+            "max_amount": 4.0,
+            "mean_amount": 4.0,
+        },
+    ]
+
+
+def test_aggregate_composite_key():
+    out = aggregate(STAT_ROWS, group_by=("date", "category"), stats=("sum", "count"))
+    assert out == [
+        {
+            "date": "2025-01-01",
+            "category": "food",
+            "total_amount": 11.0,
+            "row_count": 2,
+        },
+        {
+            "date": "2025-01-01",
+            "category": "rent",
+            "total_amount": -2.5,
+            "row_count": 1,
+        },
+        {"date": "2025-01-02", "category": "food", "total_amount": 4.0, "row_count": 1},
+    ]
+
+
+def test_stats_sums_match_aggregator_and_merge():
+    rows = [{"date": f"d{i % 7}", "amount": str(0.1 * i)} for i in range(200)]
+    plain = Aggregator().update(rows)
+    full = StatsAggregator().update(rows)
+    assert full.totals == plain.totals
+    merged = (
+        StatsAggregator().update(rows[:90]).merge(StatsAggregator().update(rows[90:]))
+    )
+    plain_merged = Aggregator().update(rows[:90]).merge(Aggregator().update(rows[90:]))
+    assert merged.totals == plain_merged.totals
+    assert [
+        (r["row_count"], r["min_amount"], r["max_amount"]) for r in merged.results()
+    ] == [(r["row_count"], r["min_amount"], r["max_amount"]) for r in full.results()]
+
+
+def test_stats_aggregator_rejects_unknown_metric():
+    with pytest.raises(ValueError, match="median"):
+        StatsAggregator(stats=("sum", "median"))
+
+
+@pytest.mark.parametrize(
+    "raw, expected",
+    [
+        ("12.34", (1234, 2)),
+        (" -0.50 ", (-50, 2)),
+        ("+.5", (5, 1)),
+        ("7", (7, 0)),
+        ("1.5e-2", (15, 3)),
+        ("2E3", (2000, 0)),
+        (0, (0, 0)),
+        ("nan", None),
+        ("1.-5", None),
+        (".", None),
+        ("", None),
+        ("0." + "1" * 19, None),
+    ],
+)
+def test_parse_scaled(raw, expected):
+    assert parse_scaled(raw) == expected
+
+
+def test_fixed_point_sums_exactly():
+    rows = [{"date": "d", "amount": "0.1"}] * 10 + [
+        {"date": "d", "amount": "1e-3"},
+        {"date": "e", "amount": "x"},
+    ]
+    agg = FixedPointAggregator().update(rows)
+    assert agg.results() == [{"date": "d", "total_amount": Decimal("1.001")}]
+    assert agg.rows == 11
+    # the float path drifts on the same input
+    tenths = rows[:10]
+    assert Aggregator().update(tenths).results()[0]["total_amount"] != 1.0
+    assert FixedPointAggregator().update(tenths).results()[0]["total_amount"] == 1
+
+
+def test_fixed_point_merge_aligns_scales():
+    a = FixedPointAggregator().update([{"date": "d", "amount": "1.5"}])
+    b = FixedPointAggregator().update(
+        [{"date": "d", "amount": "0.25"}, {"date": "e", "amount": "3"}]
+    )
+    a.merge(b)
+    assert a.decimal_totals() == {"d": Decimal("1.75"), "e": Decimal("3")}
+    assert a.rows == 3
+
+
+def test_fixed_point_add_many_matches_add_value():
+    import random
+
+    rnd = random.Random(7)
+    odd = [
+        "7",
+        "-0.5",
+        "1e3",
+        " 2.50",
+        "3.25 ",
+        "1_0.00",
+        "1.2_5",
+        "x",
+        "",
+        "4.5\n6.75",
+        "12345678901234.56",
+        0,
+    ]
+    chunks = []
+    for _ in range(50):
+        chunk = [
+            (f"k{rnd.randrange(5)}", f"{rnd.randrange(-(10**6), 10**6) / 100:.2f}")
+            for _ in range(200)
+        ]
+        if rnd.random() < 0.5:
+            chunk[rnd.randrange(len(chunk))] = ("k0", rnd.choice(odd))
+        chunks.append(chunk)
+    batched, single = FixedPointAggregator(), FixedPointAggregator()
+    rejected = [batched.add_many(chunk) for chunk in chunks]
+    expected = [
+        [i for i, (key, value) in enumerate(chunk) if not single.add_value(key, value)]
+        for chunk in chunks
+    ]
+    assert batched.results() == single.results()
+    assert batched.rows == single.rows
+    assert rejected == expected and any(expected)
+
+
+@pytest.mark.parametrize(
+    "value",
+    [
+        "1e2.00",
+        "1e5.00",
+        "1E2",
+        "inf",
+        "-inf",
+        "nan",
+        "Infinity",
+        "1.00e1",
+        "0x1.00",
+        "1.0",
+        "1.000",
+        "1..00",
+        ".50",
+        "1.",
+        "--1.00",
+        "1.00-",
+        "१.00",
+        "1 000.00",
+        "+1.00",
+        " 1.00",
+        "1.00\t",
+        "1.00\r",
+        "",
+        "x",
+    ],
+)
+def test_fixed_point_add_many_accepts_what_add_value_accepts(value):
+    pairs = [("d", "1.00"), ("d", value), ("d", "2.50")]
+    batched, single = FixedPointAggregator(), FixedPointAggregator()
+    rejected = batched.add_many(pairs)
+    expected = [i for i, (key, v) in enumerate(pairs) if not single.add_value(key, v)]
+    assert rejected == expected
+    assert batched.decimal_totals() == single.decimal_totals()
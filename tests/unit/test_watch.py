@@ -0,0 +1,125 @@
+"""Unit tests for watch mode."""
+import os
+import signal
+import threading
+
+import pytest
+from sqlalchemy import create_engine, text
+
+from etl.load import ensure_table
+from etl.main import run_watch
+from etl.manifest import ensure_manifest_table
+from etl.watch import Watcher
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'etl.db'}")
+    ensure_table(engine)
+    ensure_manifest_table(engine)
+    return engine
+
+
+def totals(engine):
+    with engine.begin() as conn:
+        return dict(
+            conn.execute(
+                text("SELECT date, total_amount FROM results ORDER BY date")
+            ).all()
+        )
+
+
+def test_poll_loads_new_files_in_micro_batches(tmp_path, engine):
+    data = tmp_path / "data"
+    data.mkdir()
+    for i in range(3):
+        (data / f"{i}.csv").write_text(
+            f"date,amount\n2025-01-0{i + 1},{i + 1}\n", encoding="utf8"
+        )
+    watcher = Watcher(engine, data, max_files=2, settle=0)
+    assert watcher.poll() == (2, 2)
+    assert watcher.poll() == (1, 1)
+    assert watcher.poll() == (0, 0)
+    (data / "3.csv").write_text("date,amount\n2025-01-01,10\n", encoding="utf8")
+    assert watcher.poll() == (1, 1)
+    assert totals(engine) == {"2025-01-01": 11, "2025-01-02": 2, "2025-01-03": 3}
+
+
+def test_poll_skips_files_still_being_written(tmp_path, engine):
+    data = tmp_path / "data"
+    data.mkdir()
+    (data / "a.csv").write_text("date,amount\n2025-01-01,1\n", encoding="utf8")
+    assert Watcher(engine, data, settle=3600).poll() == (0, 0)
+    assert Watcher(engine, data, settle=0).poll() == (1, 1)
+
+
+def test_run_watch_stops_on_sigterm(tmp_path):
+    data = tmp_path / "data"
+    data.mkdir()
+    (data / "a.csv").write_text(
+        "date,amount\n2025-01-01,1\n2025-01-02,2\n", encoding="utf8"
+    )
+    url = f"sqlite:///{tmp_path / 'etl.db'}"
+    timer = threading.Timer(0.5, os.kill, (os.getpid(), signal.SIGTERM))
+    timer.start()
+    try:
+        assert run_watch(str(data), url, interval=0.05, settle=0) == 2
+    finally:
+        timer.cancel()
+    assert signal.getsignal(signal.SIGTERM) is signal.SIG_DFL
+    assert totals(create_engine(url)) == {"2025-01-01": 1, "2025-01-02": 2}
+
+
+def test_run_refuses_unrecorded_totals_at_once(tmp_path, engine):
+    with engine.begin() as conn:
+        conn.execute(
+            text("INSERT INTO results (date, total_amount) VALUES ('2025-01-01', 1)")
+        )
+    with pytest.raises(ValueError, match="does not record"):
+        Watcher(engine, tmp_path, settle=0).run(threading.Event(), interval=0.01)
+
+
+def test_a_failing_file_is_skipped_after_max_attempts(tmp_path, engine, caplog):
+    data = tmp_path / "data"
+    data.mkdir()
+    (data / "0.csv").write_bytes(b"date,amount\n2025-01-01,\xff\n")
+    for i in (1, 2):
+        (data / f"{i}.csv").write_text(
+            f"date,amount\n2025-01-0{i},{i}\n", encoding="utf8"
+        )
+    watcher = Watcher(engine, data, settle=0, max_attempts=2)
+    for _ in range(3):
+        # the whole batch, then 0.csv on its own, twice
+        with pytest.raises(UnicodeDecodeError):
+            watcher.poll()
+    assert "Skipping 0.csv after 2 failed attempts" in caplog.text
+    # the files queued after it are loaded, one at a time
+    assert watcher.poll() == (1, 1)
+    assert watcher.poll() == (1, 1)
+    assert watcher.poll() == (0, 0)
+    assert totals(engine) == {"2025-01-01": 1, "2025-01-02": 2}
+    # fixed, it is loaded again
+    (data / "0.csv").write_text("date,amount\n2025-01-01,3\n", encoding="utf8")
+    assert watcher.poll() == (1, 1)
+    assert totals(engine) == {"2025-01-01": 4, "2025-01-02": 2}
+
+
+def test_run_retries_a_manifest_it_cannot_read(tmp_path, engine, monkeypatch):
+    attempts = []
+    load = Watcher._load_manifest
+
+    def flaky(self):
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise OSError("database is starting up")
+        return load(self)
+
+    monkeypatch.setattr(Watcher, "_load_manifest", flaky)
+    stop = threading.Event()
+    timer = threading.Timer(0.3, stop.set)
+    timer.start()
+    try:
+        assert Watcher(engine, tmp_path, settle=0).run(stop, interval=0.01) == (0, 0)
+    finally:
+        timer.cancel()
+    assert len(attempts) > 1